@@ -0,0 +1,199 @@
+"""
+Benchmark of the stages of the clustering pipeline of GNTClusterer, on the
+books, chapters and verses of the NT, of the OT and of both of them.
+
+The texts are read from the data/sblgnt and data/lxx folders of gnt_core,
+without any database. The wall time of each stage is the best of several
+runs, and its peak memory is the peak of the memory traced by tracemalloc
+during an additional run (the memory allocated by the BLAS and ARPACK
+routines is not traced).
+
+Usage (from the app folder):
+    python benchmarks/benchmark_pipeline.py --output results.json
+    python benchmarks/benchmark_pipeline.py --baseline benchmarks/baseline.json
+    python benchmarks/benchmark_pipeline.py --save-baseline benchmarks/baseline.json
+
+The comparison with the baseline exits with a non zero status if a stage
+got slower (or used more memory) than allowed by the tolerances.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+from loguru import logger
+
+sys.path.extend(str(Path(__file__).resolve().parents[1] / package)
+                for package in ("gnt_core", "gnt_nlp_utils"))
+
+from gnt_core.database_filler import DataBaseFiller  # noqa: E402
+from gnt_nlp_utils import get_stop_words  # noqa: E402
+from gnt_nlp_utils.clusterer import GNTClusterer  # noqa: E402
+
+CORPORA = ("nt", "ot", "all")
+GRANULARITIES = ("books", "chapters", "verses")
+STAGES = ("clean", "tf_idf_vectorizer", "reduce", "clusterize", "projection", "format_results")
+
+
+def load_corpus(corpus: str) -> Dict[str, Tuple[List[str], List[str], List[str]]]:
+    """
+    Load the texts of a corpus (nt, ot or all) from the data folder, as
+    (texts, names, books) for each granularity.
+    """
+    filler = DataBaseFiller()
+    filler.load_json({"nt": ["sblgnt"], "ot": ["lxx"], "all": ["sblgnt", "lxx"]}[corpus])
+    granularities = {"books": ([], [], []), "chapters": ([], [], []), "verses": ([], [], [])}
+    for text in filler.texts:
+        for values, value in zip(granularities["books"], (text["text"], text["book"], text["book"])):
+            values.append(value)
+    for text in filler.texts_chapter:
+        for chapter, content in text["chapters"].items():
+            for values, value in zip(granularities["chapters"],
+                                     (content, f"{chapter}{text['book']}", text["book"])):
+                values.append(value)
+    for text in filler.texts_verses:
+        for chapter, verses in text["verses"].items():
+            for verse, content in verses.items():
+                for values, value in zip(granularities["verses"],
+                                         (content, f"{text['book']}{chapter},{verse}", text["book"])):
+                    values.append(value)
+    return granularities
+
+
+def measure(stage: Callable[[], object], repeat: int = 3, memory: bool = True) -> Tuple[object, Dict[str, float]]:
+    """
+    Measure the best wall time of a stage over repeat runs, and its peak
+    traced memory over an additional run.
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = stage()
+        times.append(time.perf_counter() - start)
+    measures = {"time": min(times)}
+    if memory:
+        tracemalloc.start()
+        stage()
+        measures["peak_memory"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result, measures
+
+
+def benchmark(texts: List[str], names: List[str], books: List[str], n_clusters: int = 10, sparse: bool = True, repeat: int = 3, memory: bool = True) -> Dict[str, Dict[str, float]]:
+    """
+    Benchmark each stage of GNTClusterer.pipeline, the input of each stage
+    being the output of the previous one.
+    """
+    import pandas as pd
+    clusterer = GNTClusterer()
+    stop_words = get_stop_words()
+    stages = {}
+    cleaned_corpus, stages["clean"] = measure(
+        lambda: clusterer.clean(texts, stop_words=stop_words), repeat, memory)
+    vectorized_matrix, stages["tf_idf_vectorizer"] = measure(
+        lambda: clusterer.tf_idf_vectorizer(cleaned_corpus, sparse=sparse), repeat, memory)
+    reduced_matrix, stages["reduce"] = measure(
+        lambda: clusterer.reduce(vectorized_matrix, dimension=15), repeat, memory)
+    clustered_data, stages["clusterize"] = measure(
+        lambda: clusterer.clusterize(reduced_matrix, name=names, n_cluster=n_clusters,
+                                     ground_truth=books), repeat, memory)
+    projection, stages["projection"] = measure(
+        lambda: clusterer.reduce(reduced_matrix, dimension=3), repeat, memory)
+    data_3D = pd.DataFrame(projection, columns=["x", "y", "z"])
+    _, stages["format_results"] = measure(
+        lambda: clusterer.format_results(clustered_data, data_3D, texts), repeat, memory)
+    return stages
+
+
+def compare(results: Dict, baseline: Dict, time_tolerance: float = 0.5, memory_tolerance: float = 0.2, min_time: float = 0.05, min_memory: int = 2 ** 20) -> List[str]:
+    """
+    Compare results with a baseline, a stage regressing if it is both
+    relatively and absolutely slower (or larger) than in the baseline.
+
+    Returns:
+        The description of each regression.
+    """
+    regressions = []
+    for key, result in results["results"].items():
+        if key not in baseline["results"]:
+            continue
+        for stage, measures in result["stages"].items():
+            reference = baseline["results"][key]["stages"].get(stage)
+            if reference is None:
+                continue
+            for measure_name, tolerance, minimum in (("time", time_tolerance, min_time),
+                                                     ("peak_memory", memory_tolerance, min_memory)):
+                if measure_name not in measures or measure_name not in reference:
+                    continue
+                value, reference_value = measures[measure_name], reference[measure_name]
+                if value > reference_value * (1 + tolerance) and value - reference_value > minimum:
+                    regressions.append(f"{key} {stage} {measure_name}: "
+                                       f"{value:.3g} against {reference_value:.3g}")
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpora", nargs="+", choices=CORPORA, default=list(CORPORA))
+    parser.add_argument("--granularities", nargs="+", choices=GRANULARITIES, default=list(GRANULARITIES))
+    parser.add_argument("--repeat", type=int, default=3, help="number of timed runs of each stage")
+    parser.add_argument("--n-clusters", type=int, default=10)
+    parser.add_argument("--dense", action="store_true", help="benchmark the dense pipeline")
+    parser.add_argument("--no-memory", action="store_true", help="do not measure the peak memory")
+    parser.add_argument("--output", help="file to write the results down in")
+    parser.add_argument("--baseline", help="results to compare the current results with")
+    parser.add_argument("--save-baseline", help="file to write the results down in as the new baseline")
+    parser.add_argument("--time-tolerance", type=float, default=0.5,
+                        help="relative increase of the time of a stage considered as a regression")
+    parser.add_argument("--memory-tolerance", type=float, default=0.2,
+                        help="relative increase of the peak memory of a stage considered as a regression")
+    arguments = parser.parse_args()
+    logger.remove()
+    logger.add(sys.stderr, level="INFO", filter=lambda record: record["name"] == "__main__")
+
+    import numpy as np
+    import sklearn
+    results = {"meta": {"python": platform.python_version(),
+                        "numpy": np.__version__,
+                        "sklearn": sklearn.__version__,
+                        "platform": platform.platform(),
+                        "cpu_count": os.cpu_count(),
+                        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                        "sparse": not arguments.dense,
+                        "n_clusters": arguments.n_clusters},
+               "results": {}}
+    for corpus in arguments.corpora:
+        granularities = load_corpus(corpus)
+        for granularity in arguments.granularities:
+            texts, names, books = granularities[granularity]
+            logger.info(f"Benchmarking {corpus} {granularity} ({len(texts)} texts)")
+            stages = benchmark(texts, names, books, n_clusters=arguments.n_clusters,
+                               sparse=not arguments.dense, repeat=arguments.repeat,
+                               memory=not arguments.no_memory)
+            results["results"][f"{corpus}/{granularity}"] = {"n_texts": len(texts), "stages": stages}
+            for stage, measures in stages.items():
+                logger.info(f"    {stage:<20}{measures['time']:>10.3f}s"
+                            + (f"{measures['peak_memory'] / 2 ** 20:>10.1f}MB" if "peak_memory" in measures else ""))
+    for path in (arguments.output, arguments.save_baseline):
+        if path:
+            Path(path).write_text(json.dumps(results, indent=2))
+            logger.info(f"Results written down in {path}")
+    if arguments.baseline:
+        regressions = compare(results, json.loads(Path(arguments.baseline).read_text()),
+                              time_tolerance=arguments.time_tolerance,
+                              memory_tolerance=arguments.memory_tolerance)
+        for regression in regressions:
+            logger.error(f"Regression of {regression}")
+        if regressions:
+            return 1
+        logger.info("No regression against the baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,139 @@
+"""
+Benchmark of the read latency of the storage backends of the corpus, on the
+queries run by the API and by the filler.
+
+The SQLite database is filled from the data/sblgnt and data/lxx folders of
+gnt_core into a temporary file, unless an existing one is given. The mongo
+database is only benchmarked if its URI is given, and must have been filled
+beforehand (its content is never written). The latency of each query is
+the median and the 95th percentile of several runs.
+
+Usage (from the app folder):
+    python benchmarks/benchmark_storage.py --output results.json
+    python benchmarks/benchmark_storage.py --mongo-uri mongodb://localhost:27017
+"""
+import argparse
+import asyncio
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List
+
+from loguru import logger
+
+sys.path.append(str(Path(__file__).resolve().parents[1] / "gnt_core"))
+
+from gnt_core.database_filler import DataBaseFiller  # noqa: E402
+from gnt_core.storage import StorageBackend, create_storage_backend  # noqa: E402
+
+
+async def read_verse_range(storage: StorageBackend) -> List[Dict]:
+    """
+    Read the verses of the Sermon on the Mount.
+    """
+    return [verse async for verse in storage.iter_verse_range("Mt", 5, 7, 3, 29, fields=["name", "text"])]
+
+
+async def read_all_verses(storage: StorageBackend) -> List[Dict]:
+    """
+    Read the verses of all the books, one book at a time.
+    """
+    return [book_data async for book_data in storage.iter_verses()]
+
+
+# Queries benchmarked, by name
+QUERIES: Dict[str, Callable[[StorageBackend], Awaitable]] = {
+    "get_book_lists": lambda storage: storage.get_book_lists(),
+    "get_book_classes": lambda storage: storage.get_book_classes(),
+    "get_book_class": lambda storage: storage.get_book_class(["Mt", "Ro", "Gen", "Odes"]),
+    "get_texts(Mt)": lambda storage: storage.get_texts(["Mt"]),
+    "get_chapters(Mt)": lambda storage: storage.get_chapters(["Mt"]),
+    "get_verses(Mt)": lambda storage: storage.get_verses(["Mt"]),
+    "get_texts": lambda storage: storage.get_texts([]),
+    "iter_verses": read_all_verses,
+    "iter_verse_range(Mt5,3-7,29)": read_verse_range,
+    "get_fill_generation": lambda storage: storage.get_fill_generation(),
+}
+
+
+async def fill_sqlite(sqlite_path: str) -> None:
+    """
+    Fill an SQLite database from the data folder.
+    """
+    filler = DataBaseFiller(storage_backend="sqlite", sqlite_path=sqlite_path)
+    await filler.main()
+    await filler.database_instance.close()
+
+
+async def benchmark(storage: StorageBackend, repeat: int = 20) -> Dict[str, Dict[str, float]]:
+    """
+    Measure the median and 95th percentile latency (in seconds) of each query.
+    """
+    await storage.connect()
+    results = {}
+    try:
+        for name, query in QUERIES.items():
+            # Warm up the caches of the storage
+            await query(storage)
+            times = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                await query(storage)
+                times.append(time.perf_counter() - start)
+            times.sort()
+            results[name] = {"median": times[len(times) // 2],
+                             "p95": times[min(int(len(times) * 0.95), len(times) - 1)]}
+    finally:
+        await storage.close()
+    return results
+
+
+async def run(arguments: argparse.Namespace) -> Dict:
+    results = {"meta": {"python": sys.version.split()[0],
+                        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                        "repeat": arguments.repeat},
+               "results": {}}
+    with tempfile.TemporaryDirectory() as folder:
+        sqlite_path = arguments.sqlite_path
+        if sqlite_path is None:
+            sqlite_path = str(Path(folder) / "gnt.sqlite")
+            logger.info(f"Filling SQLite database {sqlite_path}")
+            await fill_sqlite(sqlite_path)
+        storages = {"sqlite": create_storage_backend("sqlite", sqlite_path)}
+        if arguments.mongo_uri:
+            storages["mongodb"] = create_storage_backend(
+                "mongodb", mongo_uri=arguments.mongo_uri, mongo_database=arguments.mongo_database)
+        for backend, storage in storages.items():
+            logger.info(f"Benchmarking {backend}")
+            results["results"][backend] = await benchmark(storage, arguments.repeat)
+    return results
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=20, help="number of timed runs of each query")
+    parser.add_argument("--sqlite-path", help="filled SQLite database to read from")
+    parser.add_argument("--mongo-uri", help="URI of a filled mongo database to read from")
+    parser.add_argument("--mongo-database", default="gnt")
+    parser.add_argument("--output", help="file to write the results down in")
+    arguments = parser.parse_args()
+    logger.remove()
+    logger.add(sys.stderr, level="INFO", filter=lambda record: record["name"] == "__main__")
+
+    results = asyncio.get_event_loop().run_until_complete(run(arguments))
+    backends = list(results["results"])
+    logger.info(f"{'query':<30}" + "".join(f"{backend:>24}" for backend in backends))
+    for query in QUERIES:
+        logger.info(f"{query:<30}" + "".join(
+            f"{results['results'][backend][query]['median'] * 1000:>10.2f}ms"
+            f"{results['results'][backend][query]['p95'] * 1000:>10.2f}ms" for backend in backends))
+    if arguments.output:
+        Path(arguments.output).write_text(json.dumps(results, indent=2))
+        logger.info(f"Results written down in {arguments.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,328 @@
+"""
+Python module containing the cache of the results of the clustering endpoints.
+"""
+import json
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Set
+
+
+def value_size(value: Any) -> int:
+    """
+    Get the number of bytes taken up by a cached value: the length of the
+    encoded results, the size of the arrays of the objects holding some
+    (see ClusteringState and ClusteringTree), or the size of the object.
+    """
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(value_size(item) for item in value.values())
+    if hasattr(value, "nbytes"):
+        return value.nbytes
+    return sys.getsizeof(value)
+
+
+class CacheBackend:
+    """
+    Parent class of the storages of the cached results, evicting the least
+    recently used entries once the stored values take up more than
+    max_bytes bytes.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 2 ** 20) -> None:
+        self.max_bytes = max_bytes
+
+    def get(self, key: str) -> Optional[Any]:
+        """
+        Get the value stored under key, None if it is missing or expired.
+        """
+        raise NotImplementedError
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        """
+        Store the value under key, for ttl seconds if ttl is not None.
+        """
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        """
+        Remove all of the stored values.
+        """
+        raise NotImplementedError
+
+    def keys(self) -> List[str]:
+        """
+        Get the keys of the stored values.
+        """
+        raise NotImplementedError
+
+    def delete(self, keys: Iterable[str]) -> None:
+        """
+        Remove the values stored under keys.
+        """
+        raise NotImplementedError
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Number of bytes taken up by the stored values.
+        """
+        raise NotImplementedError
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+
+class MemoryBackend(CacheBackend):
+    """
+    Storage of the cached results in the memory of the current process, the
+    size of the values being measured by value_size.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 2 ** 20) -> None:
+        super().__init__(max_bytes)
+        self.entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self.stored_bytes = 0
+        self.lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self.lock:
+            try:
+                expires, value, _ = self.entries[key]
+            except KeyError:
+                return None
+            if expires is not None and expires < time.time():
+                self.pop(key)
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def pop(self, key: str) -> None:
+        """
+        Remove the value stored under key, if any, the lock being held.
+        """
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.stored_bytes -= entry[2]
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        expires = time.time() + ttl if ttl is not None else None
+        size = value_size(value)
+        with self.lock:
+            self.pop(key)
+            self.entries[key] = (expires, value, size)
+            self.stored_bytes += size
+            while self.stored_bytes > self.max_bytes:
+                self.pop(next(iter(self.entries)))
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+            self.stored_bytes = 0
+
+    def keys(self) -> List[str]:
+        with self.lock:
+            return list(self.entries)
+
+    def delete(self, keys: Iterable[str]) -> None:
+        with self.lock:
+            for key in keys:
+                self.pop(key)
+
+    @property
+    def nbytes(self) -> int:
+        return self.stored_bytes
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+
+class DiskBackend(CacheBackend):
+    """
+    Storage of the cached results in a SQLite file, so that it can be shared
+    by all of the workers of the API. Only bytes are stored, the results
+    being encoded by the workers already, so that nothing is ever unpickled
+    out of the file.
+    """
+
+    def __init__(self, path: str, max_bytes: int = 64 * 2 ** 20) -> None:
+        super().__init__(max_bytes)
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(
+            path, timeout=30, check_same_thread=False, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        # Drop the pickled values of the previous versions
+        columns = [row[1] for row in self.connection.execute("PRAGMA table_info(cache)")]
+        if columns and "size" not in columns:
+            self.connection.execute("DROP TABLE cache")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS cache "
+            "(key TEXT PRIMARY KEY, value BLOB, size INTEGER, expires REAL, accessed REAL)")
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)")
+        self.lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT value, expires FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            value, expires = row
+            if expires is not None and expires < time.time():
+                self.connection.execute(
+                    "DELETE FROM cache WHERE key = ?", (key,))
+                return None
+            self.connection.execute(
+                "UPDATE cache SET accessed = ? WHERE key = ?", (time.time(), key))
+        return value
+
+    def set(self, key: str, value: bytes, ttl: Optional[float] = None) -> None:
+        """
+        Store the value under key, for ttl seconds if ttl is not None.
+
+        Raises:
+            TypeError: If the value is not bytes.
+        """
+        if not isinstance(value, bytes):
+            raise TypeError(f"Only bytes can be cached on disk, not {type(value).__name__}")
+        now = time.time()
+        expires = now + ttl if ttl is not None else None
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value), expires, now))
+            # Evict the least recently used values past max_bytes
+            self.connection.execute(
+                "DELETE FROM cache WHERE key IN (SELECT key FROM "
+                "(SELECT key, SUM(size) OVER (ORDER BY accessed DESC, rowid DESC "
+                "ROWS BETWEEN UNBOUNDED PRECEDING AND CURRENT ROW) AS total FROM cache) "
+                "WHERE total > ?)", (self.max_bytes,))
+
+    def clear(self) -> None:
+        with self.lock:
+            self.connection.execute("DELETE FROM cache")
+
+    def keys(self) -> List[str]:
+        with self.lock:
+            return [key for key, in self.connection.execute("SELECT key FROM cache")]
+
+    def delete(self, keys: Iterable[str]) -> None:
+        with self.lock:
+            self.connection.executemany("DELETE FROM cache WHERE key = ?", [(key,) for key in keys])
+
+    @property
+    def nbytes(self) -> int:
+        with self.lock:
+            return self.connection.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+
+    def __len__(self) -> int:
+        with self.lock:
+            return self.connection.execute(
+                "SELECT COUNT(*) FROM cache").fetchone()[0]
+
+
+def invalidate_books(backend: CacheBackend, books: Optional[Set[str]]) -> int:
+    """
+    Remove the values of a backend keyed by ClusteringCache.make_key whose
+    books include one of books, or all of the books, every value if books
+    is None.
+
+    Returns:
+        int: The number of removed values.
+    """
+    if books is None:
+        count = len(backend)
+        backend.clear()
+        return count
+    keys = []
+    for key in backend.keys():
+        try:
+            key_books = json.loads(key)["books"]
+        except (ValueError, KeyError, TypeError):
+            continue
+        if not key_books or books.intersection(key_books):
+            keys.append(key)
+    backend.delete(keys)
+    return len(keys)
+
+
+class ClusteringCache:
+    """
+    Cache of the results of the clustering endpoints, keyed by the
+    granularity of the clustering, the set of books and the parameters of
+    the pipeline.
+    """
+
+    def __init__(self, backend: CacheBackend, ttl: Optional[float] = None) -> None:
+        """
+        Initializes an object of class ClusteringCache.
+
+        Args:
+            backend (CacheBackend): Storage of the results.
+            ttl (float): Number of seconds a result is kept for, forever if None.
+        """
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(granularity: str, books: List[str], parameters: Dict[str, Hashable] = None) -> str:
+        """
+        Build the key of a clustering request, the order and duplicates
+        of the books not mattering.
+        """
+        return json.dumps({"granularity": granularity,
+                           "books": sorted(set(books)),
+                           "parameters": parameters or {}},
+                          sort_keys=True, ensure_ascii=False)
+
+    def get(self, key: str) -> Optional[bytes]:
+        """
+        Get the result stored under key, None if it is not cached.
+        """
+        value = self.backend.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key: str, value: bytes) -> None:
+        """
+        Store the result under key, as encoded by the workers.
+        """
+        self.backend.set(key, value, ttl=self.ttl)
+
+    def clear(self) -> None:
+        """
+        Remove all of the cached results.
+        """
+        self.backend.clear()
+
+    def invalidate(self, books: Optional[Set[str]]) -> int:
+        """
+        Remove the cached results of the clusterings of books, all of them
+        if books is None. The idf of a clustering is computed over its books
+        only, so that the results of the other books are left untouched.
+
+        Returns:
+            int: The number of removed results.
+        """
+        return invalidate_books(self.backend, books)
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Get the hit and miss counters of the cache.
+        """
+        return {"hits": self.hits,
+                "misses": self.misses,
+                "size": len(self.backend),
+                "bytes": self.backend.nbytes,
+                "max_bytes": self.backend.max_bytes}
@@ -1,3 +1,4 @@
+from typing import Optional
 from pydantic import BaseSettings
 
 
@@ -15,6 +16,10 @@ class GNTConfig(BaseSettings):
     mongodb_port: int = 27017
     # Name of the mongo database
     mongodb_database: str = "gnt"
+    # Storage of the corpus ("mongodb" or "sqlite")
+    storage_backend: str = "mongodb"
+    # Path of the SQLite database file, when the corpus is stored in SQLite
+    sqlite_path: str = "gnt.sqlite"
     # Host of API
     api_host: str = "localhost"
     # Port of the API
@@ -23,5 +28,58 @@ class GNTConfig(BaseSettings):
     mongodb_password: str = None
     # Mongodb user
     mongodb_user: str = None
+    # Folder where the precomputed data of the corpus is written down
+    cache_folder: str = ".gnt_cache"
+    # Path of the corpus compiled by the filler (see gnt_core.artifact),
+    # memory-mapped by the API and its workers rather than read from the
+    # database, as long as it matches the last fill of the database
+    corpus_artifact: Optional[str] = None
+    # Storage of the cached clustering results ("memory" or "disk")
+    cache_backend: str = "memory"
+    # Maximum number of bytes taken up by the cached clustering results
+    cache_max_bytes: int = 256 * 2 ** 20
+    # Number of seconds a clustering result is cached for (forever if not set)
+    cache_ttl: Optional[float] = None
+    # Number of verses above which the verses are clustered chunk by chunk
+    streaming_threshold: int = 20000
+    # Number of verses processed at once when clustering chunk by chunk
+    streaming_batch_size: int = 1000
+    # Number of processes running the clustering jobs (0 to run them in a thread)
+    workers: int = 2
+    # Number of seconds after which a clustering job is given up
+    job_timeout: Optional[float] = 600
+    # Number of finished asynchronous clustering jobs kept along with their results
+    max_completed_jobs: int = 100
+    # Maximum number of bytes taken up by the clustering sessions kept to
+    # warm-start the clustering of a slightly changed selection of books,
+    # and their lifetime (in seconds)
+    session_cache_max_bytes: int = 256 * 2 ** 20
+    session_ttl: Optional[float] = 3600
+    # Minimum overlap (Jaccard index of the clustered rows) with the previous
+    # run of a session to warm-start a clustering from it
+    warm_start_min_overlap: float = 0.8
+    # Largest number of clusters tried when it is selected automatically
+    auto_k_max_clusters: int = 20
+    # Score of the numbers of clusters tried ("silhouette" or "calinski_harabasz")
+    auto_k_metric: str = "silhouette"
+    # Number of numbers of clusters evaluated in parallel (all of the cores if -1)
+    auto_k_jobs: int = -1
+    # Number of numbers of clusters without improvement after which the selection stops
+    auto_k_patience: int = 3
+    # Whether to time the database calls and the clustering stages, exporting
+    # them on /metrics and in the Server-Timing header of the responses
+    metrics_enabled: bool = False
+    # Number of rows of the similarity index scored at once by a search
+    similarity_block_size: int = 8192
+    # Maximum number of bytes taken up by the linkage trees of the
+    # hierarchical clustering kept to be cut again
+    linkage_cache_max_bytes: int = 128 * 2 ** 20
+    # Number of KMeans micro-clusters the verses are grouped into before
+    # their hierarchical clustering
+    hierarchical_max_leaves: int = 1000
+    # Interval (in seconds) between the checks of whether the database was
+    # filled again, the corpus kept in memory being reloaded if so (never
+    # checked if 0)
+    corpus_refresh_interval: float = 30
 
 gnt_config = GNTConfig()
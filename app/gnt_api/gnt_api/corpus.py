@@ -0,0 +1,200 @@
+"""
+Python module to build the tokenized corpus and the corpus matrices used by
+the clustering endpoints from the content of the database.
+"""
+import asyncio
+import json
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+from loguru import logger
+from gnt_api.cache import invalidate_books
+from gnt_api.config import gnt_config
+from gnt_api.instances import clustering_cache, clustering_executor, clustering_sessions, corpus_matrices, database_instance, gnt_clusterer, linkage_trees, pairwise_similarities, similarity_indexes
+from gnt_api.workers import artifact_corpus_matrices, artifact_tokenized_corpus
+from gnt_core.artifact import CorpusArtifact, open_artifact
+from gnt_core.storage import StorageBackend, changed_books
+from gnt_nlp_utils.matrices import CorpusMatrices
+from gnt_nlp_utils.similarity import PairwiseSimilarity, SimilarityIndexes
+from gnt_nlp_utils.tokens import TokenizedCorpus
+
+
+def iter_verse_records(texts: List[Dict]) -> Iterator[Tuple[str, str, str, str]]:
+    """
+    Iterate over the verses fetched from the database as tuples of
+    (book, chapter, verse, text).
+    """
+    for book_data in texts:
+        for chapter_nbr, chapter_content in book_data["verses"].items():
+            for verse_nbr, verse_content in chapter_content.items():
+                yield book_data["book"], chapter_nbr, verse_nbr, verse_content
+
+
+async def build_tokenized_corpus(database: StorageBackend) -> TokenizedCorpus:
+    """
+    Tokenize the verses stored in the database, the books and chapters
+    being made of their verses.
+    """
+    return TokenizedCorpus.from_verses(
+        iter_verse_records(await database.get_verses([])))
+
+
+# Granularities whose pairwise similarity matrix is precomputed
+PAIRWISE_GRANULARITIES = ("books", "chapters")
+
+
+def corpus_folder() -> Path:
+    """
+    Get the folder the tokenized corpus is written down in.
+    """
+    return Path(gnt_config.cache_folder) / "corpus"
+
+
+def read_corpus_manifest() -> List[Dict]:
+    """
+    Get the manifest of the fill of the database the tokenized corpus was
+    built from, empty if it is unknown.
+    """
+    path = corpus_folder() / "manifest.json"
+    return json.loads(path.read_text(encoding="utf8")) if path.exists() else []
+
+
+def invalidate_results(stale_books: Optional[Set[str]]) -> None:
+    """
+    Remove the cached results and linkage trees of the books filled again
+    (all of them if these books are unknown), along with the clustering
+    sessions, whose states refer to the rows of the previous corpus.
+    """
+    removed = clustering_cache.invalidate(stale_books)
+    invalidate_books(linkage_trees, stale_books)
+    clustering_sessions.clear()
+    logger.info(f"Removed {removed} cached results of the books "
+                f"{', '.join(sorted(stale_books)) if stale_books is not None else 'of the previous corpus'}")
+
+
+async def build_corpus_folder(manifest: List[Dict], artifact: CorpusArtifact = None) -> TokenizedCorpus:
+    """
+    Build the tokenized corpus from the database, or from the compiled corpus
+    if it is given, into the corpus folder, along with the manifest of the
+    fill of the database, and remove the cached results of the books filled
+    again since the previous build, see invalidate_results.
+    """
+    stale_books = changed_books(read_corpus_manifest(), manifest)
+    corpus = (artifact_tokenized_corpus(artifact) if artifact is not None
+              else await build_tokenized_corpus(database_instance))
+    corpus.save(corpus_folder())
+    (corpus_folder() / "manifest.json").write_text(json.dumps(manifest), encoding="utf8")
+    invalidate_results(stale_books)
+    return corpus
+
+
+def similarity_folder() -> Path:
+    """
+    Get the folder the pairwise similarity matrices are written down in.
+    """
+    return Path(gnt_config.cache_folder) / "similarity"
+
+
+def compute_pairwise_similarities(indexes: SimilarityIndexes) -> Dict[str, PairwiseSimilarity]:
+    """
+    Compute the pairwise similarity matrices of the indexes into the similarity folder.
+    """
+    similarities = {}
+    for granularity in PAIRWISE_GRANULARITIES:
+        similarities[granularity] = PairwiseSimilarity.compute(
+            indexes[granularity], similarity_folder(), granularity)
+        logger.info(f"Computed the similarity of {len(indexes[granularity])} {granularity}")
+    return similarities
+
+
+def load_pairwise_similarities(indexes: SimilarityIndexes, recompute: bool = False) -> Dict[str, PairwiseSimilarity]:
+    """
+    Memory-map the pairwise similarity matrices of the indexes, computing
+    them again if they are missing or do not match the corpus, or if
+    recompute is set.
+    """
+    similarities = {}
+    for granularity in PAIRWISE_GRANULARITIES:
+        similarity = None if recompute else PairwiseSimilarity.load(similarity_folder(), granularity)
+        if similarity is None or not similarity.matches(indexes[granularity]):
+            logger.info(f"Computing the similarity of the {granularity}")
+            similarity = PairwiseSimilarity.compute(
+                indexes[granularity], similarity_folder(), granularity)
+        similarities[granularity] = similarity
+    return similarities
+
+
+async def load_corpus_matrices(refilled: bool = False) -> Optional[CorpusArtifact]:
+    """
+    Load the tokenized corpus from the cache folder and compute its matrices
+    and similarity indexes into the API instances, building it from the
+    database if it was not built yet or if books were filled again since it
+    was built. The matrices are rather mapped from the compiled corpus if
+    it matches the last fill of the database. The pairwise
+    similarity matrices are memory-mapped from the similarity folder,
+    computed again along with the corpus as the idf of the similarity
+    indexes spans all of the books.
+
+    Args:
+        refilled (bool): Whether the database was filled again since the
+            matrices were loaded, the corpus being built again then unless
+            the manifests of both fills are known and the same.
+
+    Returns:
+        CorpusArtifact: The compiled corpus the matrices were computed
+            from, None if they were computed from the cache folder.
+    """
+    folder = corpus_folder()
+    manifest = await database_instance.get_manifest()
+    artifact = open_artifact(gnt_config.corpus_artifact, manifest)
+    rebuilt = (artifact is None and not TokenizedCorpus.exists(folder)) or (
+        (bool(manifest) or refilled) and changed_books(read_corpus_manifest(), manifest) != set())
+    if rebuilt:
+        logger.info(f"Building tokenized corpus from the {'database' if artifact is None else 'compiled corpus'}")
+        await build_corpus_folder(manifest, artifact)
+    corpus_matrices.update(CorpusMatrices.from_tokenized_corpus(TokenizedCorpus.load(folder)) if artifact is None
+                           else artifact_corpus_matrices(artifact))
+    logger.info(f"Loaded corpus matrices from {folder if artifact is None else artifact.path}")
+    similarity_indexes.update(SimilarityIndexes.from_corpus_matrices(
+        corpus_matrices, block_size=gnt_config.similarity_block_size))
+    logger.info("Built similarity indexes")
+    pairwise_similarities.update(load_pairwise_similarities(similarity_indexes, recompute=rebuilt))
+    return artifact
+
+
+async def reload_corpus() -> None:
+    """
+    Load the matrices, the similarity indexes and the pairwise similarities
+    of the corpus again once the database was filled again, restart the
+    clustering workers on them and remove the results of the books filled
+    again, unless no book changed since the corpus was built.
+    """
+    stale_books = changed_books(read_corpus_manifest(), await database_instance.get_manifest())
+    if stale_books == set():
+        logger.info("No book was filled again, keeping the corpus matrices")
+        return
+    artifact = await load_corpus_matrices(refilled=True)
+    await clustering_executor.restart(str(corpus_folder()),
+                                      random_state=gnt_clusterer.random_state,
+                                      matrices=corpus_matrices,
+                                      artifact_path=str(artifact.path) if artifact is not None else None)
+    # The previous workers may have cached results of the books meanwhile
+    invalidate_results(stale_books)
+    logger.info("Reloaded the corpus matrices")
+
+
+async def build() -> None:
+    """
+    Build the tokenized corpus from the database and write it down in
+    the cache folder, along with the pairwise similarity matrices.
+    """
+    await database_instance.connect()
+    manifest = await database_instance.get_manifest()
+    corpus = await build_corpus_folder(manifest, open_artifact(gnt_config.corpus_artifact, manifest))
+    logger.info("Successfully wrote tokenized corpus")
+    compute_pairwise_similarities(SimilarityIndexes.from_corpus_matrices(
+        CorpusMatrices.from_tokenized_corpus(corpus)))
+    await database_instance.close()
+
+
+if __name__ == "__main__":
+    asyncio.get_event_loop().run_until_complete(build())
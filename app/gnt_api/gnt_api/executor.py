@@ -0,0 +1,246 @@
+"""
+Python module to run the CPU bound clustering jobs off the event loop of the API.
+"""
+import asyncio
+import multiprocessing
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, List, Optional, Tuple
+from fastapi import HTTPException, Request
+from loguru import logger
+from gnt_api import metrics
+from gnt_api.workers import initialize_worker, measured_job, warm_up
+from gnt_nlp_utils.matrices import CorpusMatrices
+
+
+class ClusteringExecutor:
+    """
+    Class to run the clustering jobs in worker processes, each of them having
+    loaded sklearn and the corpus once. Each worker process is a pool of its
+    own, the jobs being sent to the idle ones, so that a job given up while
+    it runs is stopped by replacing its worker. If no worker process is
+    requested, the jobs are run in a thread of the API process instead.
+    """
+
+    def __init__(self, workers: int = 2, timeout: Optional[float] = None, disconnection_poll: float = 0.5, measured: bool = False) -> None:
+        """
+        Initializes an object of class ClusteringExecutor.
+
+        Args:
+            workers (int): Number of worker processes.
+            timeout (float): Number of seconds after which a job is given up.
+            disconnection_poll (float): Number of seconds between two checks of
+                the disconnection of the client waiting for a job.
+            measured (bool): Whether to time the stages of the jobs, see
+                gnt_api.metrics.observe_job.
+        """
+        self.workers = workers
+        self.timeout = timeout
+        self.disconnection_poll = disconnection_poll
+        self.measured = measured
+        self.running = 0
+        self.replaced = 0
+        self.pools: List[Executor] = []
+        self.idle: Optional[asyncio.Queue] = None
+        self.initargs: Tuple = ()
+
+    def start(self, corpus_folder: str, random_state: int = 0, matrices: CorpusMatrices = None, artifact_path: str = None) -> None:
+        """
+        Start the worker processes, loading the corpus in each of them. Must
+        be called from the event loop of the API.
+
+        Args:
+            corpus_folder (str): Folder the tokenized corpus was written down in.
+            random_state (int): Seed of the KMeans initialization.
+            matrices (CorpusMatrices): Matrices already loaded by the API
+                process, used when running the jobs in a thread.
+            artifact_path (str): Path of the compiled corpus the workers map
+                rather than loading the tokenized corpus of corpus_folder.
+        """
+        self.idle = asyncio.Queue()
+        self.initargs = (corpus_folder, random_state, None, artifact_path)
+        if self.workers > 0:
+            pools = [self.spawn_worker() for _ in range(self.workers)]
+            # Spawn all of the workers now rather than on the first requests
+            for future in [pool.submit(warm_up) for pool in pools]:
+                future.result()
+            for pool in pools:
+                self.add_pool(pool)
+            logger.info(f"Started {self.workers} clustering workers")
+        else:
+            initialize_worker(corpus_folder, random_state, matrices, artifact_path)
+            self.add_pool(ThreadPoolExecutor(max_workers=1))
+
+    def spawn_worker(self) -> ProcessPoolExecutor:
+        """
+        Create a pool of a single worker process, started on its first job.
+        """
+        return ProcessPoolExecutor(
+            max_workers=1,
+            # Do not fork the threads of the database client
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=initialize_worker,
+            initargs=self.initargs)
+
+    def add_pool(self, pool: Executor) -> None:
+        """
+        Make a started pool available to the jobs.
+        """
+        self.pools.append(pool)
+        self.idle.put_nowait(pool)
+
+    async def restart(self, corpus_folder: str, random_state: int = 0, matrices: CorpusMatrices = None, artifact_path: str = None) -> None:
+        """
+        Start the workers again on another corpus, once the database was
+        filled again. The jobs still running on the previous workers are
+        stopped, as they cluster the previous corpus, and the jobs submitted
+        meanwhile wait for the new workers.
+
+        Args:
+            corpus_folder (str): Folder the tokenized corpus was written down in.
+            random_state (int): Seed of the KMeans initialization.
+            matrices (CorpusMatrices): Matrices already loaded by the API
+                process, used when running the jobs in a thread.
+            artifact_path (str): Path of the compiled corpus the workers map
+                rather than loading the tokenized corpus of corpus_folder.
+        """
+        self.initargs = (corpus_folder, random_state, None, artifact_path)
+        stopped, self.pools = self.pools, []
+        for pool in stopped:
+            self.stop_pool(pool)
+        if self.workers > 0:
+            await asyncio.gather(*[self.start_worker() for _ in range(self.workers)])
+            logger.info(f"Restarted {self.workers} clustering workers")
+        else:
+            initialize_worker(corpus_folder, random_state, matrices, artifact_path)
+            self.add_pool(ThreadPoolExecutor(max_workers=1))
+
+    def shutdown(self) -> None:
+        """
+        Stop the workers. As the jobs are only sent to idle workers, none of
+        them is left pending.
+        """
+        for pool in self.pools:
+            self.stop_pool(pool)
+        self.pools = []
+        self.idle = None
+
+    @staticmethod
+    def stop_pool(pool: Executor) -> None:
+        """
+        Stop a pool, killing its worker process if it has one. A thread is
+        left to finish its job.
+        """
+        # The pool has no way to interrupt a running job
+        processes = getattr(pool, "_processes", None) or {}
+        for process in list(processes.values()):
+            process.terminate()
+        pool.shutdown(wait=False)
+
+    def replace_worker(self, pool: ProcessPoolExecutor) -> None:
+        """
+        Kill the worker process of pool, and start another one in its place
+        in the background.
+        """
+        self.stop_pool(pool)
+        if pool in self.pools:
+            self.pools.remove(pool)
+            self.replaced += 1
+            asyncio.ensure_future(self.start_worker())
+            logger.info("Replacing a clustering worker")
+
+    async def start_worker(self) -> None:
+        """
+        Start a worker process and make it available to the jobs once it
+        has loaded the corpus, unless the executor was shut down or
+        restarted meanwhile.
+        """
+        idle, initargs = self.idle, self.initargs
+        pool = self.spawn_worker()
+        await asyncio.wrap_future(pool.submit(warm_up))
+        if self.idle is not idle or self.initargs is not initargs:
+            # The executor was shut down or restarted on another corpus meanwhile
+            pool.shutdown(wait=False)
+            return
+        self.add_pool(pool)
+
+    async def wait_disconnection(self, request: Request) -> None:
+        """
+        Return once the client of the request has disconnected.
+        """
+        while not await request.is_disconnected():
+            await asyncio.sleep(self.disconnection_poll)
+
+    async def dispatch(self, function: Callable, args: Tuple, on_start: Optional[Callable[[], None]] = None) -> Any:
+        """
+        Run a job in the first idle worker. If the job is cancelled while it
+        runs, its worker process is replaced, or left to finish the job if it
+        is a thread.
+        """
+        idle = self.idle
+        pool = await idle.get()
+        while pool not in self.pools:
+            # Skip the workers stopped by a restart while they were idle
+            pool = await idle.get()
+        if on_start is not None:
+            on_start()
+        if self.measured:
+            future = pool.submit(measured_job, function, *args)
+        else:
+            future = pool.submit(function, *args)
+        try:
+            result = await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            if isinstance(pool, ProcessPoolExecutor) and not future.cancelled():
+                self.replace_worker(pool)
+            else:
+                loop = asyncio.get_event_loop()
+                future.add_done_callback(lambda _: loop.call_soon_threadsafe(idle.put_nowait, pool))
+            raise
+        except BrokenProcessPool:
+            if pool not in self.pools:
+                raise HTTPException(status_code=503, detail="The corpus was reloaded during the clustering")
+            # The worker process died, e.g. killed for lack of memory
+            self.replace_worker(pool)
+            raise
+        idle.put_nowait(pool)
+        return result
+
+    async def run(self, function: Callable, *args, request: Request = None, on_start: Callable[[], None] = None) -> Any:
+        """
+        Run a job of the module gnt_api.workers without blocking the event loop.
+        The job is stopped if it times out or if the client of the request
+        disconnects, by killing the worker process running it: a job run in
+        a thread cannot be interrupted, its result is then dropped.
+
+        Args:
+            function (callable): The job to run.
+            args: The arguments of the job.
+            request (Request): The request waiting for the result of the job.
+            on_start (callable): Function called once a worker picks up the job.
+        """
+        start = time.perf_counter()
+        job = asyncio.ensure_future(self.dispatch(function, args, on_start))
+        waiters = {job}
+        if request is not None:
+            waiters.add(asyncio.ensure_future(self.wait_disconnection(request)))
+        self.running += 1
+        try:
+            done, pending = await asyncio.wait(
+                waiters, timeout=self.timeout, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            self.running -= 1
+        for waiter in pending:
+            waiter.cancel()
+        if job in done:
+            if not self.measured:
+                return job.result()
+            result, measures = job.result()
+            metrics.observe_job(measures, time.perf_counter() - start)
+            return result
+        if done:
+            logger.info(f"Client disconnected, cancelled job {function.__name__}")
+            raise HTTPException(status_code=499, detail="Client disconnected")
+        logger.warning(f"Job {function.__name__} timed out")
+        raise HTTPException(status_code=504, detail="Clustering timed out")
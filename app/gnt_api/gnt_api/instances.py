@@ -1,8 +1,19 @@
+from pathlib import Path
+from typing import Dict
+from gnt_api.cache import ClusteringCache, DiskBackend, MemoryBackend
 from gnt_api.config import gnt_config
-from gnt_core.database import MongoConnector
+from gnt_api.executor import ClusteringExecutor
+from gnt_api.jobs import JobManager
+from gnt_api.metrics import instrument_database, registry
+from gnt_api.store import CorpusStore
+from gnt_core.storage import create_storage_backend
 from gnt_nlp_utils.clusterer import GNTClusterer
+from gnt_nlp_utils.matrices import CorpusMatrices
+from gnt_nlp_utils.similarity import PairwiseSimilarity, SimilarityIndexes
 
-database_instance = MongoConnector(
+database_instance = create_storage_backend(
+    gnt_config.storage_backend,
+    gnt_config.sqlite_path,
     mongo_uri=gnt_config.mongodb_uri,
     mongo_database=gnt_config.mongodb_database,
     mongo_host=gnt_config.mongodb_host,
@@ -10,4 +21,68 @@ database_instance = MongoConnector(
     mongo_user=gnt_config.mongodb_user,
     mongo_password=gnt_config.mongodb_password)
 
-gnt_clusterer = GNTClusterer()
+if gnt_config.metrics_enabled:
+    instrument_database(database_instance, [
+        "get_book_lists", "get_book_classes", "get_book_classes_nt", "get_book_classes_ot",
+        "get_book_class", "get_texts", "get_chapters", "get_verses", "get_fill_generation"])
+
+# Content of the database, kept in memory to serve the texts and book classes
+corpus_store = CorpusStore(artifact_path=gnt_config.corpus_artifact)
+
+gnt_clusterer = GNTClusterer(
+    max_clusters=gnt_config.auto_k_max_clusters,
+    metric=gnt_config.auto_k_metric,
+    n_jobs=gnt_config.auto_k_jobs,
+    patience=gnt_config.auto_k_patience)
+
+corpus_matrices = CorpusMatrices()
+
+similarity_indexes = SimilarityIndexes()
+
+# Precomputed similarity of every pair of books and of chapters
+pairwise_similarities: Dict[str, PairwiseSimilarity] = {}
+
+if gnt_config.cache_backend == "disk":
+    cache_backend = DiskBackend(
+        str(Path(gnt_config.cache_folder) / "results.sqlite"),
+        max_bytes=gnt_config.cache_max_bytes)
+else:
+    cache_backend = MemoryBackend(max_bytes=gnt_config.cache_max_bytes)
+
+clustering_cache = ClusteringCache(cache_backend, ttl=gnt_config.cache_ttl)
+
+clustering_executor = ClusteringExecutor(
+    workers=gnt_config.workers, timeout=gnt_config.job_timeout,
+    measured=gnt_config.metrics_enabled)
+
+job_manager = JobManager(max_completed=gnt_config.max_completed_jobs)
+
+clustering_sessions = MemoryBackend(max_bytes=gnt_config.session_cache_max_bytes)
+
+linkage_trees = MemoryBackend(max_bytes=gnt_config.linkage_cache_max_bytes)
+
+# State of the cache and of the queues, read on each scrape of /metrics
+registry.counter("gnt_cache_hits_total", "Number of clustering results found in the cache",
+                 function=lambda: clustering_cache.hits)
+registry.counter("gnt_cache_misses_total", "Number of clustering results missing from the cache",
+                 function=lambda: clustering_cache.misses)
+registry.gauge("gnt_cache_entries", "Number of cached clustering results",
+               function=lambda: len(clustering_cache.backend))
+registry.gauge("gnt_cache_bytes", "Number of bytes taken up by the cached clustering results",
+               function=lambda: clustering_cache.backend.nbytes)
+registry.counter("gnt_corpus_reloads_total", "Number of loads of the content of the database in memory",
+                 function=lambda: corpus_store.reloads)
+registry.gauge("gnt_sessions", "Number of clustering sessions kept",
+               function=lambda: len(clustering_sessions))
+registry.gauge("gnt_linkage_trees", "Number of linkage trees of the hierarchical clustering kept",
+               function=lambda: len(linkage_trees))
+registry.gauge("gnt_executor_running_jobs", "Number of clustering jobs waited for by the API",
+               function=lambda: clustering_executor.running)
+registry.counter("gnt_executor_replaced_workers_total", "Number of clustering workers killed to stop a job given up",
+                 function=lambda: clustering_executor.replaced)
+registry.gauge("gnt_jobs_queue_depth", "Number of asynchronous clustering jobs running",
+               function=lambda: len(job_manager.in_flight))
+registry.counter("gnt_jobs_submitted_total", "Number of asynchronous clustering jobs submitted",
+                 function=lambda: job_manager.submitted)
+registry.counter("gnt_jobs_coalesced_total", "Number of asynchronous clustering jobs coalesced with a running one",
+                 function=lambda: job_manager.coalesced)
@@ -0,0 +1,147 @@
+"""
+Python module containing the manager of the asynchronous clustering jobs.
+"""
+import asyncio
+import time
+import uuid
+from collections import OrderedDict, deque
+from typing import Any, Awaitable, Callable, Dict, Optional
+from loguru import logger
+
+
+class Job:
+    """
+    Class representing a clustering job, and its result once it is done.
+    """
+
+    def __init__(self, key: str) -> None:
+        self.id: str = uuid.uuid4().hex
+        self.key: str = key
+        self.status: str = "pending"
+        self.submitted: float = time.time()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        """
+        Mark the job as running, once a worker picked it up.
+        """
+        self.status = "running"
+        self.started = time.time()
+
+    @property
+    def duration(self) -> Optional[float]:
+        """
+        Number of seconds the job took, None if it is not finished.
+        """
+        return self.finished - self.submitted if self.finished else None
+
+    def status_dict(self) -> Dict[str, Any]:
+        """
+        Get the status of the job as a dictionary.
+        """
+        return {"id": self.id,
+                "status": self.status,
+                "submitted": self.submitted,
+                "started": self.started,
+                "finished": self.finished,
+                "duration": self.duration,
+                "error": self.error}
+
+
+class JobManager:
+    """
+    Class to run clustering jobs in the background of the API:
+        - Identical jobs submitted while one of them is running are coalesced
+          onto a single computation.
+        - Only the last max_completed finished jobs are kept.
+    """
+
+    def __init__(self, max_completed: int = 100, durations_window: int = 1000) -> None:
+        """
+        Initializes an object of class JobManager.
+
+        Args:
+            max_completed (int): Number of finished jobs to keep.
+            durations_window (int): Number of job durations to compute the
+                statistics on.
+        """
+        self.max_completed = max_completed
+        self.jobs: Dict[str, Job] = {}
+        self.in_flight: Dict[str, Job] = {}
+        self.completed: "OrderedDict[str, Job]" = OrderedDict()
+        self.durations: deque = deque(maxlen=durations_window)
+        self.submitted = 0
+        self.coalesced = 0
+
+    def submit(self, key: str, compute: Callable[[Job], Awaitable[Any]]) -> Job:
+        """
+        Submit a job, unless a job with the same key is already running,
+        in which case this job is sent back.
+
+        Args:
+            key (str): The key identifying identical jobs.
+            compute (callable): Function returning the coroutine computing
+                the result of the job, given the job to start once a worker
+                picks it up (see Job.start).
+        """
+        self.submitted += 1
+        if key in self.in_flight:
+            self.coalesced += 1
+            return self.in_flight[key]
+        job = Job(key)
+        self.jobs[job.id] = job
+        self.in_flight[key] = job
+        job.task = asyncio.ensure_future(self.run(job, compute))
+        return job
+
+    async def run(self, job: Job, compute: Callable[[Job], Awaitable[Any]]) -> None:
+        """
+        Compute the result of a job, and keep it along with the job.
+        """
+        try:
+            job.result = await compute(job)
+            job.status = "done"
+        except Exception as error:
+            logger.exception(f"Job {job.id} failed")
+            job.status = "failed"
+            job.error = str(getattr(error, "detail", error))
+        finally:
+            job.finished = time.time()
+            self.durations.append(job.duration)
+            del self.in_flight[job.key]
+            self.completed[job.id] = job
+            # Forget about the oldest finished jobs
+            while len(self.completed) > self.max_completed:
+                expired_id, _ = self.completed.popitem(last=False)
+                del self.jobs[expired_id]
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """
+        Get a job from its id, None if it is unknown or expired.
+        """
+        return self.jobs.get(job_id)
+
+    async def wait(self, job: Job, timeout: float = 0) -> Job:
+        """
+        Wait for at most timeout seconds for the job to finish.
+        """
+        if job.task is not None and not job.task.done() and timeout > 0:
+            await asyncio.wait({job.task}, timeout=timeout)
+        return job
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the queue depth and the statistics of the durations of the jobs.
+        """
+        durations = sorted(self.durations)
+        return {"queue_depth": len(self.in_flight),
+                "completed": len(self.completed),
+                "submitted": self.submitted,
+                "coalesced": self.coalesced,
+                "mean_duration": sum(durations) / len(durations) if durations else None,
+                "p95_duration": durations[int(0.95 * (len(durations) - 1))] if durations else None,
+                "max_duration": durations[-1] if durations else None}
@@ -1,8 +1,13 @@
 # Copyright 2020 BULL SAS All rights reserved
+import asyncio
 from loguru import logger
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from gnt_api.instances import database_instance
+from starlette.middleware.base import BaseHTTPMiddleware
+from gnt_api.config import gnt_config
+from gnt_api.corpus import corpus_folder, load_corpus_matrices, reload_corpus
+from gnt_api.instances import clustering_executor, corpus_matrices, corpus_store, database_instance, gnt_clusterer
+from gnt_api.metrics import timing_middleware
 from gnt_api.routers import router
 
 
@@ -18,15 +23,34 @@ async def startup():
     # Connect to database
     await database_instance.connect()
     logger.info("Connected to mongo database")
+    # Keep the content of the database in memory
+    await corpus_store.load(database_instance)
+    # Load the precomputed matrices of the corpus
+    artifact = await load_corpus_matrices()
+    # Start the workers performing the clustering, mapping the same compiled corpus
+    clustering_executor.start(str(corpus_folder()),
+                              random_state=gnt_clusterer.random_state,
+                              matrices=corpus_matrices,
+                              artifact_path=str(artifact.path) if artifact is not None else None)
+    # Reload the corpus, its matrices and the workers on each fill
+    if gnt_config.corpus_refresh_interval > 0:
+        app.state.corpus_watcher = asyncio.create_task(
+            corpus_store.watch(database_instance, gnt_config.corpus_refresh_interval, reload_corpus))
 
 
 @app.on_event("shutdown")
 async def startup():
+    if getattr(app.state, "corpus_watcher", None) is not None:
+        app.state.corpus_watcher.cancel()
+    clustering_executor.shutdown()
     await database_instance.close()
 
 
 app.include_router(router)
 
+if gnt_config.metrics_enabled:
+    app.add_middleware(BaseHTTPMiddleware, dispatch=timing_middleware)
+
 app.add_middleware(
     CORSMiddleware,
     # allow_origins=origins,
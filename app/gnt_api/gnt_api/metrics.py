@@ -0,0 +1,321 @@
+"""
+Python module to instrument the API: timing histograms of the calls to the
+database and of the stages of the clustering, size of the clustered matrices
+and state of the cache and of the job queue, exported in the Prometheus text
+format, the timings of a request being also sent back in its Server-Timing
+header.
+"""
+import asyncio
+import functools
+import math
+import time
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from fastapi import Request, Response
+
+# Upper bounds (in seconds) of the buckets of the timing histograms
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Timings of the current request, set by the timing middleware only
+request_timings: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar("request_timings", default=None)
+
+
+def format_labels(label_names: Iterable[str], label_values: Iterable[str], extra: str = "") -> str:
+    """
+    Format the labels of a sample, escaping their values.
+    """
+    labels = [name + '="' + str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+              for name, value in zip(label_names, label_values)]
+    if extra:
+        labels.append(extra)
+    return "{" + ",".join(labels) + "}" if labels else ""
+
+
+def format_value(value: float) -> str:
+    """
+    Format the value of a sample.
+    """
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if isinstance(value, int):
+        return str(value)
+    return repr(float(value))
+
+
+class Metric:
+    """
+    Class of a metric, whose samples are identified by the values of its labels.
+    The value of a metric without label can be computed on each scrape by a
+    function instead.
+    """
+
+    metric_type = "untyped"
+
+    def __init__(self, name: str, documentation: str, label_names: Iterable[str] = (), function: Callable[[], float] = None) -> None:
+        """
+        Initializes an object of class Metric.
+
+        Args:
+            name (str): Name of the metric.
+            documentation (str): Description of the metric.
+            label_names (list): Name of the labels of the metric.
+            function (callable): Function computing the value of the metric.
+        """
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.function = function
+        self.values: Dict[Tuple[str, ...], float] = {}
+
+    def key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        """
+        Get the values of the labels of a sample, in the order of label_names.
+        """
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def samples(self) -> Iterable[Tuple[str, str, float]]:
+        """
+        Iterate over the (name, labels, value) of the samples of the metric.
+        """
+        if self.function is not None:
+            value = self.function()
+            if value is not None:
+                yield self.name, "", value
+            return
+        for key, value in sorted(self.values.items()):
+            yield self.name, format_labels(self.label_names, key), value
+
+    def render(self) -> str:
+        """
+        Render the metric in the Prometheus text format.
+        """
+        lines = [f"# HELP {self.name} {self.documentation}",
+                 f"# TYPE {self.name} {self.metric_type}"]
+        lines.extend(f"{name}{labels} {format_value(value)}" for name, labels, value in self.samples())
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    """
+    Class of a metric which only increases.
+    """
+
+    metric_type = "counter"
+
+    def inc(self, value: float = 1, **labels: str) -> None:
+        """
+        Increase the sample of the labels by value.
+        """
+        key = self.key(labels)
+        self.values[key] = self.values.get(key, 0) + value
+
+
+class Gauge(Metric):
+    """
+    Class of a metric which can be set to any value.
+    """
+
+    metric_type = "gauge"
+
+    def set(self, value: float, **labels: str) -> None:
+        """
+        Set the sample of the labels to value.
+        """
+        self.values[self.key(labels)] = value
+
+
+class Histogram(Metric):
+    """
+    Class of a metric counting the observed values falling in each bucket,
+    along with their number and sum.
+    """
+
+    metric_type = "histogram"
+
+    def __init__(self, name: str, documentation: str, label_names: Iterable[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS) -> None:
+        """
+        Initializes an object of class Histogram.
+
+        Args:
+            name (str): Name of the metric.
+            documentation (str): Description of the metric.
+            label_names (list): Name of the labels of the metric.
+            buckets (list): Sorted upper bounds of the buckets.
+        """
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self.counts: Dict[Tuple[str, ...], List[int]] = {}
+        self.sums: Dict[Tuple[str, ...], float] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        """
+        Add an observed value to the sample of the labels.
+        """
+        key = self.key(labels)
+        counts = self.counts.get(key)
+        if counts is None:
+            counts = self.counts[key] = [0] * len(self.buckets)
+            self.sums[key] = 0.0
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[index] += 1
+                break
+        self.sums[key] += value
+
+    def samples(self) -> Iterable[Tuple[str, str, float]]:
+        for key, counts in sorted(self.counts.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                yield (f"{self.name}_bucket",
+                       format_labels(self.label_names, key, f'le="{format_value(float(bound))}"'),
+                       cumulative)
+            labels = format_labels(self.label_names, key)
+            yield f"{self.name}_sum", labels, self.sums[key]
+            yield f"{self.name}_count", labels, cumulative
+
+
+class MetricsRegistry:
+    """
+    Class holding the metrics of the API, to render them all at once.
+    """
+
+    def __init__(self) -> None:
+        """
+        Initializes an object of class MetricsRegistry.
+        """
+        self.metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        """
+        Add a metric to the registry.
+        """
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, label_names: Iterable[str] = (), function: Callable[[], float] = None) -> Counter:
+        """
+        Create and register a counter.
+        """
+        return self.register(Counter(name, documentation, label_names, function))
+
+    def gauge(self, name: str, documentation: str, label_names: Iterable[str] = (), function: Callable[[], float] = None) -> Gauge:
+        """
+        Create and register a gauge.
+        """
+        return self.register(Gauge(name, documentation, label_names, function))
+
+    def histogram(self, name: str, documentation: str, label_names: Iterable[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+        """
+        Create and register a histogram.
+        """
+        return self.register(Histogram(name, documentation, label_names, buckets))
+
+    def render(self) -> str:
+        """
+        Render all of the metrics in the Prometheus text format.
+        """
+        return "".join(metric.render() + "\n" for metric in self.metrics.values())
+
+
+registry = MetricsRegistry()
+
+request_seconds = registry.histogram(
+    "gnt_request_seconds", "Duration of the requests to the API", ["method", "route", "status"])
+db_call_seconds = registry.histogram(
+    "gnt_db_call_seconds", "Duration of the calls to the database", ["method"])
+stage_seconds = registry.histogram(
+    "gnt_clustering_stage_seconds", "Duration of the stages of the clustering pipelines", ["stage"])
+job_wait_seconds = registry.histogram(
+    "gnt_clustering_job_wait_seconds",
+    "Time spent by the clustering jobs waiting for a worker and sending their results back")
+clustering_size = {
+    size: registry.gauge(f"gnt_clustering_{size}", documentation)
+    for size, documentation in (("documents", "Number of texts of the last clustering"),
+                                ("vocabulary", "Number of lemmas of the last clustering"),
+                                ("nonzeros", "Number of non-zero values of the tf-idf matrix of the last clustering"))}
+
+
+def record_timing(name: str, seconds: float) -> None:
+    """
+    Add a timing to the Server-Timing header of the current request, if any.
+    """
+    timings = request_timings.get()
+    if timings is not None:
+        timings.append((name, seconds))
+
+
+def observe_job(measures: Dict, elapsed: float) -> None:
+    """
+    Record the measures of a clustering job sent back by gnt_api.workers.measured_job.
+
+    Args:
+        measures (dict): stages and sizes of the StageTimer of the worker,
+            and duration of the job in the worker.
+        elapsed (float): Time elapsed between the submission of the job and
+            the reception of its result.
+    """
+    for stage, seconds in measures["stages"]:
+        stage_seconds.observe(seconds, stage=stage)
+        record_timing(stage, seconds)
+    for size, value in measures["sizes"].items():
+        clustering_size[size].set(value)
+    wait = max(elapsed - measures["duration"], 0)
+    job_wait_seconds.observe(wait)
+    record_timing("job_wait", wait)
+
+
+def instrument_database(connector: object, methods: Iterable[str]) -> None:
+    """
+    Time the calls to the coroutine methods of a database connector, replacing
+    them with timed wrappers on the instance.
+    """
+    for method in methods:
+        function = getattr(connector, method)
+        if not asyncio.iscoroutinefunction(function):
+            continue
+
+        @functools.wraps(function)
+        async def timed(*args, function=function, method=method, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await function(*args, **kwargs)
+            finally:
+                seconds = time.perf_counter() - start
+                db_call_seconds.observe(seconds, method=method)
+                record_timing(f"db_{method}", seconds)
+        setattr(connector, method, timed)
+
+
+def format_server_timing(timings: List[Tuple[str, float]]) -> str:
+    """
+    Format timings as the value of a Server-Timing header, summing the
+    timings of the same name, in milliseconds.
+    """
+    durations: Dict[str, float] = {}
+    for name, seconds in timings:
+        durations[name] = durations.get(name, 0) + seconds
+    return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in durations.items())
+
+
+async def timing_middleware(request: Request, call_next: Callable) -> Response:
+    """
+    Time a request, collecting the timings of its database calls and
+    clustering stages in its Server-Timing header.
+    """
+    timings: List[Tuple[str, float]] = []
+    token = request_timings.set(timings)
+    start = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        request_timings.reset(token)
+    seconds = time.perf_counter() - start
+    route = request.scope.get("route")
+    request_seconds.observe(seconds, method=request.method,
+                            route=getattr(route, "path", "unmatched"), status=response.status_code)
+    timings.append(("total", seconds))
+    response.headers["Server-Timing"] = format_server_timing(timings)
+    return response
@@ -54,3 +54,95 @@ class ClusteringResults(BaseModel):
     clusters: List[str]
     ground_truth: List[str]
     fullText: Optional[List[str]]
+    n_clusters: Optional[int]
+    scores: Optional[Dict[int, float]]
+
+
+class ClusteringGroup(BaseModel):
+    """
+    Model class representing a ground truth group of compact clustering results.
+    """
+    ground_truth: str
+    points: List[int]
+
+
+class CompactClusteringResults(BaseModel):
+    """
+    Model class representing results associated with a clustering processing,
+    each point being sent once and the groups referring to the index of their points.
+    """
+    projection: Dict[str, List[float]]
+    labels: List[str]
+    clusters: List[int]
+    groups: List[ClusteringGroup]
+    fullText: Optional[List[str]]
+    n_clusters: int
+    scores: Optional[Dict[int, float]]
+
+
+class SimilarPassage(BaseModel):
+    """
+    Model class representing a book, chapter or verse found by a similarity search.
+    """
+    name: str
+    book: str
+    score: float
+    text: Optional[str]
+
+
+class SimilarityMatrix(BaseModel):
+    """
+    Model class representing the cosine similarity of every pair of books or chapters.
+    """
+    names: List[str]
+    books: List[str]
+    matrix: List[List[float]]
+
+
+class Dendrogram(BaseModel):
+    """
+    Model class representing the linkage tree of a hierarchical clustering,
+    the leaves being numbered from 0 and the merge i being the node
+    number of leaves + i.
+    """
+    labels: List[str]
+    children: List[List[int]]
+    distances: List[float]
+    sizes: List[int]
+
+
+class CacheStats(BaseModel):
+    """
+    Model class representing the usage of the cache of the clustering results.
+    """
+    hits: int
+    misses: int
+    size: int
+    bytes: int
+    max_bytes: int
+
+
+class JobStatus(BaseModel):
+    """
+    Model class representing the status of an asynchronous clustering job.
+    """
+    id: str
+    status: str
+    submitted: float
+    started: Optional[float]
+    finished: Optional[float]
+    duration: Optional[float]
+    error: Optional[str]
+
+
+class JobStats(BaseModel):
+    """
+    Model class representing the statistics of the asynchronous clustering jobs.
+    """
+    queue_depth: int
+    completed: int
+    submitted: int
+    coalesced: int
+    mean_duration: Optional[float]
+    p95_duration: Optional[float]
+    max_duration: Optional[float]
@@ -2,105 +2,492 @@
 Python module containing the different endpoints of the application related to the
 available texts.
 """
-from typing import List, Optional
-from fastapi import APIRouter, Query
-from gnt_api.instances import database_instance, gnt_clusterer
-from gnt_api.models import BookList, ClusteringResults, TextList, BookClasses, TextChapter, TextVerses
+import importlib.util
+import json
+import time
+import uuid
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple, Union
+import numpy as np
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from gnt_api.config import gnt_config
+from gnt_api.instances import clustering_cache, clustering_executor, clustering_sessions, corpus_matrices, corpus_store, database_instance, gnt_clusterer, job_manager, linkage_trees, pairwise_similarities, similarity_indexes
+from gnt_api.jobs import Job
+from gnt_api.metrics import record_timing, registry
+from gnt_core.storage import VERSE_FIELDS
+from gnt_api.workers import cluster_job, hierarchical_cluster_job, incremental_cluster_job, linkage_job, stream_cluster_job
+from gnt_api.models import BookList, CacheStats, ClusteringResults, CompactClusteringResults, Dendrogram, JobStats, JobStatus, SimilarPassage, SimilarityMatrix, TextList, BookClasses, TextChapter, TextVerses
 
 router = APIRouter()
 
 
 @router.get("/booklists", response_model=List[BookList])
 async def get_book_list():
-    return await database_instance.get_book_lists()
+    return corpus_store.snapshot.book_lists
 
 
 @router.get("/bookclasses", response_model=List[BookClasses])
 async def get_book_list():
-    return await database_instance.get_book_classes()
+    return corpus_store.snapshot.get_book_classes()
 
 @router.get("/bookclasses/nt", response_model=List[BookClasses])
 async def get_book_list():
-    return await database_instance.get_book_classes_nt()
+    return corpus_store.snapshot.book_classes_nt
 
 @router.get("/bookclasses/ot", response_model=List[BookClasses])
 async def get_book_list():
-    return await database_instance.get_book_classes_ot()
+    return corpus_store.snapshot.book_classes_ot
 
 @router.get("/texts", response_model=List[TextList])
 async def get_book_text(q: Optional[List[str]] = Query([])):
-    return await database_instance.get_texts(q)
+    return corpus_store.snapshot.get_texts(q)
 
 @router.get("/texts/verses", response_model=List[TextVerses])
 async def get_book_text(q: Optional[List[str]] = Query([])):
-    return await database_instance.get_verses(q)
+    return corpus_store.snapshot.get_verses(q)
 
 @router.get("/texts/chapters", response_model=List[TextChapter])
 async def get_book_text(q: Optional[List[str]] = Query([])):
-    return await database_instance.get_chapters(q)
-
-@router.post("/clusterize", response_model=List[ClusteringResults])
-async def post_clusterize(book: Optional[List[str]] = Query([])):
-    # Get the text associated with the query
-    texts = await database_instance.get_texts(book)
-    # Format the text according to the one required by the optimizer
-    text_corpus = []
-    text_names = []
-    for book_data in texts:
-        text_corpus.append(book_data["text"])
-        text_names.append(book_data["book"])
-    print(text_names)
-    # Get the corresponding ground truth group
-    ground_truth = await database_instance.get_book_class(text_names)
-    return gnt_clusterer.pipeline(text_corpus=text_corpus,
-                                  names=text_names,
-                                  n_clusters=10,
-                                  ground_truth=ground_truth)
-
-@router.post("/clusterize/chapters", response_model=List[ClusteringResults])
-async def post_clusterize(book: Optional[List[str]] = Query([])):
+    return corpus_store.snapshot.get_chapters(q)
+
+async def stream_json_array(documents: AsyncIterator[Dict]) -> AsyncIterator[bytes]:
+    """
+    Encode documents as a JSON array, one document at a time.
+    """
+    separator = b"["
+    async for document in documents:
+        yield separator + json.dumps(document, ensure_ascii=False).encode("utf-8")
+        separator = b","
+    yield b"[]" if separator == b"[" else b"]"
+
+
+@router.get("/texts/passage")
+async def get_passage(book: str, chapter_start: Optional[int] = Query(None, ge=0), chapter_end: Optional[int] = Query(None, ge=0),
+                      verse_start: Optional[int] = Query(None, ge=0), verse_end: Optional[int] = Query(None, ge=0),
+                      fields: List[str] = Query([])):
+    """
+    Stream the verses of a book from verse_start of chapter_start to verse_end
+    of chapter_end as a JSON array, with the fields asked for only.
+    """
+    unknown_fields = set(fields) - set(VERSE_FIELDS)
+    if unknown_fields:
+        raise HTTPException(status_code=422, detail=f"Unknown fields: {', '.join(sorted(unknown_fields))}")
+    try:
+        database_instance.check_verse_range(chapter_start, chapter_end, verse_start, verse_end)
+    except ValueError as error:
+        raise HTTPException(status_code=422, detail=str(error))
+    return StreamingResponse(
+        stream_json_array(database_instance.iter_verse_range(
+            book, chapter_start, chapter_end, verse_start, verse_end, fields or None)),
+        media_type="application/json")
+
+# Media type of each format of the clustering results, see encode_results
+MEDIA_TYPES = {"full": "application/json",
+               "compact": "application/json",
+               "msgpack": "application/x-msgpack"}
+
+
+def negotiate_format(request: Request, compact: bool = False) -> str:
+    """
+    Get the format of the clustering results: msgpack if the client accepts it,
+    compact JSON if it is asked for, a list of ClusteringResults otherwise.
+    """
+    accept = request.headers.get("accept", "")
+    if "application/x-msgpack" in accept or "application/msgpack" in accept:
+        if importlib.util.find_spec("msgpack") is None:
+            raise HTTPException(status_code=406, detail="msgpack is not installed")
+        return "msgpack"
+    return "compact" if compact else "full"
+
+
+async def get_ground_truth(granularity: str, book: List[str]) -> Optional[List[str]]:
+    """
+    Get the ground truth group of each book when clustering books, None
+    otherwise so that the book of each row is used.
+    """
+    if granularity != "books":
+        return None
+    matrix = corpus_matrices[granularity]
+    return corpus_store.snapshot.book_groups.groups(
+        [matrix.names[row] for row in matrix.rows(book)])
+
+
+def group_books(group: List[str]) -> List[str]:
+    """
+    Get the books of the groups.
+
+    Raises:
+        HTTPException: If a group is unknown.
+    """
+    book_groups = corpus_store.snapshot.book_groups
+    unknown_groups = book_groups.unknown_groups(group)
+    if unknown_groups:
+        raise HTTPException(status_code=404, detail=f"Unknown groups {', '.join(unknown_groups)}")
+    return book_groups.books(group)
+
+
+async def selected_books(book: Optional[List[str]] = Query([]), group: Optional[List[str]] = Query([])) -> List[str]:
+    """
+    Get the books selected by a request: the books it lists along with the
+    books of the groups it lists, all of the books if it lists none.
+
+    Raises:
+        HTTPException: If a book or a group is unknown.
+    """
+    unknown_books = corpus_store.snapshot.unknown_books(book)
+    if unknown_books:
+        raise HTTPException(status_code=404, detail=f"Unknown books {', '.join(unknown_books)}")
+    if not group:
+        return book
+    return list(dict.fromkeys(book + group_books(group)))
+
+
+def clustering_key(granularity: str, book: List[str], n_clusters: Optional[int] = None, response_format: str = "full", full_text: bool = True) -> Tuple[str, bool]:
+    """
+    Get the key identifying a clustering request, and whether the clustering
+    is performed chunk by chunk.
+    """
+    # Cluster the verses chunk by chunk if there are too many of them
+    streaming = granularity == "verses" and len(
+        corpus_matrices[granularity].rows(book)) > gnt_config.streaming_threshold
+    key = clustering_cache.make_key(
+        granularity, book, {"n_clusters": n_clusters,
+                            "auto_k": None if n_clusters is not None else [
+                                gnt_clusterer.metric, gnt_clusterer.max_clusters, gnt_clusterer.patience],
+                            "random_state": gnt_clusterer.random_state,
+                            "streaming": streaming,
+                            "format": response_format,
+                            "full_text": full_text or response_format == "full"})
+    return key, streaming
+
+
+async def run_clustering(granularity: str, book: List[str], n_clusters: Optional[int] = None, response_format: str = "full", full_text: bool = True, request: Request = None, on_start: Callable[[], None] = None) -> bytes:
+    """
+    Perform the clustering of the precomputed matrix of the granularity, restricted
+    to the books, or get it from the cache if it was already computed.
+    The clustering itself and the encoding of its results are run by the
+    clustering executor, off the event loop, on_start being called once a
+    worker picks it up.
+    """
+    key, streaming = clustering_key(granularity, book, n_clusters, response_format, full_text)
+    start = time.perf_counter()
+    clustering_results = clustering_cache.get(key)
+    record_timing("cache", time.perf_counter() - start)
+    if clustering_results is not None:
+        return clustering_results
+    if streaming:
+        clustering_results = await clustering_executor.run(
+            stream_cluster_job, book, n_clusters, gnt_config.streaming_batch_size,
+            response_format, full_text, request=request, on_start=on_start)
+    else:
+        clustering_results = await clustering_executor.run(
+            cluster_job, granularity, book, n_clusters,
+            await get_ground_truth(granularity, book),
+            response_format, full_text, request=request, on_start=on_start)
+    clustering_cache.set(key, clustering_results)
+    return clustering_results
+
+
+async def run_session_clustering(granularity: str, book: List[str], session: str, n_clusters: Optional[int] = None, response_format: str = "full", full_text: bool = True, request: Request = None) -> Response:
+    """
+    Perform the clustering within a session, warm-starting it from the
+    previous run of the session if it was performed on the same granularity.
+    The results are not cached, as they depend on the previous runs.
+    A new session is started if session is unknown (or set to new), its
+    token being sent back in the X-Clustering-Session header.
+    """
+    previous_run = clustering_sessions.get(session)
+    if previous_run is None:
+        session = uuid.uuid4().hex
+    state = previous_run["state"] if previous_run and previous_run["granularity"] == granularity else None
+    clustering_results, state = await clustering_executor.run(
+        incremental_cluster_job, granularity, book, n_clusters,
+        await get_ground_truth(granularity, book), response_format, full_text,
+        state, gnt_config.warm_start_min_overlap, request=request)
+    clustering_sessions.set(session, {"granularity": granularity, "state": state},
+                            ttl=gnt_config.session_ttl)
+    return Response(clustering_results, media_type=MEDIA_TYPES[response_format],
+                    headers={"X-Clustering-Session": session,
+                             "X-Clustering-Warm-Start": str(bool(state and state.warm_started)).lower()})
+
+
+async def clusterize(request: Request, granularity: str, book: List[str], compact: bool = False, full_text: bool = False, session: Optional[str] = None, n_clusters: Optional[int] = None) -> Response:
+    """
+    Send back the results of a clustering, encoded by the workers.
+    The number of clusters is selected automatically if it is not given.
+    """
+    response_format = negotiate_format(request, compact)
+    if session is not None and not clustering_key(granularity, book, n_clusters)[1]:
+        return await run_session_clustering(granularity, book, session, n_clusters,
+                                            response_format, full_text, request=request)
+    return Response(await run_clustering(granularity, book, n_clusters, response_format,
+                                         full_text, request=request),
+                    media_type=MEDIA_TYPES[response_format])
+
+@router.post("/clusterize", response_model=Union[List[ClusteringResults], CompactClusteringResults])
+async def post_clusterize(request: Request, book: List[str] = Depends(selected_books), compact: bool = False, full_text: bool = False, session: Optional[str] = None, n_clusters: Optional[int] = Query(None, ge=2)):
+    """
+    Perform clustering within books.
+    """
+    return await clusterize(request, "books", book, compact, full_text, session, n_clusters)
+
+@router.post("/clusterize/chapters", response_model=Union[List[ClusteringResults], CompactClusteringResults])
+async def post_clusterize(request: Request, book: List[str] = Depends(selected_books), compact: bool = False, full_text: bool = False, session: Optional[str] = None, n_clusters: Optional[int] = Query(None, ge=2)):
     """
     Perform clustering within chapters.
     """
-    # Get the text associated with the query
-    texts = await database_instance.get_chapters(book)
-    # Format the text according to the one required by the optimizer
-    text_corpus = []
-    text_names = []
-    book_chapter_label = []
-    # For each book
-    for book_data in texts:
-        # Get the data on a per chapter basis
-        for chapter_nbr, chapter_content in book_data["chapters"].items():
-            text_corpus.append(chapter_content)
-            text_names.append(book_data["book"])
-            book_chapter_label.append(f"{chapter_nbr}{book_data['book']}")
-    return gnt_clusterer.pipeline(text_corpus=text_corpus,
-                                  names=book_chapter_label,
-                                  n_clusters=10,
-                                  ground_truth=text_names)
-
-@router.post("/clusterize/verses", response_model=List[ClusteringResults])
-async def post_clusterize(book: Optional[List[str]] = Query([])):
+    return await clusterize(request, "chapters", book, compact, full_text, session, n_clusters)
+
+@router.post("/clusterize/verses", response_model=Union[List[ClusteringResults], CompactClusteringResults])
+async def post_clusterize(request: Request, book: List[str] = Depends(selected_books), compact: bool = False, full_text: bool = False, session: Optional[str] = None, n_clusters: Optional[int] = Query(None, ge=2)):
     """
     Perform clustering within verses.
     """
-    # Get the text associated with the query
-    texts = await database_instance.get_verses(book)
-    # Format the text according to the one required by the optimizer
-    text_corpus = []
-    text_names = []
-    book_chapter_verse_label = []
-    # For each book
-    for book_data in texts:
-        # Get the data on a per chapter basis
-        for chapter_nbr, chapter_content in book_data["verses"].items():
-            for verse_nbr, verse_content in chapter_content.items():
-                text_corpus.append(verse_content)
-                text_names.append(book_data["book"])
-                book_chapter_verse_label.append(f"{book_data['book']}{chapter_nbr},{verse_nbr}")
-    clustering_results =  gnt_clusterer.pipeline(text_corpus=text_corpus,
-                                  names=book_chapter_verse_label,
-                                  n_clusters=10,
-                                  ground_truth=text_names)
-    return clustering_results
+    return await clusterize(request, "verses", book, compact, full_text, session, n_clusters)
+
+def linkage_key(granularity: str, book: List[str]) -> Tuple[str, Optional[int]]:
+    """
+    Get the key identifying the linkage tree of the books, and the maximum
+    number of leaves of the tree, only limited for the verses.
+    """
+    max_leaves = gnt_config.hierarchical_max_leaves if granularity == "verses" else None
+    return clustering_cache.make_key(
+        granularity, book, {"linkage": "ward",
+                            "max_leaves": max_leaves,
+                            "random_state": gnt_clusterer.random_state}), max_leaves
+
+async def clusterize_hierarchical(request: Request, granularity: str, book: List[str], compact: bool = False, full_text: bool = False, n_clusters: Optional[int] = None, distance: Optional[float] = None) -> Response:
+    """
+    Send back the results of a hierarchical clustering, cutting the cached
+    linkage tree of the books if it was already computed. The number of
+    clusters is selected from the tree if neither it nor the distance is given.
+    """
+    if n_clusters is not None and distance is not None:
+        raise HTTPException(status_code=422, detail="Give either n_clusters or distance")
+    response_format = negotiate_format(request, compact)
+    tree_key, max_leaves = linkage_key(granularity, book)
+    key = clustering_cache.make_key(
+        granularity, book, {"tree": tree_key,
+                            "n_clusters": n_clusters,
+                            "distance": distance,
+                            "auto_k": gnt_clusterer.max_clusters if n_clusters is None and distance is None else None,
+                            "format": response_format,
+                            "full_text": full_text or response_format == "full"})
+    clustering_results = clustering_cache.get(key)
+    tree = linkage_trees.get(tree_key)
+    if clustering_results is None:
+        clustering_results, new_tree = await clustering_executor.run(
+            hierarchical_cluster_job, granularity, book, n_clusters, distance,
+            await get_ground_truth(granularity, book), response_format, full_text,
+            tree, max_leaves, request=request)
+        linkage_trees.set(tree_key, new_tree)
+        clustering_cache.set(key, clustering_results)
+    return Response(clustering_results, media_type=MEDIA_TYPES[response_format],
+                    headers={"X-Linkage-Cached": str(tree is not None).lower()})
+
+@router.post("/clusterize/hierarchical", response_model=Union[List[ClusteringResults], CompactClusteringResults])
+async def post_clusterize_hierarchical(request: Request, book: List[str] = Depends(selected_books), compact: bool = False, full_text: bool = False, n_clusters: Optional[int] = Query(None, ge=2), distance: Optional[float] = Query(None, gt=0)):
+    """
+    Perform hierarchical clustering within books.
+    """
+    return await clusterize_hierarchical(request, "books", book, compact, full_text, n_clusters, distance)
+
+@router.post("/clusterize/hierarchical/chapters", response_model=Union[List[ClusteringResults], CompactClusteringResults])
+async def post_clusterize_hierarchical(request: Request, book: List[str] = Depends(selected_books), compact: bool = False, full_text: bool = False, n_clusters: Optional[int] = Query(None, ge=2), distance: Optional[float] = Query(None, gt=0)):
+    """
+    Perform hierarchical clustering within chapters.
+    """
+    return await clusterize_hierarchical(request, "chapters", book, compact, full_text, n_clusters, distance)
+
+@router.post("/clusterize/hierarchical/verses", response_model=Union[List[ClusteringResults], CompactClusteringResults])
+async def post_clusterize_hierarchical(request: Request, book: List[str] = Depends(selected_books), compact: bool = False, full_text: bool = False, n_clusters: Optional[int] = Query(None, ge=2), distance: Optional[float] = Query(None, gt=0)):
+    """
+    Perform hierarchical clustering within verses, their KMeans
+    micro-clusters being the leaves of the linkage tree.
+    """
+    return await clusterize_hierarchical(request, "verses", book, compact, full_text, n_clusters, distance)
+
+async def dendrogram(request: Request, granularity: str, book: List[str]) -> Dict:
+    """
+    Send back the linkage tree of the books, computing it if it is not cached.
+    """
+    tree_key, max_leaves = linkage_key(granularity, book)
+    tree = linkage_trees.get(tree_key)
+    if tree is None:
+        tree = await clustering_executor.run(linkage_job, granularity, book, max_leaves, request=request)
+        linkage_trees.set(tree_key, tree)
+    matrix = corpus_matrices[granularity]
+    labels = [matrix.names[row] for row in matrix.rows(book)]
+    if tree is None:
+        return {"labels": labels, "children": [], "distances": [], "sizes": []}
+    return tree.dendrogram(labels)
+
+@router.get("/dendrogram", response_model=Dendrogram)
+async def get_dendrogram(request: Request, book: List[str] = Depends(selected_books)):
+    """
+    Get the linkage tree of the hierarchical clustering within books.
+    """
+    return await dendrogram(request, "books", book)
+
+@router.get("/dendrogram/chapters", response_model=Dendrogram)
+async def get_dendrogram(request: Request, book: List[str] = Depends(selected_books)):
+    """
+    Get the linkage tree of the hierarchical clustering within chapters.
+    """
+    return await dendrogram(request, "chapters", book)
+
+async def similar(granularity: str, book: str, chapter: Optional[str] = None, verse: Optional[str] = None, k: int = 10, within: List[str] = None, group: List[str] = None, exclude_passage: bool = True, full_text: bool = True) -> List[Dict]:
+    """
+    Search the books, chapters or verses lexically closest to a passage,
+    among the books within and the books of the groups if any is given.
+    """
+    books = list(within or [])
+    if group:
+        books.extend(group_books(group))
+    if (within or group) and not books:
+        return []
+    try:
+        rows, scores = await run_in_threadpool(
+            similarity_indexes.search, granularity, book, chapter, verse, k, books, exclude_passage)
+    except KeyError as error:
+        raise HTTPException(status_code=404, detail=error.args[0])
+    matrix = similarity_indexes[granularity].matrix
+    return [{"name": matrix.names[row],
+             "book": matrix.books[row],
+             "score": float(score),
+             "text": matrix.texts[row] if full_text else None}
+            for row, score in zip(rows, scores)]
+
+@router.get("/similar", response_model=List[SimilarPassage])
+async def get_similar(book: str, chapter: Optional[str] = None, verse: Optional[str] = None, k: int = Query(10, ge=1, le=1000), within: Optional[List[str]] = Query([]), group: Optional[List[str]] = Query([]), exclude_passage: bool = True, full_text: bool = True):
+    """
+    Search the books closest to a book, a chapter or a verse.
+    """
+    return await similar("books", book, chapter, verse, k, within, group, exclude_passage, full_text)
+
+@router.get("/similar/chapters", response_model=List[SimilarPassage])
+async def get_similar(book: str, chapter: Optional[str] = None, verse: Optional[str] = None, k: int = Query(10, ge=1, le=1000), within: Optional[List[str]] = Query([]), group: Optional[List[str]] = Query([]), exclude_passage: bool = True, full_text: bool = True):
+    """
+    Search the chapters closest to a book, a chapter or a verse.
+    """
+    return await similar("chapters", book, chapter, verse, k, within, group, exclude_passage, full_text)
+
+@router.get("/similar/verses", response_model=List[SimilarPassage])
+async def get_similar(book: str, chapter: Optional[str] = None, verse: Optional[str] = None, k: int = Query(10, ge=1, le=1000), within: Optional[List[str]] = Query([]), group: Optional[List[str]] = Query([]), exclude_passage: bool = True, full_text: bool = True):
+    """
+    Search the verses closest to a book, a chapter or a verse.
+    """
+    return await similar("verses", book, chapter, verse, k, within, group, exclude_passage, full_text)
+
+def encode_similarity(granularity: str, book: List[str], response_format: str = "full") -> bytes:
+    """
+    Slice the precomputed similarity of the books or chapters of the books,
+    encoded as JSON with 4 decimals, or with msgpack the matrix being sent
+    as a little endian float32 binary array.
+    """
+    matrix, names, books = pairwise_similarities[granularity].select(book)
+    if response_format == "msgpack":
+        import msgpack
+        return msgpack.packb({"names": names, "books": books,
+                              "matrix": matrix.astype("<f4").tobytes()})
+    return json.dumps({"names": names, "books": books, "matrix": matrix.astype(np.float64).round(4).tolist()},
+                      ensure_ascii=False).encode("utf8")
+
+async def similarity(request: Request, granularity: str, book: List[str]) -> Response:
+    """
+    Send back the precomputed similarity of every pair of books or chapters of the books.
+    """
+    response_format = negotiate_format(request)
+    return Response(await run_in_threadpool(encode_similarity, granularity, book, response_format),
+                    media_type=MEDIA_TYPES[response_format])
+
+@router.get("/similarity", response_model=SimilarityMatrix)
+async def get_similarity(request: Request, book: List[str] = Depends(selected_books)):
+    """
+    Get the cosine similarity of every pair of books.
+    """
+    return await similarity(request, "books", book)
+
+@router.get("/similarity/chapters", response_model=SimilarityMatrix)
+async def get_similarity(request: Request, book: List[str] = Depends(selected_books)):
+    """
+    Get the cosine similarity of every pair of chapters of the books.
+    """
+    return await similarity(request, "chapters", book)
+
+@router.get("/cache", response_model=CacheStats)
+async def get_cache_stats():
+    return clustering_cache.stats()
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """
+    Get the metrics of the API in the Prometheus text format.
+    """
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+def submit_job(request: Request, granularity: str, book: List[str], compact: bool = False, full_text: bool = False, n_clusters: Optional[int] = None) -> Dict:
+    """
+    Submit a clustering job, coalesced with any identical running job.
+    """
+    response_format = negotiate_format(request, compact)
+    key, _ = clustering_key(granularity, book, n_clusters, response_format, full_text)
+
+    async def compute(job: Job):
+        return (await run_clustering(granularity, book, n_clusters, response_format, full_text, on_start=job.start),
+                MEDIA_TYPES[response_format])
+    return job_manager.submit(key, compute).status_dict()
+
+@router.post("/jobs/clusterize", response_model=JobStatus)
+async def post_clusterize_job(request: Request, book: List[str] = Depends(selected_books), compact: bool = False, full_text: bool = False, n_clusters: Optional[int] = Query(None, ge=2)):
+    """
+    Submit a clustering job within books.
+    """
+    return submit_job(request, "books", book, compact, full_text, n_clusters)
+
+@router.post("/jobs/clusterize/chapters", response_model=JobStatus)
+async def post_clusterize_job(request: Request, book: List[str] = Depends(selected_books), compact: bool = False, full_text: bool = False, n_clusters: Optional[int] = Query(None, ge=2)):
+    """
+    Submit a clustering job within chapters.
+    """
+    return submit_job(request, "chapters", book, compact, full_text, n_clusters)
+
+@router.post("/jobs/clusterize/verses", response_model=JobStatus)
+async def post_clusterize_job(request: Request, book: List[str] = Depends(selected_books), compact: bool = False, full_text: bool = False, n_clusters: Optional[int] = Query(None, ge=2)):
+    """
+    Submit a clustering job within verses.
+    """
+    return submit_job(request, "verses", book, compact, full_text, n_clusters)
+
+@router.get("/jobs", response_model=JobStats)
+async def get_job_stats():
+    return job_manager.stats()
+
+@router.get("/jobs/{job_id}", response_model=JobStatus)
+async def get_job_status(job_id: str, wait: float = Query(0, ge=0, le=60)):
+    """
+    Get the status of a job, waiting for at most wait seconds for it to finish.
+    """
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    return (await job_manager.wait(job, wait)).status_dict()
+
+@router.get("/jobs/{job_id}/result", response_model=Union[List[ClusteringResults], CompactClusteringResults],
+            responses={202: {"model": JobStatus}})
+async def get_job_result(job_id: str, wait: float = Query(0, ge=0, le=60)):
+    """
+    Get the results of a job, waiting for at most wait seconds for it to finish.
+    The status of the job is sent back if it is not finished yet.
+    """
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    job = await job_manager.wait(job, wait)
+    if job.status == "failed":
+        raise HTTPException(status_code=500, detail=job.error)
+    if job.status != "done":
+        return JSONResponse(job.status_dict(), status_code=202)
+    content, media_type = job.result
+    return Response(content, media_type=media_type)
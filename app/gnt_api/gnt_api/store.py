@@ -0,0 +1,261 @@
+"""
+Python module to keep the content of the database in memory, so that the
+texts and the book classes are read without querying the database. The
+content is reloaded whenever the database is filled again.
+"""
+import asyncio
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+from loguru import logger
+from gnt_core.artifact import CorpusArtifact, open_artifact
+from gnt_core.book_groups import BookGroupIndex
+from gnt_core.storage import StorageBackend
+
+
+class CorpusSnapshot:
+    """
+    Immutable content of the database for a given fill, the texts being
+    stored once as:
+        - The text of each verse, in the order of the database
+        - The chapter and verse label of each verse
+        - The span of the verses of each book and of each of its chapters,
+          the texts of the books and chapters being the concatenation of
+          the texts of their verses
+        - The text of the books whose words are not in the order of their
+          verses (the verses of Proverbs are not sorted by chapter)
+    """
+
+    def __init__(self, generation: Optional[str], book_lists: List[Dict], book_classes_nt: List[Dict], book_classes_ot: List[Dict], verse_records: Iterable[Tuple[str, str, str, str]], book_texts: Iterable[Dict[str, str]] = ()) -> None:
+        """
+        Initializes an object of class CorpusSnapshot.
+
+        Args:
+            generation (str): The id of the fill of the database.
+            book_lists (list): The content of the collection BookList.
+            book_classes_nt (list): The content of the collection BookClassesNT.
+            book_classes_ot (list): The content of the collection BookClassesOT.
+            verse_records (iterable): tuples of (book, chapter, verse, text),
+                the verses of a same chapter and of a same book being contiguous.
+            book_texts (iterable): The content of the collection GNTText.
+        """
+        self.generation = generation
+        self.book_lists = book_lists
+        self.book_classes_nt = book_classes_nt
+        self.book_classes_ot = book_classes_ot
+        texts, chapter_labels, verse_labels = [], [], []
+        self.book_spans: Dict[str, Tuple[int, int]] = {}
+        self.chapter_spans: Dict[str, Dict[str, Tuple[int, int]]] = {}
+        self.verse_rows: Dict[Tuple[str, str, str], int] = {}
+        for row, (book, chapter, verse, text) in enumerate(verse_records):
+            start = self.book_spans.get(book, (row,))[0]
+            self.book_spans[book] = (start, row + 1)
+            chapters = self.chapter_spans.setdefault(book, {})
+            chapters[chapter] = (chapters.get(chapter, (row,))[0], row + 1)
+            self.verse_rows[book, chapter, verse] = row
+            texts.append(text)
+            chapter_labels.append(chapter)
+            verse_labels.append(verse)
+        self.texts = tuple(texts)
+        self.chapter_labels = tuple(chapter_labels)
+        self.verse_labels = tuple(verse_labels)
+        self.book_texts: Dict[str, str] = {}
+        for book_data in book_texts:
+            if book_data["book"] in self.book_spans and book_data["text"] != self.book(book_data["book"]):
+                self.book_texts[book_data["book"]] = book_data["text"]
+        self.book_groups = BookGroupIndex(self.get_book_classes(), self.book_spans)
+
+    @classmethod
+    async def from_database(cls, database: StorageBackend, artifact: CorpusArtifact = None) -> "CorpusSnapshot":
+        """
+        Read the content of the database, streaming its verses one book at a
+        time, or reading the texts from the compiled corpus if it is given.
+        """
+        generation = await database.get_fill_generation()
+        if artifact is not None:
+            verse_records = list(artifact.iter_verse_records())
+            book_texts = [{"book": book, "text": artifact.book_text(book)} for book in artifact.books]
+        else:
+            verse_records = []
+            async for book_data in database.iter_verses():
+                for chapter, verses in book_data["verses"].items():
+                    verse_records.extend((book_data["book"], chapter, verse, text)
+                                         for verse, text in verses.items())
+            book_texts = await database.get_texts([])
+        return cls(generation,
+                   await database.get_book_lists(),
+                   await database.get_book_classes_nt(),
+                   await database.get_book_classes_ot(),
+                   verse_records,
+                   book_texts)
+
+    def books(self, text_list: Optional[List[str]] = None) -> List[str]:
+        """
+        Get the books of text_list, in the order of the database, or all of
+        the books if text_list is not set.
+        """
+        if not text_list:
+            return list(self.book_spans)
+        selected = set(text_list)
+        return [book for book in self.book_spans if book in selected]
+
+    def unknown_books(self, books: List[str]) -> List[str]:
+        """
+        Get the books which are not in the database.
+        """
+        return [book for book in books if book not in self.book_spans]
+
+    def book(self, book: str) -> str:
+        """
+        Get the text of a book.
+        """
+        if book in self.book_texts:
+            return self.book_texts[book]
+        start, end = self.book_spans[book]
+        return "".join(self.texts[start:end])
+
+    def chapter(self, book: str, chapter: str) -> str:
+        """
+        Get the text of a chapter of a book.
+        """
+        start, end = self.chapter_spans[book][chapter]
+        return "".join(self.texts[start:end])
+
+    def verse(self, book: str, chapter: str, verse: str) -> str:
+        """
+        Get the text of a verse of a book.
+        """
+        return self.texts[self.verse_rows[book, chapter, verse]]
+
+    def get_texts(self, text_list: Optional[List[str]] = None) -> List[Dict[str, str]]:
+        """
+        Get the texts of the books of text_list, as StorageBackend.get_texts.
+        """
+        return [{"book": book, "text": self.book(book)} for book in self.books(text_list)]
+
+    def get_chapters(self, text_list: Optional[List[str]] = None) -> List[Dict]:
+        """
+        Get the chapters of the books of text_list, as StorageBackend.get_chapters.
+        """
+        return [{"book": book,
+                 "chapters": {chapter: "".join(self.texts[start:end])
+                              for chapter, (start, end) in self.chapter_spans[book].items()}}
+                for book in self.books(text_list)]
+
+    def get_verses(self, text_list: Optional[List[str]] = None) -> List[Dict]:
+        """
+        Get the verses of the books of text_list, as StorageBackend.get_verses.
+        """
+        return [{"book": book,
+                 "verses": {chapter: dict(zip(self.verse_labels[start:end], self.texts[start:end]))
+                            for chapter, (start, end) in self.chapter_spans[book].items()}}
+                for book in self.books(text_list)]
+
+    def get_book_classes(self) -> List[Dict]:
+        """
+        Get the classes of the books of the OT and of the NT.
+        """
+        return self.book_classes_ot + self.book_classes_nt
+
+    def get_book_class(self, book_list: List[str]) -> List[str]:
+        """
+        For a given list of books, get their corresponding class, UNGROUPED
+        for the books without class.
+        """
+        return self.book_groups.groups(book_list)
+
+
+class CorpusStore:
+    """
+    Class holding the snapshot of the content of the database, replaced by
+    a new one whenever the id of the fill of the database changes. Readers
+    get the snapshot once per request, so that they never see the content
+    of two different fills.
+    """
+
+    def __init__(self, artifact_path: Optional[str] = None) -> None:
+        """
+        Initializes an object of class CorpusStore.
+
+        Args:
+            artifact_path (str): Path of the compiled corpus the texts are
+                read from, as long as it matches the fill of the database.
+        """
+        self.artifact_path = artifact_path
+        self.snapshot: Optional[CorpusSnapshot] = None
+        self.lock = asyncio.Lock()
+        self.reloads = 0
+        # Whether the last reload of the content failed to complete, so that
+        # it is attempted again even though the snapshot is up to date
+        self.reload_pending = False
+
+    @property
+    def generation(self) -> Optional[str]:
+        """
+        Get the id of the fill of the snapshot.
+        """
+        return self.snapshot.generation if self.snapshot is not None else None
+
+    async def load(self, database: StorageBackend) -> CorpusSnapshot:
+        """
+        Read the content of the database into a new snapshot, replacing the
+        current one once it is complete.
+        """
+        artifact = open_artifact(self.artifact_path, await database.get_manifest()) if self.artifact_path else None
+        try:
+            snapshot = await CorpusSnapshot.from_database(database, artifact)
+        finally:
+            if artifact is not None:
+                artifact.close()
+        self.snapshot = snapshot
+        self.reloads += 1
+        logger.info(f"Loaded corpus of fill generation {snapshot.generation}: "
+                    f"{len(snapshot.book_spans)} books, {len(snapshot.texts)} verses")
+        return snapshot
+
+    async def refresh(self, database: StorageBackend, on_reload: Callable[[], Awaitable[None]] = None) -> bool:
+        """
+        Reload the content of the database if it was filled again since the
+        snapshot was read.
+
+        Args:
+            database (StorageBackend): The database to read.
+            on_reload (callable): Function returning the coroutine reloading
+                whatever else is computed out of the content of the database,
+                awaited once the snapshot is replaced, and awaited again on
+                the next refresh if it fails.
+
+        Returns:
+            bool: Whether the content was reloaded.
+        """
+        if await self.up_to_date(database):
+            return False
+        async with self.lock:
+            # Another refresh may have reloaded the content in the meantime
+            if await self.up_to_date(database):
+                return False
+            if self.snapshot is None or await database.get_fill_generation() != self.generation:
+                await self.load(database)
+            self.reload_pending = True
+            if on_reload is not None:
+                await on_reload()
+            self.reload_pending = False
+        return True
+
+    async def up_to_date(self, database: StorageBackend) -> bool:
+        """
+        Check whether the snapshot and whatever is computed out of it were
+        reloaded since the last fill of the database.
+        """
+        return (self.snapshot is not None and not self.reload_pending
+                and await database.get_fill_generation() == self.generation)
+
+    async def watch(self, database: StorageBackend, interval: float, on_reload: Callable[[], Awaitable[None]] = None) -> None:
+        """
+        Check every interval seconds whether the database was filled again,
+        reloading its content if so, see refresh.
+        """
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.refresh(database, on_reload)
+            except Exception:
+                logger.exception("Could not refresh the corpus")
@@ -0,0 +1,285 @@
+"""
+Python module containing the clustering jobs run by the worker processes of
+the ClusteringExecutor. Each worker loads the corpus matrices once, when it
+starts, so that the jobs only send the books to cluster to the workers. The
+workers mapping the compiled corpus share the arrays of its count matrices.
+"""
+import json
+import os
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+import numpy as np
+from loguru import logger
+from gnt_api.config import gnt_config
+from gnt_api.models import ClusteringResults
+from gnt_core.artifact import CorpusArtifact
+from gnt_nlp_utils import get_stop_words
+from gnt_nlp_utils.clusterer import ClusteringState, ClusteringTree, GNTClusterer, StreamingGNTClusterer, iter_chunks
+from gnt_nlp_utils.matrices import CorpusMatrices, CorpusMatrix
+from gnt_nlp_utils.tokens import GRANULARITIES, TokenizedCorpus
+
+# State of the current worker, set up by initialize_worker
+worker_matrices: Optional[CorpusMatrices] = None
+worker_clusterer: Optional[GNTClusterer] = None
+
+
+def artifact_tokenized_corpus(artifact: CorpusArtifact) -> TokenizedCorpus:
+    """
+    Get the tokenized corpus of a compiled corpus, decoding the texts of all
+    of its verses.
+    """
+    books, chapters, verses, texts = (list(values) for values in zip(*artifact.iter_verse_records()))
+    return TokenizedCorpus(artifact.vocabulary,
+                           np.frombuffer(artifact.section("token_ids"), dtype=np.int32),
+                           np.frombuffer(artifact.section("verse_tokens"), dtype=np.int64),
+                           books, chapters, verses, texts)
+
+
+def artifact_corpus_matrices(artifact: CorpusArtifact) -> CorpusMatrices:
+    """
+    Get the count matrices of a compiled corpus, their arrays being read from
+    the mapping of the file rather than copied and the texts of their rows
+    being decoded when read. They are rather built from the tokenized corpus
+    if the file was compiled with other stop words.
+    """
+    if set(artifact.stop_words) != get_stop_words():
+        logger.warning(f"The compiled corpus {artifact.path} was compiled with other stop words, "
+                       f"building its count matrices from its tokens")
+        return CorpusMatrices.from_tokenized_corpus(artifact_tokenized_corpus(artifact))
+    from scipy.sparse import csr_matrix
+    matrices = CorpusMatrices()
+    for granularity in GRANULARITIES:
+        indptr, indices, counts = (np.frombuffer(array, dtype=np.int32)
+                                   for array in artifact.count_arrays(granularity))
+        matrices[granularity] = CorpusMatrix(
+            csr_matrix((counts, indices, indptr), shape=(len(indptr) - 1, len(artifact.vocabulary)), copy=False),
+            artifact.vocabulary, *artifact.index(granularity))
+    return matrices
+
+
+def initialize_worker(corpus_folder: str, random_state: int = 0, matrices: CorpusMatrices = None, artifact_path: str = None) -> None:
+    """
+    Load the corpus matrices of the worker, unless they are given.
+
+    Args:
+        corpus_folder (str): Folder the tokenized corpus was written down in.
+        random_state (int): Seed of the KMeans initialization.
+        matrices (CorpusMatrices): Already loaded matrices to use.
+        artifact_path (str): Path of the compiled corpus to map rather than
+            loading the tokenized corpus of corpus_folder.
+    """
+    global worker_matrices, worker_clusterer
+    # Import the libraries of the pipeline now, rather than on the first clustering
+    import pandas
+    import sklearn.cluster
+    import sklearn.decomposition
+    import sklearn.feature_extraction.text
+    worker_matrices = matrices or (
+        artifact_corpus_matrices(CorpusArtifact(artifact_path)) if artifact_path
+        else CorpusMatrices.from_tokenized_corpus(TokenizedCorpus.load(Path(corpus_folder))))
+    worker_clusterer = GNTClusterer(random_state=random_state,
+                                    max_clusters=gnt_config.auto_k_max_clusters,
+                                    metric=gnt_config.auto_k_metric,
+                                    n_jobs=gnt_config.auto_k_jobs,
+                                    patience=gnt_config.auto_k_patience)
+
+
+def warm_up() -> int:
+    """
+    Job doing nothing, used to start the worker processes.
+    """
+    return os.getpid()
+
+
+def measured_job(function: Callable, *args) -> Tuple[Any, Dict]:
+    """
+    Run a job, timing the stages of the clustering of the worker.
+
+    Returns:
+        The result of the job, and the measures of its StageTimer along
+        with its duration.
+    """
+    timer = worker_clusterer.timer
+    timer.reset(enabled=True)
+    start = time.perf_counter()
+    try:
+        result = function(*args)
+        measures = timer.measures()
+    finally:
+        timer.reset(enabled=False)
+    measures["duration"] = time.perf_counter() - start
+    return result, measures
+
+
+def encode_results(clustering_results: Union[List[Dict], Dict], response_format: str = "full") -> bytes:
+    """
+    Encode the results of a clustering as the response of the API, so
+    that it does not have to be done by the event loop of the API.
+
+    Args:
+        clustering_results (list or dict): Results of GNTClusterer, in the
+            compact format unless response_format is full.
+        response_format (str): full for the JSON of a list of
+            ClusteringResults, compact for the JSON of CompactClusteringResults,
+            msgpack for the same fields as compact encoded with msgpack, the
+            arrays being sent as little endian binary arrays (float32 of shape
+            (number of points, 3) for the projection, int32 for the clusters
+            and the points of the groups).
+    """
+    if response_format == "full":
+        return json.dumps([ClusteringResults(**result).dict() for result in clustering_results],
+                          ensure_ascii=False).encode("utf8")
+    if response_format == "msgpack":
+        import msgpack
+        return msgpack.packb(
+            {"projection": clustering_results["projection"].astype("<f4").tobytes(),
+             "labels": clustering_results["labels"],
+             "clusters": clustering_results["clusters"].astype("<i4").tobytes(),
+             "groups": [{"ground_truth": group["ground_truth"],
+                         "points": group["points"].astype("<i4").tobytes()}
+                        for group in clustering_results["groups"]],
+             "fullText": clustering_results["fullText"],
+             "n_clusters": clustering_results["n_clusters"],
+             "scores": clustering_results["scores"]})
+    projection = clustering_results["projection"]
+    return json.dumps(
+        {"projection": {"x": projection[:, 0].tolist(),
+                        "y": projection[:, 1].tolist(),
+                        "z": projection[:, 2].tolist()},
+         "labels": clustering_results["labels"],
+         "clusters": clustering_results["clusters"].tolist(),
+         "groups": [{"ground_truth": group["ground_truth"],
+                     "points": group["points"].tolist()}
+                    for group in clustering_results["groups"]],
+         "fullText": clustering_results["fullText"],
+         "n_clusters": clustering_results["n_clusters"],
+         "scores": clustering_results["scores"]},
+        ensure_ascii=False).encode("utf8")
+
+
+def cluster_job(granularity: str, books: List[str], n_clusters: int = 10, ground_truth: List[str] = None, response_format: str = "full", full_text: bool = True) -> bytes:
+    """
+    Perform the clustering of the matrix of the granularity, restricted to the books.
+
+    Args:
+        granularity (str): books, chapters or verses.
+        books (list): The books to cluster, all of them if empty.
+        n_clusters (int): Number of clusters to use, selected automatically if None.
+        ground_truth (list): The ground truth group of each row, the book
+            of each row if not set.
+        response_format (str): full, compact or msgpack, see encode_results.
+        full_text (bool): Whether to send the texts back in the compact formats.
+    """
+    matrix = worker_matrices[granularity].select(books)
+    compact = response_format != "full"
+    results = worker_clusterer.pipeline_from_counts(matrix.counts,
+                                                    names=matrix.names,
+                                                    n_clusters=n_clusters,
+                                                    ground_truth=ground_truth or matrix.books,
+                                                    text_corpus=matrix.texts if full_text or not compact else None,
+                                                    compact=compact)
+    with worker_clusterer.timer.stage("encode"):
+        return encode_results(results, response_format)
+
+
+def incremental_cluster_job(granularity: str, books: List[str], n_clusters: int = 10, ground_truth: List[str] = None, response_format: str = "full", full_text: bool = True, state: ClusteringState = None, min_overlap: float = 0.8) -> Tuple[bytes, ClusteringState]:
+    """
+    Perform the clustering of the matrix of the granularity, restricted to the
+    books, warm-starting it from the state of a previous run of the same session.
+
+    Args:
+        granularity (str): books, chapters or verses.
+        books (list): The books to cluster, all of them if empty.
+        n_clusters (int): Number of clusters to use, selected automatically if None.
+        ground_truth (list): The ground truth group of each row, the book
+            of each row if not set.
+        response_format (str): full, compact or msgpack, see encode_results.
+        full_text (bool): Whether to send the texts back in the compact formats.
+        state (ClusteringState): State of the previous run of the session.
+        min_overlap (float): Minimum overlap of the rows of the previous run
+            and of the current one to warm-start it.
+    """
+    matrix = worker_matrices[granularity]
+    rows = matrix.rows(books)
+    compact = response_format != "full"
+    results, state = worker_clusterer.incremental_pipeline(
+        matrix.counts, rows, state=state, min_overlap=min_overlap,
+        n_clusters=n_clusters,
+        names=[matrix.names[row] for row in rows],
+        ground_truth=ground_truth or [matrix.books[row] for row in rows],
+        text_corpus=[matrix.texts[row] for row in rows] if full_text or not compact else None,
+        compact=compact)
+    with worker_clusterer.timer.stage("encode"):
+        return encode_results(results, response_format), state
+
+
+def hierarchical_cluster_job(granularity: str, books: List[str], n_clusters: int = None, distance: float = None, ground_truth: List[str] = None, response_format: str = "full", full_text: bool = True, tree: ClusteringTree = None, max_leaves: int = None) -> Tuple[bytes, ClusteringTree]:
+    """
+    Perform the hierarchical clustering of the matrix of the granularity,
+    restricted to the books, cutting the linkage tree of a previous run on
+    the same books if it is given.
+
+    Args:
+        granularity (str): books, chapters or verses.
+        books (list): The books to cluster, all of them if empty.
+        n_clusters (int): Number of clusters to cut the tree into.
+        distance (float): Distance to cut the tree at, if n_clusters is not set.
+        ground_truth (list): The ground truth group of each row, the book
+            of each row if not set.
+        response_format (str): full, compact or msgpack, see encode_results.
+        full_text (bool): Whether to send the texts back in the compact formats.
+        tree (ClusteringTree): Linkage tree of the books, if already computed.
+        max_leaves (int): Maximum number of leaves of the tree.
+    """
+    matrix = worker_matrices[granularity].select(books)
+    compact = response_format != "full"
+    results, tree = worker_clusterer.hierarchical_pipeline(
+        matrix.counts, n_clusters=n_clusters, distance=distance,
+        names=matrix.names,
+        ground_truth=ground_truth or matrix.books,
+        text_corpus=matrix.texts if full_text or not compact else None,
+        compact=compact, tree=tree, max_leaves=max_leaves)
+    with worker_clusterer.timer.stage("encode"):
+        return encode_results(results, response_format), tree
+
+
+def linkage_job(granularity: str, books: List[str], max_leaves: int = None) -> Optional[ClusteringTree]:
+    """
+    Compute the linkage tree of the matrix of the granularity, restricted to
+    the books, None if there are too few texts to cluster.
+    """
+    counts = worker_matrices[granularity].select(books).counts
+    if counts.shape[0] < 3:
+        return None
+    return worker_clusterer.linkage_tree(
+        worker_clusterer.reduce(worker_clusterer.tf_idf_transformer(counts, sparse=True), dimension=15),
+        max_leaves=max_leaves)
+
+
+def stream_cluster_job(books: List[str], n_clusters: int = 10, batch_size: int = 1000, response_format: str = "full", full_text: bool = True) -> bytes:
+    """
+    Perform the clustering of the verses of the books, chunk by chunk.
+
+    Args:
+        books (list): The books to cluster, all of them if empty.
+        n_clusters (int): Number of clusters to use, selected automatically if None.
+        batch_size (int): Number of verses processed at once.
+        response_format (str): full, compact or msgpack, see encode_results.
+        full_text (bool): Whether to send the texts back in the compact formats.
+    """
+    matrix = worker_matrices["verses"]
+    rows = matrix.rows(books)
+    text_corpus = [matrix.texts[row] for row in rows]
+    names = [matrix.names[row] for row in rows]
+    ground_truth = [matrix.books[row] for row in rows]
+    streaming_clusterer = StreamingGNTClusterer(
+        n_clusters=n_clusters,
+        batch_size=batch_size,
+        random_state=worker_clusterer.random_state,
+        selector=worker_clusterer)
+    results = streaming_clusterer.pipeline(
+        lambda: iter_chunks(text_corpus, names, ground_truth, chunk_size=batch_size),
+        compact=response_format != "full", full_text=full_text)
+    with worker_clusterer.timer.stage("encode"):
+        return encode_results(results, response_format)
@@ -0,0 +1,87 @@
+"""
+Tests the cache of the clustering results.
+"""
+import json
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from gnt_api.cache import ClusteringCache, DiskBackend, MemoryBackend
+
+
+class TestClusteringCache(unittest.TestCase):
+    """
+    Test the ClusteringCache class with both of its backends.
+    """
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.backends = [MemoryBackend(max_bytes=4),
+                         DiskBackend(str(Path(self.folder.name) / "cache.sqlite"), max_bytes=4)]
+
+    def tearDown(self):
+        self.backends[1].connection.close()
+        self.folder.cleanup()
+
+    def test_make_key(self):
+        """
+        Check that the order and duplicates of the books do not change the key.
+        """
+        self.assertEqual(
+            ClusteringCache.make_key("verses", ["Mt", "Lk", "Mt"], {"n_clusters": 10}),
+            ClusteringCache.make_key("verses", ["Lk", "Mt"], {"n_clusters": 10}))
+        self.assertNotEqual(
+            ClusteringCache.make_key("verses", ["Lk", "Mt"], {"n_clusters": 10}),
+            ClusteringCache.make_key("chapters", ["Lk", "Mt"], {"n_clusters": 10}))
+
+    def test_lru_eviction(self):
+        """
+        Check that the least recently used entries are evicted first, once
+        the values take up more than max_bytes.
+        """
+        for backend in self.backends:
+            cache = ClusteringCache(backend)
+            cache.set("a", b"1")
+            cache.set("b", b"22")
+            self.assertEqual(cache.get("a"), b"1")
+            cache.set("c", b"333")
+            self.assertIsNone(cache.get("b"))
+            self.assertEqual(cache.get("a"), b"1")
+            self.assertEqual(cache.get("c"), b"333")
+            self.assertEqual(cache.stats(), {"hits": 3, "misses": 1,
+                                             "size": 2, "bytes": 4, "max_bytes": 4})
+            cache.set("d", b"4444")
+            self.assertEqual(backend.keys(), ["d"])
+        with self.assertRaises(TypeError):
+            self.backends[1].set("e", [5])
+
+    def test_ttl(self):
+        """
+        Check that the expired entries are not sent back.
+        """
+        for backend in self.backends:
+            cache = ClusteringCache(backend, ttl=0.05)
+            cache.set("a", b"1")
+            self.assertEqual(cache.get("a"), b"1")
+            time.sleep(0.1)
+            self.assertIsNone(cache.get("a"))
+
+    def test_invalidate(self):
+        """
+        Check that only the results of the changed books, or of all of the
+        books, are removed.
+        """
+        for backend in self.backends:
+            backend.max_bytes = 64
+            cache = ClusteringCache(backend)
+            for books in (["Mt"], ["Mt", "Lk"], ["Ro"], []):
+                cache.set(cache.make_key("books", books), json.dumps(books).encode())
+            self.assertEqual(cache.invalidate({"Lk"}), 2)
+            self.assertEqual(cache.get(cache.make_key("books", ["Mt"])), b'["Mt"]')
+            self.assertIsNone(cache.get(cache.make_key("books", [])))
+            self.assertEqual(cache.invalidate(None), 2)
+            self.assertEqual(len(backend), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
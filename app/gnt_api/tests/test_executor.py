@@ -0,0 +1,68 @@
+"""
+Tests the execution of the clustering jobs off the event loop of the API.
+"""
+import asyncio
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from fastapi import HTTPException
+from gnt_api.executor import ClusteringExecutor
+from gnt_api.workers import warm_up
+from gnt_nlp_utils.tokens import TokenizedCorpus
+
+
+class TestClusteringExecutor(unittest.TestCase):
+    """
+    Test the ClusteringExecutor class.
+    """
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        TokenizedCorpus.from_verses([("Jn", "1", "1", "ἐν ἀρχή "), ("Jn", "1", "2", "λόγος ")]).save(
+            Path(self.folder.name))
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def test_timed_out_job(self):
+        """
+        Test that a job running past the timeout is stopped, its worker being
+        replaced so that the next jobs do not wait for it.
+        """
+        async def scenario():
+            executor = ClusteringExecutor(workers=1, timeout=1)
+            executor.start(self.folder.name)
+            try:
+                pid = await executor.run(warm_up)
+                start = time.perf_counter()
+                with self.assertRaises(HTTPException) as context:
+                    await executor.run(time.sleep, 60)
+                self.assertEqual(context.exception.status_code, 504)
+                executor.timeout = 30
+                return pid, await executor.run(warm_up), time.perf_counter() - start, executor.replaced
+            finally:
+                executor.shutdown()
+
+        pid, new_pid, duration, replaced = asyncio.run(scenario())
+        self.assertNotEqual(pid, new_pid)
+        self.assertLess(duration, 30)
+        self.assertEqual(replaced, 1)
+
+    def test_thread_jobs(self):
+        """
+        Test that the jobs run one at a time in a thread when no worker
+        process is requested, on_start being called as each one starts.
+        """
+        async def scenario():
+            executor = ClusteringExecutor(workers=0)
+            executor.start(self.folder.name)
+            started = []
+            results = await asyncio.gather(*[executor.run(sum, [i, 1], on_start=lambda i=i: started.append(i))
+                                             for i in range(3)])
+            executor.shutdown()
+            return results, started
+
+        results, started = asyncio.run(scenario())
+        self.assertEqual(results, [1, 2, 3])
+        self.assertEqual(started, [0, 1, 2])
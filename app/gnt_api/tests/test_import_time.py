@@ -0,0 +1,34 @@
+"""
+Tests the import time of the API, which is paid at each start of a container.
+"""
+import json
+import os
+import subprocess
+import sys
+import unittest
+
+# Number of seconds the import of the API may take, generous enough for slow machines
+IMPORT_TIME_BUDGET = float(os.environ.get("GNT_IMPORT_TIME_BUDGET", 2))
+
+IMPORT_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import gnt_api.main
+print(json.dumps({"duration": time.perf_counter() - start,
+                  "modules": [module for module in ("pandas", "scipy", "sklearn")
+                              if module in sys.modules]}))
+"""
+
+
+class TestImportTime(unittest.TestCase):
+    """
+    Test that importing the API does not import the scientific libraries
+    nor fetch anything over the network.
+    """
+
+    def test_import_time(self):
+        output = subprocess.run([sys.executable, "-c", IMPORT_SCRIPT],
+                                capture_output=True, check=True, text=True).stdout
+        result = json.loads(output.splitlines()[-1])
+        self.assertEqual(result["modules"], [])
+        self.assertLess(result["duration"], IMPORT_TIME_BUDGET)
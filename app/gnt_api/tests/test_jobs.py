@@ -0,0 +1,90 @@
+"""
+Tests the manager of the asynchronous clustering jobs.
+"""
+import asyncio
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from gnt_api.executor import ClusteringExecutor
+from gnt_api.jobs import JobManager
+from gnt_nlp_utils.tokens import TokenizedCorpus
+
+
+class TestJobManager(unittest.TestCase):
+    """
+    Test the JobManager class.
+    """
+
+    def test_coalesced_jobs(self):
+        """
+        Test that identical running jobs are computed once, and that only
+        the last finished jobs are kept.
+        """
+        calls = []
+
+        async def compute(job):
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return b"result"
+
+        async def scenario():
+            manager = JobManager(max_completed=1)
+            first = manager.submit("key", compute)
+            self.assertIs(manager.submit("key", compute), first)
+            await manager.wait(first, timeout=1)
+            self.assertEqual(first.status, "done")
+            self.assertEqual(first.result, b"result")
+            other = manager.submit("other", compute)
+            await manager.wait(other, timeout=1)
+            self.assertIsNone(manager.get(first.id))
+            self.assertIs(manager.get(other.id), other)
+            self.assertEqual(manager.stats()["coalesced"], 1)
+        asyncio.run(scenario())
+        self.assertEqual(len(calls), 2)
+
+    def test_failed_job(self):
+        """
+        Test that the error of a failed job is kept.
+        """
+        async def compute(job):
+            raise ValueError("boom")
+
+        async def scenario():
+            manager = JobManager()
+            job = manager.submit("key", compute)
+            await manager.wait(job, timeout=1)
+            self.assertEqual(job.status, "failed")
+            self.assertEqual(job.error, "boom")
+            self.assertEqual(manager.stats()["queue_depth"], 0)
+        asyncio.run(scenario())
+
+    def test_running_job(self):
+        """
+        Test that a job is pending until the worker picks it up, and running
+        until it is done.
+        """
+        async def scenario(folder: str):
+            executor = ClusteringExecutor(workers=0)
+            executor.start(folder)
+
+            async def compute(job):
+                return await executor.run(time.sleep, 0.2, on_start=job.start)
+            manager = JobManager()
+            first = manager.submit("first", compute)
+            second = manager.submit("second", compute)
+            await asyncio.sleep(0.1)
+            statuses = [first.status_dict()["status"], second.status]
+            await manager.wait(first, timeout=1)
+            await asyncio.sleep(0.1)
+            statuses += [first.status, second.status]
+            await manager.wait(second, timeout=1)
+            executor.shutdown()
+            return statuses + [second.status], second
+
+        with tempfile.TemporaryDirectory() as folder:
+            TokenizedCorpus.from_verses([("Jn", "1", "1", "ἐν ἀρχή "), ("Jn", "1", "2", "λόγος ")]).save(Path(folder))
+            statuses, job = asyncio.run(scenario(folder))
+        self.assertEqual(statuses, ["running", "pending", "done", "running", "done"])
+        self.assertLessEqual(job.submitted, job.started)
+        self.assertLessEqual(job.started, job.finished)
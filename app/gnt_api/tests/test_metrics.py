@@ -0,0 +1,58 @@
+"""
+Tests the instrumentation of the API.
+"""
+import asyncio
+import unittest
+from gnt_api.metrics import MetricsRegistry, format_server_timing, request_timings, instrument_database, db_call_seconds
+from gnt_nlp_utils.timing import StageTimer
+
+
+class TestMetrics(unittest.TestCase):
+    """
+    Test the metrics and the timers of the stages.
+    """
+
+    def test_render(self):
+        """
+        Test the Prometheus text format of the metrics.
+        """
+        registry = MetricsRegistry()
+        histogram = registry.histogram("duration_seconds", "Duration", ["stage"], buckets=(0.1, 1))
+        histogram.observe(0.05, stage="reduce")
+        histogram.observe(0.5, stage="reduce")
+        registry.gauge("entries", "Entries", function=lambda: 3)
+        lines = registry.render().splitlines()
+        self.assertIn('duration_seconds_bucket{stage="reduce",le="0.1"} 1', lines)
+        self.assertIn('duration_seconds_bucket{stage="reduce",le="1.0"} 2', lines)
+        self.assertIn('duration_seconds_bucket{stage="reduce",le="+Inf"} 2', lines)
+        self.assertIn('duration_seconds_count{stage="reduce"} 2', lines)
+        self.assertIn("# TYPE entries gauge", lines)
+        self.assertIn("entries 3", lines)
+
+    def test_timings(self):
+        """
+        Test that the timers only record when enabled, and that the database
+        calls are added to the Server-Timing header of the current request.
+        """
+        timer = StageTimer()
+        with timer.stage("reduce"):
+            pass
+        self.assertEqual(timer.measures()["stages"], [])
+        timer.reset(enabled=True)
+        with timer.stage("reduce"):
+            pass
+        self.assertEqual([name for name, _ in timer.measures()["stages"]], ["reduce"])
+
+        class Connector:
+            async def get_texts(self):
+                return []
+
+        connector = Connector()
+        instrument_database(connector, ["get_texts"])
+        timings = []
+        token = request_timings.set(timings)
+        asyncio.run(connector.get_texts())
+        request_timings.reset(token)
+        self.assertEqual([name for name, _ in timings], ["db_get_texts"])
+        self.assertIn(("get_texts",), db_call_seconds.counts)
+        self.assertRegex(format_server_timing(timings + timings), r"^db_get_texts;dur=\d+\.\d$")
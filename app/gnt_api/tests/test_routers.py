@@ -0,0 +1,108 @@
+"""
+Tests the endpoints of the API, served out of a SQLite database holding a
+few books.
+"""
+import asyncio
+import tempfile
+import unittest
+from pathlib import Path
+from fastapi.testclient import TestClient
+from gnt_api.config import gnt_config
+from gnt_core.database_filler import DataBaseFiller, build_manifest
+from gnt_core.sources import SOURCE_FORMATS
+
+BOOKS = ("61-Mt", "62-Mk", "63-Lk", "64-Jn", "78-Phm", "85-3Jn")
+
+
+async def fill(path: str, books=BOOKS) -> None:
+    """
+    Fill up the SQLite database at path with the books of the SBLGNT.
+    """
+    filler = DataBaseFiller(storage_backend="sqlite", sqlite_path=path)
+    files = [(source, file) for source, file in filler.source_files(["sblgnt"]) if file.name.startswith(books)]
+    for source, file in files:
+        filler.add_book(SOURCE_FORMATS[source].load_book(file))
+    await filler.connect()
+    await asyncio.gather(filler.write_book_classes(), filler.write_booklist(), filler.write_texts(),
+                         filler.write_chapters(), filler.write_verses())
+    verse_documents = filler.build_verse_documents()
+    await filler.write_verse_documents(verse_documents)
+    await filler.write_manifest(build_manifest(
+        [filler.manifest_entry(source, file) for source, file in files], verse_documents[0]))
+    await filler.write_fill_generation()
+    await filler.database_instance.close()
+
+
+class TestRouters(unittest.TestCase):
+    """
+    Test the clustering endpoints.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.folder = tempfile.TemporaryDirectory()
+        cls.sqlite_path = str(Path(cls.folder.name) / "gnt.sqlite")
+        asyncio.run(fill(cls.sqlite_path))
+        gnt_config.storage_backend = "sqlite"
+        gnt_config.sqlite_path = cls.sqlite_path
+        gnt_config.cache_folder = str(Path(cls.folder.name) / "cache")
+        gnt_config.corpus_artifact = None
+        gnt_config.corpus_refresh_interval = 0
+        gnt_config.workers = 1
+        # The instances of the API are built out of the configuration on import
+        from gnt_api.main import app
+        cls.client = TestClient(app)
+        cls.client.__enter__()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.client.__exit__(None, None, None)
+        cls.folder.cleanup()
+
+    def test_refill(self):
+        """
+        Test that the books of the new fill of the database are clustered
+        once it is reloaded, the matrices, the workers and the caches being
+        reloaded along with the texts, and that only the cached results of
+        the books filled again are removed.
+        """
+        from gnt_api.corpus import reload_corpus
+        from gnt_api.instances import clustering_executor, corpus_store, database_instance
+        for path in ["/clusterize/chapters?book=Mt&book=Phm", "/clusterize/chapters?book=Mk&book=Lk"]:
+            self.assertEqual(self.client.post(path).status_code, 200)
+        self.assertEqual(self.client.get("/cache").json()["size"], 2)
+        # Fill up the same books again
+        pools = list(clustering_executor.pools)
+        asyncio.run(fill(self.sqlite_path))
+        self.assertTrue(self.client.portal.call(corpus_store.refresh, database_instance, reload_corpus))
+        self.assertEqual(clustering_executor.pools, pools)
+        self.assertEqual(self.client.get("/cache").json()["size"], 2)
+        # Replace Philemon by Jude
+        asyncio.run(fill(self.sqlite_path, BOOKS[:-2] + ("85-3Jn", "86-Jud")))
+        self.assertTrue(self.client.portal.call(corpus_store.refresh, database_instance, reload_corpus))
+        self.assertNotEqual(clustering_executor.pools, pools)
+        self.assertEqual(self.client.get("/cache").json()["size"], 1)
+        self.assertEqual(self.client.post("/clusterize/chapters?book=Mt&book=Phm").status_code, 404)
+        response = self.client.post("/clusterize/chapters?book=Mt&book=Jud")
+        self.assertEqual(response.status_code, 200)
+        labels = [label for result in response.json() for label in result["labels"]]
+        self.assertEqual(len(labels), 28 + 1)
+        self.assertIn("1Jud", labels)
+
+    def test_small_selections(self):
+        """
+        Test that the selections of less than three texts give no results,
+        and that the unknown books are not found.
+        """
+        for path in ["/clusterize?book=Mt", "/clusterize?book=Mt&book=Mk",
+                     "/clusterize/chapters?book=3Jn"]:
+            response = self.client.post(path)
+            self.assertEqual(response.status_code, 200, path)
+            self.assertEqual(response.json(), [], path)
+        response = self.client.post("/clusterize?book=Mt&book=Mk&book=Lk", params={"n_clusters": 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sorted(label for result in response.json() for label in result["labels"]),
+                         ["Lk", "Mk", "Mt"])
+        response = self.client.post("/clusterize?book=Xyz")
+        self.assertEqual(response.status_code, 404)
+        self.assertIn("Xyz", response.json()["detail"])
@@ -0,0 +1,88 @@
+"""
+Tests the corpus kept in memory by the API.
+"""
+import asyncio
+import unittest
+from gnt_api.store import CorpusStore
+
+
+class Database:
+    """
+    Database holding the verses of a single book, filled again by fill.
+    """
+
+    def __init__(self) -> None:
+        self.generation = None
+        self.verses = [{"book": "Jn", "verses": {"1": {"1": "ἐν ἀρχή ", "2": "οὗτος εἰμί "}, "2": {"1": "καί "}}}]
+
+    def fill(self, generation: str) -> None:
+        self.generation = generation
+        self.verses = [{"book": "Jn", "verses": {"1": {"1": "λόγος "}}}]
+
+    async def get_fill_generation(self):
+        return self.generation
+
+    async def iter_verses(self):
+        for book_data in self.verses:
+            yield book_data
+
+    async def get_texts(self, text_list=None):
+        return []
+
+    async def get_book_lists(self):
+        return [{"books": ["Jn"]}]
+
+    async def get_book_classes_nt(self):
+        return [{"group": "Gospels", "books": ["Jn"]}]
+
+    async def get_book_classes_ot(self):
+        return []
+
+
+class TestCorpusStore(unittest.TestCase):
+    """
+    Test the lookups of the snapshot of the corpus and its reloads.
+    """
+
+    def test_refresh(self):
+        """
+        Test that the content is the one of the database, and that it is only
+        reloaded once the database is filled again.
+        """
+        database, store = Database(), CorpusStore()
+        asyncio.run(store.load(database))
+        snapshot = store.snapshot
+        self.assertEqual(snapshot.get_verses(["Jn"]), database.verses)
+        self.assertEqual(snapshot.get_chapters(), [{"book": "Jn", "chapters": {"1": "ἐν ἀρχή οὗτος εἰμί ", "2": "καί "}}])
+        self.assertEqual(snapshot.verse("Jn", "1", "2"), "οὗτος εἰμί ")
+        self.assertEqual(snapshot.get_book_class(["Jn"]), ["Gospels"])
+        self.assertFalse(asyncio.run(store.refresh(database)))
+        database.fill("new")
+        self.assertTrue(asyncio.run(store.refresh(database)))
+        self.assertEqual(store.generation, "new")
+        self.assertEqual(store.snapshot.get_texts(), [{"book": "Jn", "text": "λόγος "}])
+        # The previous snapshot is left untouched for the requests reading it
+        self.assertEqual(snapshot.book("Jn"), "ἐν ἀρχή οὗτος εἰμί καί ")
+
+    def test_failed_reload(self):
+        """
+        Test that a reload which failed is attempted again on the next
+        refresh, even though the snapshot was already replaced.
+        """
+        database, store = Database(), CorpusStore()
+        asyncio.run(store.load(database))
+        reloads = []
+
+        async def on_reload():
+            reloads.append(store.generation)
+            if len(reloads) == 1:
+                raise RuntimeError("workers could not start")
+
+        database.fill("new")
+        with self.assertRaises(RuntimeError):
+            asyncio.run(store.refresh(database, on_reload))
+        self.assertEqual(store.generation, "new")
+        self.assertTrue(asyncio.run(store.refresh(database, on_reload)))
+        self.assertFalse(asyncio.run(store.refresh(database, on_reload)))
+        self.assertEqual(reloads, ["new", "new"])
+        self.assertEqual(store.reloads, 2)
@@ -0,0 +1,80 @@
+"""
+Tests the corpus matrices the worker processes load from the compiled corpus.
+"""
+import json
+import tempfile
+import unittest
+from pathlib import Path
+from gnt_api import workers
+from gnt_api.workers import artifact_corpus_matrices, artifact_tokenized_corpus, cluster_job, initialize_worker
+from gnt_core.artifact import CorpusArtifact, compile_corpus
+from gnt_core.database_filler import DataBaseFiller
+from gnt_core.sources import SOURCE_FORMATS
+from gnt_nlp_utils import get_stop_words
+from gnt_nlp_utils.matrices import CorpusMatrices
+from gnt_nlp_utils.tokens import GRANULARITIES
+
+
+class TestArtifactMatrices(unittest.TestCase):
+    """
+    Test the count matrices mapped from the compiled corpus.
+    """
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.files = [(source, file) for source, file in DataBaseFiller.source_files(["sblgnt"])
+                      if file.name.startswith(("78-Phm", "85-3Jn", "86-Jud"))]
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def compile(self, stop_words) -> Path:
+        """
+        Compile the books into the temporary folder, with stop words.
+        """
+        path = Path(self.folder.name) / "corpus.bin"
+        compile_corpus(path, [(SOURCE_FORMATS[source], file) for source, file in self.files],
+                       [DataBaseFiller.manifest_entry(source, file) for source, file in self.files],
+                       stop_words=stop_words)
+        return path
+
+    def assert_same_matrices(self, matrices: CorpusMatrices, expected: CorpusMatrices) -> None:
+        for granularity in GRANULARITIES:
+            self.assertEqual((matrices[granularity].counts != expected[granularity].counts).nnz, 0, granularity)
+            self.assertEqual(matrices[granularity].vocabulary, expected[granularity].vocabulary)
+            self.assertEqual(matrices[granularity].names, expected[granularity].names)
+            self.assertEqual(matrices[granularity].books, expected[granularity].books)
+            self.assertEqual(list(matrices[granularity].texts), expected[granularity].texts)
+
+    def test_mapped_matrices(self):
+        """
+        Test that the matrices mapped from the compiled corpus are the ones
+        built from its tokens, their arrays being the ones of the mapping,
+        and that the workers cluster them.
+        """
+        path = self.compile(get_stop_words())
+        with CorpusArtifact(path) as artifact:
+            matrices = artifact_corpus_matrices(artifact)
+            self.assert_same_matrices(matrices, CorpusMatrices.from_tokenized_corpus(artifact_tokenized_corpus(artifact)))
+            counts = matrices["verses"].counts
+            self.assertEqual([(array.flags.owndata, array.flags.writeable)
+                              for array in (counts.data, counts.indices, counts.indptr)], [(False, False)] * 3)
+            self.assertEqual(matrices["chapters"].select(["Jud"]).texts, [matrices["chapters"].texts[-1]])
+            # The file cannot be unmapped while its arrays are referenced
+            del matrices, counts
+        try:
+            initialize_worker(self.folder.name, artifact_path=str(path))
+            results = json.loads(cluster_job("verses", ["Phm", "3Jn"], n_clusters=2))
+            self.assertEqual(len([label for result in results for label in result["labels"]]), 25 + 15)
+        finally:
+            workers.worker_matrices = workers.worker_clusterer = None
+
+    def test_other_stop_words(self):
+        """
+        Test that the matrices of a corpus compiled with other stop words are
+        built from its tokens.
+        """
+        with CorpusArtifact(self.compile(())) as artifact:
+            self.assertEqual(artifact.stop_words, [])
+            self.assert_same_matrices(artifact_corpus_matrices(artifact),
+                                      CorpusMatrices.from_tokenized_corpus(artifact_tokenized_corpus(artifact)))
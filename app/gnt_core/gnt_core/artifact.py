@@ -0,0 +1,518 @@
+"""
+Python module to compile the source files of the corpora into a single
+binary file, read by memory-mapping it rather than by parsing the source
+files again. The processes mapping the same file share its pages through
+the page cache of the system.
+
+The file is made of a magic number, the size of a JSON header and of arrays
+of integers, in the byte order of the header and aligned on 8 bytes:
+    - The vocabulary of the lemmas and the vocabulary of the tokens, as the
+      offsets of each string within their concatenated UTF-8 bytes
+    - The lemma, part of speech and parsing code of each word
+    - The offsets of the chapters of each book, of the verses of each
+      chapter and of the words of each verse, along with the label of each
+      chapter and verse
+    - The verses of each book in the order of their words in the source file
+    - The token ids of all of the verses, with the offsets of the tokens of
+      each verse, the tokens being the ones of TOKEN_PATTERN
+    - The counts of the tokens of each book, chapter and verse which are not
+      stop words, as the row offsets, the column indices and the values of
+      a CSR matrix, so that the processes mapping the file share their
+      count matrices rather than building their own
+
+The header holds the version of the format, the manifest of the source files
+the file was compiled from, the stop words left out of the counts, the books,
+the labels of the chapters and verses, the parts of speech, the parsing codes
+and the position of each array.
+"""
+import json
+import mmap
+import os
+import re
+import struct
+import sys
+import time
+from array import array
+from collections import Counter
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple, Union
+from loguru import logger
+from gnt_core.sources import BookRecords, SourceFormat, join_words
+from gnt_core.storage import passage_number
+
+# Pattern of the tokens of a text, the same as the one of sklearn vectorizers,
+# so that the token ids of the verses match the columns of their matrices
+TOKEN_PATTERN = re.compile(r"(?u)\b\w\w+\b")
+# Magic number starting the file, and version of its format, to increase
+# whenever it changes so that the files of the previous format are compiled again
+MAGIC = b"GNTCORP\x00"
+FORMAT_VERSION = 2
+# Magic number and size of the header
+PREAMBLE = struct.Struct("<8sQ")
+ALIGNMENT = 8
+# Granularities of the count matrices, the same as the ones of the tokenized corpus
+GRANULARITIES = ("books", "chapters", "verses")
+# Type code of the items of each array of the file
+SECTIONS = {
+    "lemma_offsets": "I",
+    "lemma_data": "B",
+    "token_offsets": "I",
+    "token_data": "B",
+    "word_lemmas": "I",
+    "word_parts_of_speech": "B",
+    "word_parsings": "H",
+    "book_chapters": "I",
+    "chapter_labels": "H",
+    "chapter_verses": "I",
+    "verse_labels": "H",
+    "verse_words": "I",
+    "text_verses": "I",
+    "verse_tokens": "q",
+    "token_ids": "i",
+    "books_indptr": "i",
+    "books_indices": "i",
+    "books_counts": "i",
+    "chapters_indptr": "i",
+    "chapters_indices": "i",
+    "chapters_counts": "i",
+    "verses_indptr": "i",
+    "verses_indices": "i",
+    "verses_counts": "i"}
+
+
+class BookWords(NamedTuple):
+    """
+    Words of a book along with their morphology, grouped by chapter and by
+    verse, and the index of each verse in the order of the source file.
+    """
+    book: str
+    chapters: Dict[str, Dict[str, List[Tuple[str, str, str]]]]
+    text_verses: List[int]
+
+
+def parse_book_words(source_format: SourceFormat, file: Path) -> BookWords:
+    """
+    Parse the words of a source file, in a worker process of the compilation.
+
+    Raises:
+        ValueError: If the words of a verse are not contiguous in the file.
+    """
+    chapters: Dict[str, Dict[str, List[Tuple[str, str, str]]]] = {}
+    file_verses: List[Tuple[str, str]] = []
+    for chapter, verse, word, part_of_speech, parsing in source_format.iter_analyzed_words(file):
+        verses = chapters.setdefault(chapter, {})
+        if verse not in verses:
+            verses[verse] = []
+            file_verses.append((chapter, verse))
+        elif file_verses[-1] != (chapter, verse):
+            raise ValueError(f"The words of verse {chapter}.{verse} of {file.name} are not contiguous")
+        verses[verse].append((word, part_of_speech, parsing))
+    verse_indexes = {key: index for index, key in enumerate(
+        (chapter, verse) for chapter, verses in chapters.items() for verse in verses)}
+    return BookWords(source_format.book_name(file), chapters, [verse_indexes[key] for key in file_verses])
+
+
+def aligned(size: int) -> int:
+    """
+    Round a size up to the alignment of the arrays of the file.
+    """
+    return -(-size // ALIGNMENT) * ALIGNMENT
+
+
+def string_table(strings: List[str]) -> Tuple[array, array]:
+    """
+    Get the offsets of strings within their concatenated UTF-8 bytes, followed
+    by the total number of bytes, and these bytes.
+    """
+    encoded = [string.encode("utf8") for string in strings]
+    offsets = array("I", [0])
+    for string in encoded:
+        offsets.append(offsets[-1] + len(string))
+    return offsets, array("B", b"".join(encoded))
+
+
+def granularity_segments(granularity: str, book_chapters: Sequence[int], chapter_verses: Sequence[int]) -> Sequence[int]:
+    """
+    Get the index of the first verse of each book, chapter or verse,
+    followed by the number of verses, from the offsets of the chapters of
+    each book and of the verses of each chapter.
+    """
+    if granularity == "verses":
+        return range(chapter_verses[-1] + 1)
+    if granularity == "chapters":
+        return chapter_verses
+    if granularity == "books":
+        return [chapter_verses[chapter_index] for chapter_index in book_chapters]
+    raise ValueError(f"Unknown granularity {granularity}")
+
+
+def count_table(token_ids: Sequence[int], verse_tokens: Sequence[int], segments: Sequence[int], stop_ids: Iterable[int]) -> Tuple[array, array, array]:
+    """
+    Count the tokens of each segment of verses which are not stop words, as
+    the row offsets, the column indices, sorted in each row, and the values
+    of a CSR matrix.
+    """
+    stop_ids = set(stop_ids)
+    indptr, indices, counts = array("i", [0]), array("i"), array("i")
+    for start, end in zip(segments, segments[1:]):
+        segment_counts = Counter(token_id for token_id in token_ids[verse_tokens[start]:verse_tokens[end]]
+                                 if token_id not in stop_ids)
+        for token_id in sorted(segment_counts):
+            indices.append(token_id)
+            counts.append(segment_counts[token_id])
+        indptr.append(len(indices))
+    return indptr, indices, counts
+
+
+def compile_corpus(path: Path, files: List[Tuple[SourceFormat, Path]], manifest: List[Dict], map_function: Callable = map, stop_words: Iterable[str] = ()) -> None:
+    """
+    Compile source files into the file of path, replacing it at once so that
+    the processes mapping the previous one keep on reading it.
+
+    Args:
+        path (Path): The file to write down.
+        files (list): The source files, along with their format, each of them
+            being a book.
+        manifest (list): The manifest entry of the book of each file, see
+            DataBaseFiller.manifest_entry.
+        map_function (callable): Function mapping parse_book_words over
+            the formats and the files, such as the map of an executor.
+        stop_words (iterable): The tokens left out of the count matrices,
+            such as the stop words of the NLP utils.
+    """
+    books: List[BookWords] = list(map_function(
+        parse_book_words, [source_format for source_format, _ in files], [file for _, file in files]))
+    lemmas = sorted({word for book_words in books for verses in book_words.chapters.values()
+                     for words in verses.values() for word, _, _ in words})
+    lemma_ids = {lemma: lemma_id for lemma_id, lemma in enumerate(lemmas)}
+    lemma_tokens = [TOKEN_PATTERN.findall(lemma.lower()) for lemma in lemmas]
+    vocabulary = sorted({token for tokens in lemma_tokens for token in tokens})
+    token_ids = {token: token_id for token_id, token in enumerate(vocabulary)}
+    lemma_token_ids = [[token_ids[token] for token in tokens] for tokens in lemma_tokens]
+    labels: Dict[str, int] = {}
+    parts_of_speech: Dict[str, int] = {"": 0}
+    parsings: Dict[str, int] = {"": 0}
+    sections = {name: array(type_code) for name, type_code in SECTIONS.items()}
+    sections["lemma_offsets"], sections["lemma_data"] = string_table(lemmas)
+    sections["token_offsets"], sections["token_data"] = string_table(vocabulary)
+    for name in ("book_chapters", "chapter_verses", "verse_words", "verse_tokens"):
+        sections[name].append(0)
+    for book_words in books:
+        first_verse = len(sections["verse_labels"])
+        for chapter, verses in book_words.chapters.items():
+            sections["chapter_labels"].append(labels.setdefault(chapter, len(labels)))
+            for verse, words in verses.items():
+                sections["verse_labels"].append(labels.setdefault(verse, len(labels)))
+                for word, part_of_speech, parsing in words:
+                    lemma_id = lemma_ids[word]
+                    sections["word_lemmas"].append(lemma_id)
+                    sections["word_parts_of_speech"].append(parts_of_speech.setdefault(part_of_speech, len(parts_of_speech)))
+                    sections["word_parsings"].append(parsings.setdefault(parsing, len(parsings)))
+                    sections["token_ids"].extend(lemma_token_ids[lemma_id])
+                sections["verse_words"].append(len(sections["word_lemmas"]))
+                sections["verse_tokens"].append(len(sections["token_ids"]))
+            sections["chapter_verses"].append(len(sections["verse_labels"]))
+        sections["book_chapters"].append(len(sections["chapter_labels"]))
+        sections["text_verses"].extend(first_verse + index for index in book_words.text_verses)
+    stop_words = sorted({stop_word.lower() for stop_word in stop_words})
+    stop_ids = [token_ids[stop_word] for stop_word in stop_words if stop_word in token_ids]
+    for granularity in GRANULARITIES:
+        sections[f"{granularity}_indptr"], sections[f"{granularity}_indices"], sections[f"{granularity}_counts"] = count_table(
+            sections["token_ids"], sections["verse_tokens"],
+            granularity_segments(granularity, sections["book_chapters"], sections["chapter_verses"]), stop_ids)
+    header = {"format_version": FORMAT_VERSION,
+              "byteorder": sys.byteorder,
+              "manifest": manifest,
+              "stop_words": stop_words,
+              "books": [book_words.book for book_words in books],
+              "labels": list(labels),
+              "parts_of_speech": list(parts_of_speech),
+              "parsings": list(parsings),
+              "sections": {}}
+    offset = 0
+    for name, section in sections.items():
+        header["sections"][name] = [offset, section.typecode, len(section)]
+        offset += aligned(len(section) * section.itemsize)
+    encoded_header = json.dumps(header, ensure_ascii=False).encode("utf8")
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temporary_path = path.with_name(path.name + ".tmp")
+    with open(temporary_path, "wb") as file:
+        file.write(PREAMBLE.pack(MAGIC, len(encoded_header)))
+        file.write(encoded_header.ljust(aligned(len(encoded_header)), b" "))
+        for section in sections.values():
+            data = section.tobytes()
+            file.write(data.ljust(aligned(len(data)), b"\x00"))
+    os.replace(temporary_path, path)
+
+
+class CorpusArtifact:
+    """
+    Python class to read the corpus compiled by compile_corpus, the file
+    being memory-mapped and its arrays read as memoryviews of the mapping,
+    without copying them.
+    """
+
+    def __init__(self, path: Path) -> None:
+        """
+        Initializes an object of class CorpusArtifact, mapping the file in memory.
+
+        Args:
+            path (Path): The file written down by compile_corpus.
+
+        Raises:
+            ValueError: If the file is not a compiled corpus, or was compiled
+                with another version of the format or on a platform of
+                another byte order.
+        """
+        self.path = Path(path)
+        with open(self.path, "rb") as file:
+            self.buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, header_size = PREAMBLE.unpack_from(self.buffer) if len(self.buffer) >= PREAMBLE.size else (b"", 0)
+        if magic != MAGIC:
+            self.buffer.close()
+            raise ValueError(f"{self.path} is not a compiled corpus")
+        self.header = json.loads(self.buffer[PREAMBLE.size:PREAMBLE.size + header_size].decode("utf8"))
+        if self.header["format_version"] != FORMAT_VERSION or self.header["byteorder"] != sys.byteorder:
+            self.buffer.close()
+            raise ValueError(f"{self.path} was compiled with version {self.header['format_version']} of the format "
+                             f"in {self.header['byteorder']} endian byte order, not with version {FORMAT_VERSION} "
+                             f"in {sys.byteorder} endian byte order")
+        self.data_offset = PREAMBLE.size + aligned(header_size)
+        self.manifest: List[Dict] = self.header["manifest"]
+        self.stop_words: List[str] = self.header["stop_words"]
+        self.books: List[str] = self.header["books"]
+        self.labels: List[str] = self.header["labels"]
+        self.parts_of_speech: List[str] = self.header["parts_of_speech"]
+        self.parsings: List[str] = self.header["parsings"]
+        self.book_indexes = {book: index for index, book in enumerate(self.books)}
+        self.views: Dict[str, memoryview] = {}
+        self.strings: Dict[str, List[str]] = {}
+
+    def __enter__(self) -> "CorpusArtifact":
+        return self
+
+    def __exit__(self, *exception) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """
+        Unmap the file, which cannot be done while the arrays read from it are
+        still referenced outside of this object.
+        """
+        for view in self.views.values():
+            view.release()
+        self.views.clear()
+        self.buffer.close()
+
+    def section(self, name: str) -> memoryview:
+        """
+        Get an array of the file, see SECTIONS, as a memoryview of the mapping.
+        """
+        if name not in self.views:
+            offset, type_code, length = self.header["sections"][name]
+            start = self.data_offset + offset
+            with memoryview(self.buffer) as buffer:
+                self.views[name] = buffer[start:start + length * array(type_code).itemsize].cast(type_code)
+        return self.views[name]
+
+    def string_list(self, name: str) -> List[str]:
+        """
+        Decode the strings of a string table of the file, lemma or token.
+        """
+        if name not in self.strings:
+            offsets, data = self.section(f"{name}_offsets"), self.section(f"{name}_data").tobytes()
+            self.strings[name] = [data[start:end].decode("utf8") for start, end in zip(offsets, offsets[1:])]
+        return self.strings[name]
+
+    @property
+    def lemmas(self) -> List[str]:
+        """
+        Get the vocabulary of the lemmas of the words, sorted alphabetically.
+        """
+        return self.string_list("lemma")
+
+    @property
+    def vocabulary(self) -> List[str]:
+        """
+        Get the vocabulary of the tokens of the verses, sorted alphabetically.
+        """
+        return self.string_list("token")
+
+    @staticmethod
+    def manifest_key(manifest: List[Dict]) -> List[Tuple[str, str, str]]:
+        """
+        Get the book, the hash of the source file and the version of the
+        documents of each entry of a manifest.
+        """
+        return [(entry["book"], entry["hash"], entry["version"]) for entry in manifest]
+
+    def matches(self, manifest: List[Dict]) -> bool:
+        """
+        Check whether the file was compiled from the source files of a
+        manifest, such as the one of the last fill of the database.
+        """
+        return self.manifest_key(self.manifest) == self.manifest_key(manifest)
+
+    def verse_range(self, book: str) -> range:
+        """
+        Get the index of the verses of a book.
+        """
+        book_chapters, chapter_verses = self.section("book_chapters"), self.section("chapter_verses")
+        index = self.book_indexes[book]
+        return range(chapter_verses[book_chapters[index]], chapter_verses[book_chapters[index + 1]])
+
+    def verse_text(self, verse_index: int) -> str:
+        """
+        Get the text of a verse, each of its lemmas being followed by a space.
+        """
+        verse_words, lemmas = self.section("verse_words"), self.lemmas
+        return join_words([lemmas[lemma_id] for lemma_id in
+                           self.section("word_lemmas")[verse_words[verse_index]:verse_words[verse_index + 1]]])
+
+    def iter_verse_records(self, books: Optional[Iterable[str]] = None) -> Iterator[Tuple[str, str, str, str]]:
+        """
+        Iterate over the verses of books, all of them if not set, as tuples
+        of (book, chapter, verse, text).
+        """
+        book_chapters, chapter_verses = self.section("book_chapters"), self.section("chapter_verses")
+        chapter_labels, verse_labels = self.section("chapter_labels"), self.section("verse_labels")
+        for book in self.books if books is None else books:
+            index = self.book_indexes[book]
+            for chapter_index in range(book_chapters[index], book_chapters[index + 1]):
+                chapter = self.labels[chapter_labels[chapter_index]]
+                for verse_index in range(chapter_verses[chapter_index], chapter_verses[chapter_index + 1]):
+                    yield book, chapter, self.labels[verse_labels[verse_index]], self.verse_text(verse_index)
+
+    def segments(self, granularity: str) -> Sequence[int]:
+        """
+        Get the index of the first verse of each book, chapter or verse,
+        followed by the number of verses.
+        """
+        return granularity_segments(granularity, self.section("book_chapters"), self.section("chapter_verses"))
+
+    def index(self, granularity: str) -> Tuple[List[str], List[str], "SegmentTexts"]:
+        """
+        Get the name, book and text of each book, chapter or verse, as the
+        index of the tokenized corpus, the texts being decoded when read.
+        """
+        book_chapters, chapter_verses = self.section("book_chapters"), self.section("chapter_verses")
+        chapter_labels, verse_labels = self.section("chapter_labels"), self.section("verse_labels")
+        names, books = [], []
+        for index, book in enumerate(self.books):
+            if granularity == "books":
+                names.append(book)
+                books.append(book)
+                continue
+            for chapter_index in range(book_chapters[index], book_chapters[index + 1]):
+                chapter = self.labels[chapter_labels[chapter_index]]
+                if granularity == "chapters":
+                    names.append(f"{chapter}{book}")
+                    books.append(book)
+                    continue
+                for verse_index in range(chapter_verses[chapter_index], chapter_verses[chapter_index + 1]):
+                    names.append(f"{book}{chapter},{self.labels[verse_labels[verse_index]]}")
+                    books.append(book)
+        return names, books, SegmentTexts(self, self.segments(granularity))
+
+    def count_arrays(self, granularity: str) -> Tuple[memoryview, memoryview, memoryview]:
+        """
+        Get the row offsets, the column indices and the values of the CSR
+        matrix of the counts of the tokens of each book, chapter or verse
+        which are not stop words, as memoryviews of the mapping.
+        """
+        return (self.section(f"{granularity}_indptr"), self.section(f"{granularity}_indices"),
+                self.section(f"{granularity}_counts"))
+
+    def book_text(self, book: str) -> str:
+        """
+        Get the text of a book, its words being in the order of its source file.
+        """
+        verses = self.verse_range(book)
+        return "".join(self.verse_text(verse_index)
+                       for verse_index in self.section("text_verses")[verses.start:verses.stop])
+
+    def book_records(self, book: str) -> BookRecords:
+        """
+        Get the texts of a book, of each of its chapters and of each of their
+        verses, as parsed by SourceFormat.load_book.
+        """
+        verses: Dict[str, Dict[str, str]] = {}
+        for _, chapter, verse, text in self.iter_verse_records([book]):
+            verses.setdefault(chapter, {})[verse] = text
+        return BookRecords(book, self.book_text(book),
+                           {chapter: "".join(chapter_verses.values()) for chapter, chapter_verses in verses.items()},
+                           verses)
+
+    def verse_documents(self) -> Tuple[List[Dict], List[str]]:
+        """
+        Get one document per verse along with the vocabulary of the tokens,
+        as build_verse_documents of the database filler, from the tokens of
+        the verses compiled in the file.
+        """
+        token_ids, verse_tokens = self.section("token_ids"), self.section("verse_tokens")
+        verse_documents = [
+            {"ordinal": ordinal,
+             "book": book,
+             "chapter": passage_number(chapter),
+             "verse": passage_number(verse),
+             "name": f"{book}{chapter},{verse}",
+             "text": text,
+             "token_ids": token_ids[verse_tokens[ordinal]:verse_tokens[ordinal + 1]].tolist()}
+            for ordinal, (book, chapter, verse, text) in enumerate(self.iter_verse_records())]
+        return verse_documents, self.vocabulary
+
+
+class SegmentTexts(Sequence):
+    """
+    Texts of the books, chapters or verses of a compiled corpus, each of them
+    being decoded from the lemmas of its verses only when it is read.
+    """
+
+    def __init__(self, artifact: CorpusArtifact, segments: Sequence[int]) -> None:
+        """
+        Initializes an object of class SegmentTexts.
+
+        Args:
+            artifact (CorpusArtifact): The compiled corpus, kept open as long
+                as the texts are.
+            segments (sequence): The index of the first verse of each text,
+                followed by the number of verses.
+        """
+        self.artifact = artifact
+        self.segments = segments
+
+    def __len__(self) -> int:
+        return len(self.segments) - 1
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[str, List[str]]:
+        if isinstance(index, slice):
+            return [self[row] for row in range(len(self))[index]]
+        row = range(len(self))[index]
+        return " ".join(self.artifact.verse_text(verse_index)
+                        for verse_index in range(self.segments[row], self.segments[row + 1]))
+
+
+def open_artifact(path: Optional[str], manifest: List[Dict]) -> Optional[CorpusArtifact]:
+    """
+    Open the compiled corpus of path if it was compiled from the source files
+    of a manifest, such as the one of the last fill of the database.
+
+    Returns:
+        CorpusArtifact: The compiled corpus, None if path is not set, if
+            the file does not exist or if it does not match the manifest.
+    """
+    if not path or not manifest or not Path(path).exists():
+        return None
+    start = time.perf_counter()
+    try:
+        artifact = CorpusArtifact(path)
+    except ValueError as error:
+        logger.warning(f"Could not open the compiled corpus: {error}")
+        return None
+    if not artifact.matches(manifest):
+        logger.warning(f"The compiled corpus {path} does not match the source files of the database")
+        artifact.close()
+        return None
+    logger.info(f"Mapped the compiled corpus {path} in {time.perf_counter() - start:.3f}s")
+    return artifact
@@ -0,0 +1,72 @@
+# Python module to look up the group of the books, and the books of the groups
+from typing import Dict, Iterable, List, Tuple
+
+# Group of the books which are not in any of the book classes
+UNGROUPED = "Ungrouped"
+
+
+class BookGroupIndex:
+    """
+    Python class indexing the book classes both ways:
+        - The group of each book, books without group being UNGROUPED
+        - The books of each group, UNGROUPED being made of the books
+          without group
+
+    A book belonging to several groups is only indexed in the first of them,
+    so that each book has exactly one group.
+    """
+
+    def __init__(self, book_classes: Iterable[Dict], books: Iterable[str] = ()) -> None:
+        """
+        Initializes an object of class BookGroupIndex.
+
+        Args:
+            book_classes (list): The book classes, as dictionaries of group
+                and books.
+            books (list): All of the books, including the ones without group.
+        """
+        self.group_of: Dict[str, str] = {}
+        books_of: Dict[str, List[str]] = {}
+        for book_class in book_classes:
+            group_books = books_of.setdefault(book_class["group"], [])
+            for book in book_class["books"]:
+                if book not in self.group_of:
+                    self.group_of[book] = book_class["group"]
+                    group_books.append(book)
+        books_of.setdefault(UNGROUPED, []).extend(
+            book for book in books if book not in self.group_of)
+        self.books_of: Dict[str, Tuple[str, ...]] = {
+            group: tuple(group_books) for group, group_books in books_of.items()}
+
+    def group(self, book: str) -> str:
+        """
+        Get the group of a book, UNGROUPED if it has none.
+        """
+        return self.group_of.get(book, UNGROUPED)
+
+    def groups(self, books: Iterable[str]) -> List[str]:
+        """
+        Get the group of each book, so that the groups are aligned with the books.
+        """
+        return [self.group_of.get(book, UNGROUPED) for book in books]
+
+    def contains(self, group: str, book: str) -> bool:
+        """
+        Check whether a book belongs to a group.
+        """
+        return self.group(book) == group
+
+    def unknown_groups(self, groups: Iterable[str]) -> List[str]:
+        """
+        Get the groups which are not indexed.
+        """
+        return [group for group in groups if group not in self.books_of]
+
+    def books(self, groups: Iterable[str]) -> List[str]:
+        """
+        Get the books of the groups, in the order of the groups.
+
+        Raises:
+            KeyError: If a group is not indexed.
+        """
+        return [book for group in groups for book in self.books_of[group]]
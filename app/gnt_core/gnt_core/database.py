@@ -1,6 +1,9 @@
 # Python module to get the data from the mongo DB database
-from typing import List, Optional, Dict
+import asyncio
+from typing import Any, AsyncIterator, Iterable, List, Optional, Dict
 from loguru import logger
+from pymongo import ASCENDING, DeleteMany, IndexModel, ReplaceOne
+from gnt_core.storage import VERSE_FIELDS, StorageBackend
 from motor.motor_asyncio import (
     AsyncIOMotorClient,
     AsyncIOMotorDatabase,
@@ -8,7 +11,7 @@ from motor.motor_asyncio import (
 )
 
 
-class MongoConnector:
+class MongoConnector(StorageBackend):
     """
     Python class to:
         - Get the data from the database
@@ -65,6 +68,10 @@ class MongoConnector:
         self.texts = self.async_db["GNTText"]
         self.chapters = self.async_db["Chapters"]
         self.verses = self.async_db["Verses"]
+        self.verse_documents = self.async_db["VerseDocuments"]
+        self.vocabulary = self.async_db["Vocabulary"]
+        self.fill_generations = self.async_db["FillGeneration"]
+        self.manifests = self.async_db["FillManifest"]
         self.booklists = self.async_db["BookList"]
         self.bookclasses_nt = self.async_db["BookClassesNT"]
         self.bookclasses_ot = self.async_db["BookClassesOT"]
@@ -105,27 +112,6 @@ class MongoConnector:
         booklist = self.bookclasses_ot.find({}, {"_id": 0})
         return await booklist.to_list(length=100)
 
-    async def get_book_classes(self) -> Dict[str, List[str]]:
-        """
-        Get all of the books stored into the collection BookList.
-        """
-        ot_classes = await self.bookclasses_ot.find({}, {"_id": 0}).to_list(length=100)
-        nt_classes = await self.bookclasses_nt.find({}, {"_id": 0}).to_list(length=100)
-        all_classes = ot_classes + nt_classes
-        return all_classes
-
-    async def get_book_class(self, book_list: List[str]) -> List[str]:
-        """
-        For a given list of books, get their corresponding class.
-        """
-        all_bookclasses = await self.get_book_classes()
-        bookclasses = []
-        for book in book_list:
-            for bookgroup in all_bookclasses:
-                if book in bookgroup["books"]:
-                    bookclasses.append(bookgroup["group"])
-        return bookclasses
-
     async def get_texts(self, text_list=Optional[List[str]]) -> List[Dict[str, str]]:
         """
         Get the texts specified in text_list. If the argument text_list
@@ -180,55 +166,242 @@ class MongoConnector:
                 {"book": {"$in": text_list}}, {"_id": 0})
         return await collection.to_list(length=1000)
 
-    def write_book_lists(self, book_names: List[str]) -> None:
+    async def iter_verses(self, text_list: Optional[List[str]] = None, batch_size: int = 1) -> AsyncIterator[Dict]:
+        """
+        Iterate over the verses of the texts specified in text_list, one book
+        at a time, instead of fetching all of them at once. If the argument
+        text_list is not set, iterate over all the texts in the database.
+
+        Args:
+            text_list (list): The list of texts to fetch from the database.
+            batch_size (int): The number of books to fetch from the database
+                in each round trip.
+
+        Yields:
+            dict: A dictionnary containing the verses of a book.
+        """
+        if not text_list:
+            collection = self.verses.find({}, {"_id": 0}, batch_size=batch_size)
+        else:
+            collection = self.verses.find(
+                {"book": {"$in": text_list}}, {"_id": 0}, batch_size=batch_size)
+        async for book_data in collection:
+            yield book_data
+
+    @ staticmethod
+    def verse_range_filter(book: str, chapter_start: Optional[int] = None, chapter_end: Optional[int] = None,
+                           verse_start: Optional[int] = None, verse_end: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Build the filter of the verses of a book from verse_start of
+        chapter_start to verse_end of chapter_end, the bounds being included
+        and a missing bound leaving the range open.
+
+        Raises:
+            ValueError: If a verse bound is given without its chapter.
+        """
+        StorageBackend.check_verse_range(chapter_start, chapter_end, verse_start, verse_end)
+        conditions: List[Dict[str, Any]] = []
+        if chapter_start is not None and chapter_start == chapter_end:
+            verse_span = {operator: bound for operator, bound in (("$gte", verse_start), ("$lte", verse_end))
+                          if bound is not None}
+            conditions.append({"chapter": chapter_start, **({"verse": verse_span} if verse_span else {})})
+        else:
+            for chapter, verse, operator, strict_operator in ((chapter_start, verse_start, "$gte", "$gt"),
+                                                             (chapter_end, verse_end, "$lte", "$lt")):
+                if chapter is None:
+                    continue
+                if verse is None:
+                    conditions.append({"chapter": {operator: chapter}})
+                else:
+                    conditions.append({"$or": [{"chapter": {strict_operator: chapter}},
+                                               {"chapter": chapter, "verse": {operator: verse}}]})
+        if not conditions:
+            return {"book": book}
+        return {"book": book, "$and": conditions} if len(conditions) > 1 else {"book": book, **conditions[0]}
+
+    async def iter_verse_range(self, book: str, chapter_start: Optional[int] = None, chapter_end: Optional[int] = None,
+                               verse_start: Optional[int] = None, verse_end: Optional[int] = None,
+                               fields: Optional[Iterable[str]] = None, batch_size: int = 500) -> AsyncIterator[Dict]:
+        """
+        Iterate over the verses of a book from verse_start of chapter_start to
+        verse_end of chapter_end, in the order of their chapter and verse
+        numbers, streaming them from the collection VerseDocuments instead of
+        fetching the whole book.
+
+        Args:
+            book (str): The book of the verses.
+            chapter_start (int): The first chapter of the range, if any.
+            chapter_end (int): The last chapter of the range, if any.
+            verse_start (int): The first verse of chapter_start, if any.
+            verse_end (int): The last verse of chapter_end, if any.
+            fields (list): The fields of the verses to fetch, all of
+                VERSE_FIELDS if not set.
+            batch_size (int): The number of verses fetched in each round trip.
+
+        Yields:
+            dict: A dictionnary containing the fields of a verse.
+        """
+        projection = {"_id": 0, **{field: 1 for field in (fields or VERSE_FIELDS)}}
+        cursor = self.verse_documents.find(
+            self.verse_range_filter(book, chapter_start, chapter_end, verse_start, verse_end),
+            projection, batch_size=batch_size,
+        ).sort([("chapter", ASCENDING), ("verse", ASCENDING), ("ordinal", ASCENDING)])
+        async for verse in cursor:
+            yield verse
+
+    async def get_vocabulary(self) -> List[str]:
+        """
+        Get the lemma associated with each token id of the collection VerseDocuments.
+        """
+        vocabulary = await self.vocabulary.find_one({}, {"_id": 0})
+        return vocabulary["lemmas"] if vocabulary else []
+
+    async def get_fill_generation(self) -> Optional[str]:
+        """
+        Get the id of the last fill of the database, None if it was filled
+        before the fills were given an id.
+        """
+        fill_generation = await self.fill_generations.find_one({}, {"_id": 0})
+        return fill_generation["generation"] if fill_generation else None
+
+    async def get_manifest(self) -> List[Dict]:
+        """
+        Get the manifest of the last fill of the database, empty if it was
+        filled without one.
+        """
+        manifest = await self.manifests.find_one({}, {"_id": 0})
+        return manifest["books"] if manifest else []
+
+    async def replace_collection(self, collection: AsyncIOMotorCollection, documents: List[Dict], batch_size: int = 1000, concurrency: int = 4, indexes: List[IndexModel] = ()) -> None:
+        """
+        Replace the content of a collection without readers ever seeing it
+        empty or partially written: the documents are inserted into a staging
+        collection in concurrent unordered batches, their number is checked,
+        and the staging collection is then renamed into the collection,
+        which atomically drops the previous content. The natural order of
+        the documents is only kept within a batch.
+
+        Args:
+            collection (AsyncIOMotorCollection): The collection to replace.
+            documents (list): The new documents of the collection.
+            batch_size (int): The number of documents inserted at once.
+            concurrency (int): The number of batches inserted concurrently.
+            indexes (list): The indexes of the collection.
+
+        Raises:
+            RuntimeError: If the staging collection does not hold all of the
+                documents, the collection being left untouched.
+        """
+        staging = self.async_db[f"{collection.name}Staging"]
+        # Drop the leftovers of an interrupted fill
+        await staging.drop()
+        await self.async_db.create_collection(staging.name)
+        semaphore = asyncio.Semaphore(max(concurrency, 1))
+
+        async def insert(batch: List[Dict]) -> None:
+            async with semaphore:
+                await staging.insert_many(batch, ordered=False)
+        try:
+            await asyncio.gather(*(insert(documents[start:start + batch_size])
+                                   for start in range(0, len(documents), batch_size)))
+            count = await staging.count_documents({})
+            if count != len(documents):
+                raise RuntimeError(f"Staged {count} documents out of {len(documents)} "
+                                   f"in collection {collection.name}")
+            if indexes:
+                await staging.create_indexes(list(indexes))
+            await staging.rename(collection.name, dropTarget=True)
+        except Exception:
+            await staging.drop()
+            raise
+        logger.info(f"Replaced collection {collection.name} with {len(documents)} documents")
+
+    async def write_book_lists(self, book_names: List[str], **kwargs) -> None:
         """
         Overwrite the collection BookList to write down the list
         of the books.
         """
-        # Drop existing data
-        self.booklists.drop()
-        dict_to_insert = {"books": book_names}
-        self.booklists.insert_one(dict_to_insert)
+        await self.replace_collection(self.booklists, [{"books": book_names}], **kwargs)
 
-    def write_text(self, book_data: List) -> None:
+    async def write_text(self, book_data: List, **kwargs) -> None:
         """
         Overwrite the collection GNTText to write down the textual
         data available for each book.
         """
-        # Drop existing data
-        self.texts.drop()
-        # Add new data
-        self.texts.insert_many(book_data)
+        await self.replace_collection(self.texts, book_data, **kwargs)
 
-    def write_chapters(self, book_data: List) -> None:
+    async def write_chapters(self, book_data: List, **kwargs) -> None:
         """
-        Overwrite the collection GNTText to write down the textual
+        Overwrite the collection Chapters to write down the textual
         data available for each book.
         """
-        # Drop existing data
-        self.chapters.drop()
-        # Add new data
-        result = self.chapters.insert_many(book_data)
+        await self.replace_collection(self.chapters, book_data, **kwargs)
 
-    def write_verses(self, book_data: List) -> None:
+    async def write_verses(self, book_data: List, **kwargs) -> None:
         """
         Overwrite the collection Verses to write down the textual
         data available for each book.
         """
-        # Drop existing data
-        self.verses.drop()
-        # Add new data
-        self.verses.insert_many(book_data)
+        await self.replace_collection(self.verses, book_data, **kwargs)
 
-    def write_book_classes(self, book_classes_nt: List[Dict[str, List[str]]], 
-                                 book_classes_ot: List[Dict[str, List[str]]]) -> None:
+    async def write_book_classes(self, book_classes_nt: List[Dict[str, List[str]]],
+                                 book_classes_ot: List[Dict[str, List[str]]], **kwargs) -> None:
         """
         Overwrite the collection BookClass to write down the textual data 
         and the corresponding values.
         """
-        # Drop existing data
-        self.bookclasses_nt.drop()
-        self.bookclasses_ot.drop()
-        # Add new data
-        self.bookclasses_nt.insert_many(book_classes_nt)
-        self.bookclasses_ot.insert_many(book_classes_ot)
+        await self.replace_collection(self.bookclasses_nt, book_classes_nt, **kwargs)
+        await self.replace_collection(self.bookclasses_ot, book_classes_ot, **kwargs)
+
+    async def write_verse_documents(self, verse_documents: List[Dict], vocabulary: List[str], **kwargs) -> None:
+        """
+        Overwrite the collections VerseDocuments and Vocabulary to write down
+        one document per verse, indexed by book, chapter and verse so that
+        ranges of verses are fetched without reading whole books.
+        """
+        await self.replace_collection(self.verse_documents, verse_documents, indexes=[
+            IndexModel([("book", ASCENDING), ("chapter", ASCENDING), ("verse", ASCENDING), ("ordinal", ASCENDING)]),
+            IndexModel([("ordinal", ASCENDING)], unique=True),
+        ], **kwargs)
+        await self.replace_collection(self.vocabulary, [{"lemmas": vocabulary}], **kwargs)
+
+    async def write_books(self, texts: List[Dict], chapters: List[Dict], verses: List[Dict], removed_books: Iterable[str] = (), **kwargs) -> None:
+        """
+        Overwrite the documents of some books in the collections GNTText,
+        Chapters and Verses, each of them being replaced in place so that the
+        books keep their natural order, and remove the books of removed_books.
+        """
+        removed_books = list(removed_books)
+        for collection, book_data in ((self.texts, texts), (self.chapters, chapters), (self.verses, verses)):
+            requests = [ReplaceOne({"book": data["book"]}, data, upsert=True) for data in book_data]
+            if removed_books:
+                requests.append(DeleteMany({"book": {"$in": removed_books}}))
+            if requests:
+                await collection.bulk_write(requests)
+            logger.info(f"Updated {len(book_data)} books and removed {len(removed_books)} books "
+                        f"in collection {collection.name}")
+
+    async def write_book_verse_documents(self, verse_documents: List[Dict], books: Iterable[str], batch_size: int = 1000, **kwargs) -> None:
+        """
+        Overwrite the documents of some books in the collection VerseDocuments,
+        the ones of the other books being left untouched. The verses of the
+        books are missing from the ranges of verses while they are rewritten.
+        """
+        await self.verse_documents.delete_many({"book": {"$in": list(books)}})
+        for start in range(0, len(verse_documents), batch_size):
+            await self.verse_documents.insert_many(verse_documents[start:start + batch_size], ordered=False)
+        logger.info(f"Updated {len(verse_documents)} documents in collection {self.verse_documents.name}")
+
+    async def write_manifest(self, manifest: List[Dict], **kwargs) -> None:
+        """
+        Overwrite the collection FillManifest to write down the manifest of
+        the fill of the database.
+        """
+        await self.replace_collection(self.manifests, [{"books": manifest}], **kwargs)
+
+    async def write_fill_generation(self, generation: str) -> None:
+        """
+        Overwrite the collection FillGeneration to write down the id of the
+        fill of the database, once all of its collections are written.
+        """
+        await self.fill_generations.replace_one({}, {"generation": generation}, upsert=True)
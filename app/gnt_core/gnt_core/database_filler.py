@@ -1,12 +1,110 @@
 """
 Python module to fill up the database with the data available in the data/ folder.
 """
+from concurrent.futures import Executor, ProcessPoolExecutor
 from pathlib import Path
 from loguru import logger
 import os
-from gnt_core.database import MongoConnector
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple
+from gnt_core.artifact import TOKEN_PATTERN, CorpusArtifact, compile_corpus
+from gnt_core.sources import SOURCE_FORMATS, BookRecords, SourceFormat, file_hash
+from gnt_core.storage import StorageBackend, changed_books, create_storage_backend, passage_number
 import asyncio
-import json
+import sys
+import time
+import uuid
+try:
+    import resource
+except ImportError:
+    # Not available on Windows
+    resource = None
+try:
+    from gnt_nlp_utils import get_stop_words
+except ImportError:
+    # Not installed along with the filler, the counts of the compiled corpus
+    # then keeping all of the tokens
+    get_stop_words = None
+
+# Corpora filling the database, see SOURCE_FORMATS
+SOURCES = ("sblgnt", "lxx")
+# Version of the documents built out of the source files, to increase whenever
+# they change so that the incremental fills build all of them again
+DOCUMENTS_VERSION = 1
+
+
+def peak_memory(children: bool = False) -> Optional[int]:
+    """
+    Get the peak resident memory of the process in bytes, of the largest of
+    its terminated child processes if children is set, None if it cannot be
+    measured on the platform.
+    """
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+    # In bytes on macOS, in kilobytes elsewhere
+    return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+
+def corpus_stop_words() -> FrozenSet[str]:
+    """
+    Get the stop words left out of the counts of the compiled corpus, the
+    ones of the NLP utils if they are installed.
+    """
+    return get_stop_words() if get_stop_words is not None else frozenset()
+
+
+def build_verse_documents(texts_verses: List[Dict]) -> Tuple[List[Dict], List[str]]:
+    """
+    Build one document per verse out of the verses of each book, along with
+    the vocabulary of lemmas, sorted alphabetically, the token ids of the
+    verses refer to.
+
+    Args:
+        texts_verses (list): The verses of each book, as loaded by DataBaseFiller
+
+    Returns:
+        tuple: The documents of the verses (ordinal, book, chapter, verse,
+            name, text and token_ids) and the vocabulary.
+    """
+    records = [(book_data["book"], chapter, verse, text)
+               for book_data in texts_verses
+               for chapter, verses in book_data["verses"].items()
+               for verse, text in verses.items()]
+    tokens = [TOKEN_PATTERN.findall(text.lower()) for _, _, _, text in records]
+    vocabulary = sorted({token for verse_tokens in tokens for token in verse_tokens})
+    token_ids = {lemma: token_id for token_id, lemma in enumerate(vocabulary)}
+    verse_documents = [
+        {"ordinal": ordinal,
+         "book": book,
+         "chapter": passage_number(chapter),
+         "verse": passage_number(verse),
+         "name": f"{book}{chapter},{verse}",
+         "text": text,
+         "token_ids": [token_ids[token] for token in verse_tokens]}
+        for ordinal, ((book, chapter, verse, text), verse_tokens) in enumerate(zip(records, tokens))]
+    return verse_documents, vocabulary
+
+
+def build_manifest(entries: List[Dict], verse_documents: List[Dict]) -> List[Dict]:
+    """
+    Complete the manifest entries of the books with the range of their verse
+    documents: the ordinal of their first verse and their number of verses.
+    """
+    ranges: Dict[str, Dict[str, int]] = {}
+    for document in verse_documents:
+        ranges.setdefault(document["book"], {"ordinal": document["ordinal"], "verses": 0})["verses"] += 1
+    return [{**entry, **ranges.get(entry["book"], {"ordinal": None, "verses": 0})} for entry in entries]
+
+
+def parse_source_file(source_format: SourceFormat, file: Path) -> Tuple[BookRecords, float]:
+    """
+    Parse a source file, in a worker process of the filler.
+
+    Returns:
+        tuple: The texts of the book of the file and the time taken to parse it, in seconds.
+    """
+    start = time.perf_counter()
+    return source_format.load_book(file), time.perf_counter() - start
 
 
 class DataBaseFiller:
@@ -16,7 +114,7 @@ class DataBaseFiller:
     Should only be run once upon install of the application on the system.
     """
 
-    def __init__(self, mongo_uri: str = "", mongo_database: str = "gnt", mongo_host: str = "localhost", mongo_port: int = 27017, mongo_user: str = "", mongo_password: str = "") -> None:
+    def __init__(self, mongo_uri: str = "", mongo_database: str = "gnt", mongo_host: str = "localhost", mongo_port: int = 27017, mongo_user: str = "", mongo_password: str = "", batch_size: int = 1000, concurrency: int = 4, storage_backend: str = "mongodb", sqlite_path: str = "gnt.sqlite", workers: Optional[int] = None, incremental: bool = True, artifact_path: Optional[str] = None) -> None:
         """
         Initializes an object of class DataBaseFiller, using the information of the
         mongo database.
@@ -25,9 +123,26 @@ class DataBaseFiller:
             mongo_database (str): Name of the mongo database to connect to.
             mongo_host (str): Host of the database
             mongo_port (int): Port exposed by the database
+            batch_size (int): Number of documents inserted at once
+            concurrency (int): Number of batches of documents inserted concurrently
+            storage_backend (str): Storage to fill ("mongodb" or "sqlite")
+            sqlite_path (str): Path of the SQLite database file
+            workers (int): Number of processes parsing the source files, the
+                number of processors if not set
+            incremental (bool): Whether to only write down the books whose
+                source file changed since the last fill
+            artifact_path (str): Path of the compiled corpus the books are
+                read from rather than parsed, compiled again if the source
+                files changed since it was compiled, see gnt_core.artifact
         """
-        self.database_instance = MongoConnector(
-            mongo_uri, mongo_database, mongo_host, mongo_port, mongo_password, mongo_user)
+        self.database_instance: StorageBackend = create_storage_backend(
+            storage_backend, sqlite_path, mongo_uri=mongo_uri, mongo_database=mongo_database,
+            mongo_host=mongo_host, mongo_port=mongo_port, mongo_password=mongo_password, mongo_user=mongo_user)
+        self.write_options = {"batch_size": batch_size, "concurrency": concurrency}
+        self.workers = workers
+        self.incremental = incremental
+        self.artifact_path = artifact_path
+        self.artifact: Optional[CorpusArtifact] = None
         self.texts = list()
         self.texts_chapter = list()
         self.texts_verses = list()
@@ -38,181 +153,148 @@ class DataBaseFiller:
         """
         await self.database_instance.connect()
 
-    def load_sblgnt(self, input_folder: str = "../data/sblgnt/") -> None:
+    @ staticmethod
+    def source_files(sources: Iterable[str]) -> List[Tuple[str, Path]]:
         """
-        Load the SBLGNT JSON files into a list of Python dictionary using encoding
-        adapted to the gnt. The only loaded text is the lemmed and stemmed
-        words, as only these will be considered whenever performing the
-        clustering.
+        Get the files of the corpora, along with the name of their format,
+        sorted by name within each corpus so that the books are always loaded
+        in the same order.
 
         Args:
-            input_folder (str): Folder to find the data in
-        """
-        # Load the greek text
-        for file in Path(Path(__file__).resolve().parent / input_folder).glob("*.txt"):
-            logger.info(f"--- Writting down text found in files: {file} ---")
-            book = file.name.split("-")[1]
-            split_text = file.read_text(encoding="utf8").split("\n")
-            text = ""
-            for line in split_text:
-                if line:
-                    word = line.split(" ")[-1]
-                    text += word + " "
-            self.texts.append({"book": book, "text": text})
-    
-    def load_sbglnt_chapters(self, input_folder: str = "../data/sblgnt/") -> None:
-        """
-        Load the SBLGNT JSON files into a list of Python dictionary on
-        a per chapter basis using encoding
-        adapted to the gnt. The only loaded text is the lemmed and stemmed
-        words, as only these will be considered whenever performing the
-        clustering.
+            sources (list): Names of the formats of the corpora, see SOURCE_FORMATS
+        """
+        return [(source, file) for source in sources for file in sorted(SOURCE_FORMATS[source].files())]
 
-        Args:
-            input_folder (str): Folder to find the data in
-        """
-        for file in Path(Path(__file__).resolve().parent / input_folder).glob("*.txt"):
-            book = file.name.split("-")[1]
-            split_text = file.read_text(encoding="utf8").split("\n")
-            texts = {}
-            for text in split_text:
-                parsed_text = text.split(" ")
-                if parsed_text[0]:
-                    chapter_ix = str(int(parsed_text[0][2:4]))
-                    try:
-                        texts[chapter_ix] += parsed_text[-1] + " "
-                    except KeyError:
-                        texts[chapter_ix] = parsed_text[-1] + " "
-            self.texts_chapter.append({"book": book, "chapters": texts})
-
-    def load_sbglnt_verses(self, input_folder: str = "../data/sblgnt/") -> None:
-        """
-        Load the SBLGNT JSON files into a list of Python dictionary on
-        a per verse basis using encoding
-        adapted to the gnt. The only loaded text is the lemmed and stemmed
-        words, as only these will be considered whenever performing the
-        clustering.
+    @ staticmethod
+    def manifest_entry(source: str, file: Path) -> Dict:
+        """
+        Build the manifest entry of the book of a source file, identifying the
+        content of the file and the version of the documents built out of it.
+        """
+        source_format = SOURCE_FORMATS[source]
+        return {"book": source_format.book_name(file),
+                "source": source,
+                "file": file.name,
+                "hash": file_hash(file),
+                "version": f"{DOCUMENTS_VERSION}.{source_format.version}"}
+
+    def add_book(self, book_records: BookRecords) -> None:
+        """
+        Add the texts of a book, of its chapters and of its verses to the loaded ones.
+        """
+        self.texts.append({"book": book_records.book, "text": book_records.text})
+        self.texts_chapter.append({"book": book_records.book, "chapters": book_records.chapters})
+        self.texts_verses.append({"book": book_records.book, "verses": book_records.verses})
+
+    @ staticmethod
+    def log_progress(book_records: BookRecords, file: Path, duration: float, done: int, total: int) -> None:
+        """
+        Log the parsing of a file, with its book and timing as extra fields of the record.
+        """
+        logger.bind(book=book_records.book, file=file.name, duration=duration, done=done, total=total).info(
+            f"Parsed {file.name} ({book_records.book}) in {duration:.3f}s [{done}/{total}]")
+
+    def load_json(self, sources: Iterable[str] = SOURCES) -> None:
+        """
+        Load NT and OT texts in the current process, parsing each file once
+        into the text of its book, of its chapters and of its verses. The only
+        loaded text is the lemmed and stemmed words, as only these will be
+        considered whenever performing the clustering.
 
         Args:
-            input_folder (str): Folder to find the data in
-        """
-        for file in Path(Path(__file__).resolve().parent / input_folder).glob("*.txt"):   
-            book = file.name.split("-")[1]
-            split_text = file.read_text(encoding="utf8").split("\n")
-            text = {}
-            for texts in split_text:
-                parsed_text = texts.split(" ")
-                if parsed_text[0]:
-                    chapter_ix = str(int(parsed_text[0][2:4]))
-                    verse_ix = str(int(parsed_text[0][4:6]))
-                    # Check if chapter already exists
-                    try:
-                        text[chapter_ix]
-                    # If it doesn't, fill it with an empty dictionary
-                    except KeyError:
-                        text[chapter_ix] = {}
-                    # Else, fill it with content
-                    try:
-                        text[chapter_ix][verse_ix] += parsed_text[-1] + " "
-                    except KeyError:
-                        text[chapter_ix][verse_ix] = parsed_text[-1] + " "  
-            self.texts_verses.append({"book": book, "verses": text})
-    
-    def load_lxx(self, input_folder: str = "../data/lxx/") -> None:
-        """
-        Load the LXX JSON files into a list of Python dictionary using encoding
-        adapted to the text. The only loaded text is the lemmed and stemmed
-        words, as only these will be considered whenever performing the
-        clustering.
+            sources (list): Names of the formats of the corpora to load, see SOURCE_FORMATS
+        """
+        files = self.source_files(sources)
+        for done, (source, file) in enumerate(files, 1):
+            book_records, duration = parse_source_file(SOURCE_FORMATS[source], file)
+            self.log_progress(book_records, file, duration, done, len(files))
+            self.add_book(book_records)
+
+    async def parse_files(self, executor: Executor, files: List[Tuple[str, Path]]) -> List[BookRecords]:
+        """
+        Parse source files concurrently by the workers of executor.
 
         Args:
-            input_folder (str): Folder to find the data in
-        """
-        # Load the greek text
-        for file in Path(Path(__file__).resolve().parent / input_folder).glob("*.js"):
-            logger.info(f"--- Writting down text found in files: {file} ---")
-            book = file.name.split(".")[0]
-            opened_file = json.loads(file.read_text("utf-8"))
-            text = ""
-            for _, verses in opened_file.items():
-                for words in verses:
-                    text += words["lemma"] + " "
-            self.texts.append({"book": book, "text": text})
-
-    def load_lxx_chapters(self, input_folder: str = "../data/lxx/") -> None:
-        """
-        Load the LXX JSON files into a list of Python dictionary using encoding
-        adapted to the text. The only loaded text is the lemmed and stemmed
-        words, as only these will be considered whenever performing the
-        clustering.
+            executor (Executor): Pool of the workers parsing the files
+            files (list): The files to parse, along with the name of their format
+
+        Returns:
+            list: The texts of the book of each file, in the order of the
+                files whatever the order the workers complete them in.
+        """
+        if self.artifact is not None:
+            return [self.artifact.book_records(SOURCE_FORMATS[source].book_name(file)) for source, file in files]
+        loop = asyncio.get_event_loop()
+        parsings = [loop.run_in_executor(executor, parse_source_file, SOURCE_FORMATS[source], file)
+                    for source, file in files]
+        file_names = {parsing: file for parsing, (_, file) in zip(parsings, files)}
+        pending = set(parsings)
+        while pending:
+            completed, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for parsing in completed:
+                book_records, duration = parsing.result()
+                self.log_progress(book_records, file_names[parsing], duration, len(files) - len(pending), len(files))
+        return [parsing.result()[0] for parsing in parsings]
+
+    def open_artifact(self, executor: Executor, files: List[Tuple[str, Path]], entries: List[Dict]) -> None:
+        """
+        Map the compiled corpus in memory, compiling it first if it is missing
+        or if it was compiled from other source files or stop words.
 
         Args:
-            input_folder (str): Folder to find the data in
-        """
-        for file in Path(Path(__file__).resolve().parent / input_folder).glob("*.js"):
-            book = file.name.split(".")[0]
-            opened_file = json.loads(file.read_text("utf-8"))
-            text = {}
-            for verses_nbr, verses in opened_file.items():
-                chapter_ix = verses_nbr.split(".")[1]
-                for verse_content in verses:
-                    try:
-                        text[chapter_ix] += verse_content["lemma"] + " "
-                    except KeyError:
-                        text[chapter_ix] = verse_content["lemma"] + " "
-            self.texts_chapter.append({"book": book, "chapters": text})
-
-    def load_lxx_verses(self, input_folder: str = "../data/lxx/") -> None:
-        """
-        Load the LXX JSON files into a list of Python dictionary on a per verse basis,
-        using encoding adapted to the text. The only loaded text is the
-        lemmed and stemmed words, as only these will be considered whenever performing the
-        clustering.
+            executor (Executor): Pool of the workers parsing the files
+            files (list): The source files, along with the name of their format
+            entries (list): The manifest entry of each file
+        """
+        path = Path(self.artifact_path)
+        try:
+            artifact = CorpusArtifact(path) if path.exists() else None
+        except ValueError as error:
+            logger.info(f"Compiling the corpus again: {error}")
+            artifact = None
+        if artifact is not None and not (artifact.matches(entries) and set(artifact.stop_words) == corpus_stop_words()):
+            artifact.close()
+            artifact = None
+        if artifact is None:
+            start = time.perf_counter()
+            compile_corpus(path, [(SOURCE_FORMATS[source], file) for source, file in files], entries, executor.map,
+                           corpus_stop_words())
+            logger.info(f"Compiled the corpus of {len(files)} books into {path} in {time.perf_counter() - start:.2f}s")
+            artifact = CorpusArtifact(path)
+        self.artifact = artifact
+
+    def verse_documents(self, executor: Executor) -> "asyncio.Future[Tuple[List[Dict], List[str]]]":
+        """
+        Build the documents of the verses of the loaded books, see
+        build_verse_documents, by the workers of executor or from the tokens
+        of the compiled corpus.
+        """
+        loop = asyncio.get_event_loop()
+        if self.artifact is not None:
+            return loop.run_in_executor(None, self.artifact.verse_documents)
+        return loop.run_in_executor(executor, build_verse_documents, self.texts_verses)
+
+    async def load_sources(self, executor: Executor, sources: Iterable[str] = SOURCES) -> None:
+        """
+        Load NT and OT texts as load_json, the files being parsed concurrently
+        by the workers of executor.
 
         Args:
-            input_folder (str): Folder to find the data in
-        """
-        for file in Path(Path(__file__).resolve().parent / input_folder).glob("*.js"):
-            book = file.name.split(".")[0]
-            opened_file = json.loads(file.read_text("utf-8"))
-            text = {}
-            for verses_nbr, verses in opened_file.items():
-                chapter_ix = verses_nbr.split(".")[1]
-                for verse_content in verses:
-                    verse_ix = verses_nbr.split(".")[2]
-                    # Check if chapter already exists
-                    try:
-                        text[chapter_ix]
-                    # If it doesn't, fill it with an empty dictionary
-                    except KeyError:
-                        text[chapter_ix] = {}
-                    # Else, fill it with content
-                    try:
-                        text[chapter_ix][verse_ix] += verse_content["lemma"] + " "
-                    except KeyError:
-                        text[chapter_ix][verse_ix] = verse_content["lemma"] + " "
-            self.texts_verses.append({"book": book, "verses": text})
-
-    def load_json(self):
-        """
-        Load OT and NT texts.
-        """
-        self.load_sblgnt()
-        self.load_lxx()
-        self.load_lxx_chapters()
-        self.load_sbglnt_chapters()
-        self.load_lxx_verses()
-        self.load_sbglnt_verses()
-
-    def write_booklist(self) -> None:
+            executor (Executor): Pool of the workers parsing the files
+            sources (list): Names of the formats of the corpora to load, see SOURCE_FORMATS
+        """
+        for book_records in await self.parse_files(executor, self.source_files(sources)):
+            self.add_book(book_records)
+
+    async def write_booklist(self) -> None:
         """
         Overwrite the booklist in the mongo collection.
         """
-        self.database_instance.write_book_lists(
-            [text['book'] for text in self.texts])
+        await self.database_instance.write_book_lists(
+            [text['book'] for text in self.texts], **self.write_options)
         logger.info("Successfully wrote list of books")
 
-    def write_book_classes(self) -> None:
+    async def write_book_classes(self) -> None:
         """
         Write the bookclasses in the mongo collection.
         """
@@ -236,47 +318,197 @@ class DataBaseFiller:
             "Joel", "Obad", "Jonah", "Nah", "Hab",
             "Zeph", "Zec", "Mal", "Isa", "Jer", "Bar", "Lam", "Ezek", "DanOG", "DanTh"]}
         ]
-        self.database_instance.write_book_classes(
+        await self.database_instance.write_book_classes(
             book_classes_nt=book_classes_nt,
-            book_classes_ot=book_classes_ot
+            book_classes_ot=book_classes_ot,
+            **self.write_options
         )
         logger.info("Successfully wrote book classes")
 
-    def write_texts(self) -> None:
+    async def write_texts(self) -> None:
         """
         Overwrite the collection GNTText to write down the textual
         data available for each book.
         """
-        self.database_instance.write_text(self.texts)
+        await self.database_instance.write_text(self.texts, **self.write_options)
         logger.info("Successfully wrote text content.")
 
-    def write_chapters(self) -> None:
+    async def write_chapters(self) -> None:
         """
         Overwrite the collection Chapters to write down the textual
         data available for each book.
         """
-        self.database_instance.write_chapters(self.texts_chapter)
+        await self.database_instance.write_chapters(self.texts_chapter, **self.write_options)
         logger.info("Successfully wrote text content separated as a chapter.")
 
-    def write_verses(self) -> None:
+    async def write_verses(self) -> None:
         """
         Overwrite the collection Verses to write down the textual
         data available for each book.
         """
-        self.database_instance.write_verses(self.texts_verses)
+        await self.database_instance.write_verses(self.texts_verses, **self.write_options)
         logger.info("Successfully wrote text content separated in verses.")
 
+    def build_verse_documents(self) -> Tuple[List[Dict], List[str]]:
+        """
+        Build one document per verse out of the verses loaded per book, see
+        build_verse_documents.
+        """
+        return build_verse_documents(self.texts_verses)
+
+    async def write_verse_documents(self, verse_documents: Optional[Tuple[List[Dict], List[str]]] = None) -> None:
+        """
+        Overwrite the collections VerseDocuments and Vocabulary to write down
+        one document per verse.
+
+        Args:
+            verse_documents (tuple): The documents of the verses and their
+                vocabulary, built out of the loaded verses if not set
+        """
+        await self.database_instance.write_verse_documents(
+            *(verse_documents or self.build_verse_documents()), **self.write_options)
+        logger.info("Successfully wrote one document per verse.")
+
+    async def write_fill_generation(self) -> None:
+        """
+        Write down a new id of the fill of the database, so that the running
+        API instances reload their corpus.
+        """
+        generation = uuid.uuid4().hex
+        await self.database_instance.write_fill_generation(generation)
+        logger.info(f"Successfully wrote fill generation {generation}.")
+
+    async def write_manifest(self, manifest: List[Dict]) -> None:
+        """
+        Overwrite the manifest of the fill of the database.
+        """
+        await self.database_instance.write_manifest(manifest, **self.write_options)
+        logger.info(f"Successfully wrote manifest of {len(manifest)} books.")
+
+    async def fill_all(self, executor: Executor) -> None:
+        """
+        Overwrite all of the content of the database, the source files being
+        parsed by the workers of executor, or read from the compiled corpus
+        if artifact_path is set.
+        """
+        start = time.perf_counter()
+        files = self.source_files(SOURCES)
+        entries = [self.manifest_entry(source, file) for source, file in files]
+        if self.artifact_path:
+            self.open_artifact(executor, files, entries)
+        # The classes of the books do not depend on the source files
+        book_classes = asyncio.ensure_future(self.write_book_classes())
+        for book_records in await self.parse_files(executor, files):
+            self.add_book(book_records)
+        logger.info(f"Loaded {len(self.texts)} books in {time.perf_counter() - start:.2f}s")
+        # Build the documents of the verses while the texts are written down
+        verse_documents = self.verse_documents(executor)
+        await asyncio.gather(book_classes, self.write_booklist(), self.write_texts(),
+                             self.write_chapters(), self.write_verses())
+        verse_documents = await verse_documents
+        await self.write_verse_documents(verse_documents)
+        await self.write_manifest(build_manifest(entries, verse_documents[0]))
+
+    async def update(self, executor: Executor, manifest: List[Dict]) -> bool:
+        """
+        Fill up the database incrementally since the fill of manifest: only
+        the books whose source file or documents version changed are parsed
+        and written down, along with the new books, and the books without
+        source file anymore are removed. The documents of one verse of the
+        other books are only written down again if their ordinals changed,
+        or if the vocabulary changed.
+
+        Args:
+            executor (Executor): Pool of the workers parsing the files
+            manifest (list): The manifest of the last fill of the database
+
+        Returns:
+            bool: Whether the content of the database changed.
+
+        Raises:
+            RuntimeError: If the verses of an unchanged book are missing from
+                the database, which must then be filled up again.
+        """
+        previous_entries = {entry["book"]: entry for entry in manifest}
+        files = self.source_files(SOURCES)
+        entries = [self.manifest_entry(source, file) for source, file in files]
+        if self.artifact_path:
+            # Compiled even if the database is up to date, for the API to map it
+            self.open_artifact(executor, files, entries)
+        books = changed_books(manifest, entries)
+        if books is None:
+            # There is no source file anymore
+            books = set(previous_entries)
+        changed = [(source, file) for (source, file), entry in zip(files, entries) if entry["book"] in books]
+        removed_books = [book for book in previous_entries if book in books and book not in {entry["book"] for entry in entries}]
+        if not books:
+            logger.info("The database is up to date with the source files.")
+            return False
+        parsed_books = {book_records.book: book_records for book_records in await self.parse_files(executor, changed)}
+        logger.info(f"Updating books {', '.join(parsed_books) or '-'}, removing books {', '.join(removed_books) or '-'}")
+        # The verses of the other books are only needed to build the verse
+        # documents, which the compiled corpus already holds
+        unchanged_books = [entry["book"] for entry in entries
+                           if entry["book"] not in parsed_books and self.artifact is None]
+        stored_verses = {book_data["book"]: book_data["verses"]
+                         for book_data in (await self.database_instance.get_verses(unchanged_books) if unchanged_books else [])}
+        missing_books = [book for book in unchanged_books if book not in stored_verses]
+        if missing_books:
+            raise RuntimeError(f"The verses of books {', '.join(missing_books)} are missing from the database")
+        # Only the books written down again are held as texts and chapters
+        for book_records in parsed_books.values():
+            self.add_book(book_records)
+        self.texts_verses = [{"book": entry["book"],
+                              "verses": parsed_books[entry["book"]].verses if entry["book"] in parsed_books
+                              else stored_verses[entry["book"]]}
+                             for entry in entries if entry["book"] in parsed_books or entry["book"] in stored_verses]
+        verse_documents, vocabulary = await self.verse_documents(executor)
+        new_manifest = build_manifest(entries, verse_documents)
+        await self.database_instance.write_books(
+            self.texts, self.texts_chapter, [book_data for book_data in self.texts_verses if book_data["book"] in parsed_books],
+            removed_books, **self.write_options)
+        await self.database_instance.write_book_lists([entry["book"] for entry in entries], **self.write_options)
+        await self.write_book_classes()
+        if vocabulary != await self.database_instance.get_vocabulary():
+            logger.info("The vocabulary changed, writing down the documents of all of the verses.")
+            await self.write_verse_documents((verse_documents, vocabulary))
+        else:
+            # The ordinals of the verses of the books following a changed one shift with its number of verses
+            shifted_books = {entry["book"] for entry in new_manifest
+                             if entry["book"] in parsed_books
+                             or any(previous_entries[entry["book"]].get(key) != entry[key] for key in ("ordinal", "verses"))}
+            await self.database_instance.write_book_verse_documents(
+                [document for document in verse_documents if document["book"] in shifted_books],
+                shifted_books | set(removed_books), **self.write_options)
+            logger.info(f"Successfully wrote the documents of the verses of {len(shifted_books)} books.")
+        await self.write_manifest(new_manifest)
+        return True
+
     async def main(self) -> None:
         """
-        Fill up the database for the Web App.
+        Fill up the database for the Web App, incrementally if it was filled
+        with a manifest and incremental is set.
         """
+        start = time.perf_counter()
         await self.connect()
-        self.load_json()
-        self.write_booklist()
-        self.write_book_classes()
-        self.write_texts()
-        self.write_chapters()
-        self.write_verses()
+        manifest = await self.database_instance.get_manifest() if self.incremental else []
+        with ProcessPoolExecutor(self.workers) as executor:
+            try:
+                if manifest:
+                    changed = await self.update(executor, manifest)
+                else:
+                    await self.fill_all(executor)
+                    changed = True
+            finally:
+                if self.artifact is not None:
+                    self.artifact.close()
+                    self.artifact = None
+        if changed:
+            await self.write_fill_generation()
+        memory, workers_memory = peak_memory(), peak_memory(children=True)
+        logger.info(f"Filled the database in {time.perf_counter() - start:.2f}s"
+                    + (f", with a peak memory of {memory / 2 ** 20:.1f}MB ({workers_memory / 2 ** 20:.1f}MB in the largest worker)"
+                       if memory is not None else ""))
 
 
 def fill():
@@ -289,12 +521,36 @@ def fill():
     MONGO_DATABASE = os.environ["GNT_MONGODB_DATABASE"] if "GNT_MONGODB_DATABASE" in os.environ else "gnt"
     MONGO_PASSWORD = os.environ["GNT_MONGODB_PASSWORD"] if "GNT_MONGODB_PASSWORD" in os.environ else None
     MONGO_USER = os.environ["GNT_MONGODB_USER"] if "GNT_MONGODB_USER" in os.environ else None
+    BATCH_SIZE = int(os.environ["GNT_FILL_BATCH_SIZE"]) if "GNT_FILL_BATCH_SIZE" in os.environ else 1000
+    CONCURRENCY = int(os.environ["GNT_FILL_CONCURRENCY"]) if "GNT_FILL_CONCURRENCY" in os.environ else 4
+    STORAGE_BACKEND = os.environ["GNT_STORAGE_BACKEND"] if "GNT_STORAGE_BACKEND" in os.environ else "mongodb"
+    SQLITE_PATH = os.environ["GNT_SQLITE_PATH"] if "GNT_SQLITE_PATH" in os.environ else "gnt.sqlite"
+    WORKERS = int(os.environ["GNT_FILL_WORKERS"]) if "GNT_FILL_WORKERS" in os.environ else None
+    INCREMENTAL = os.environ["GNT_FILL_INCREMENTAL"].lower() in ("1", "true", "yes") if "GNT_FILL_INCREMENTAL" in os.environ else True
+    ARTIFACT_PATH = os.environ["GNT_CORPUS_ARTIFACT"] if "GNT_CORPUS_ARTIFACT" in os.environ else None
     # Create the database filler object
-    filler = DataBaseFiller(mongo_uri=MONGO_URI, mongo_database=MONGO_DATABASE, mongo_host=MONGO_HOST, mongo_port=MONGO_PORT, mongo_user=MONGO_USER, mongo_password=MONGO_PASSWORD)
+    filler = DataBaseFiller(mongo_uri=MONGO_URI, mongo_database=MONGO_DATABASE, mongo_host=MONGO_HOST, mongo_port=MONGO_PORT, mongo_user=MONGO_USER, mongo_password=MONGO_PASSWORD, batch_size=BATCH_SIZE, concurrency=CONCURRENCY, storage_backend=STORAGE_BACKEND, sqlite_path=SQLITE_PATH, workers=WORKERS, incremental=INCREMENTAL, artifact_path=ARTIFACT_PATH)
     # Fill up database
     loop = asyncio.get_event_loop()
     loop.run_until_complete(filler.main())
 
 
+
+def compile_artifact():
+    """
+    Main function to compile the source files into the corpus read by the
+    filler and by the API
+    """
+    ARTIFACT_PATH = os.environ["GNT_CORPUS_ARTIFACT"] if "GNT_CORPUS_ARTIFACT" in os.environ else "gnt_corpus.bin"
+    WORKERS = int(os.environ["GNT_FILL_WORKERS"]) if "GNT_FILL_WORKERS" in os.environ else None
+    start = time.perf_counter()
+    files = DataBaseFiller.source_files(SOURCES)
+    with ProcessPoolExecutor(WORKERS) as executor:
+        compile_corpus(Path(ARTIFACT_PATH), [(SOURCE_FORMATS[source], file) for source, file in files],
+                       [DataBaseFiller.manifest_entry(source, file) for source, file in files], executor.map,
+                       corpus_stop_words())
+    logger.info(f"Compiled the corpus of {len(files)} books into {ARTIFACT_PATH} in {time.perf_counter() - start:.2f}s")
+
+
 if __name__ == '__main__':
     fill()
\ No newline at end of file
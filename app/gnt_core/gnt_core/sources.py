@@ -0,0 +1,149 @@
+# Python module to parse the source files of the corpora, each format of
+# source file being parsed by a SourceFormat
+import hashlib
+import json
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Dict, Iterator, List, NamedTuple, Tuple
+
+
+class BookRecords(NamedTuple):
+    """
+    Texts of a book, of each of its chapters and of each of their verses,
+    each word being followed by a space.
+    """
+    book: str
+    text: str
+    chapters: Dict[str, str]
+    verses: Dict[str, Dict[str, str]]
+
+
+def file_hash(file: Path) -> str:
+    """
+    Get the SHA-256 hash of the content of a file.
+    """
+    return hashlib.sha256(file.read_bytes()).hexdigest()
+
+
+def join_words(words: List[str]) -> str:
+    """
+    Join words, each of them being followed by a space.
+    """
+    return " ".join(words) + " " if words else ""
+
+
+class SourceFormat(ABC):
+    """
+    Python class to parse the files of a corpus, one book per file. The
+    words of a file are read once, the texts of the book, of its chapters
+    and of its verses being built at the same time.
+    """
+
+    # Folder of the files, relative to the gnt_core package
+    folder: str = ""
+    # Glob pattern of the files within the folder
+    pattern: str = "*"
+    # Version of the parsing, to increase whenever it changes the texts of
+    # the files so that the incremental fills parse all of them again
+    version: int = 1
+
+    def files(self, folder: str = None) -> List[Path]:
+        """
+        Get the files of the corpus, in the folder of the format if folder is not set.
+        """
+        return list(Path(Path(__file__).resolve().parent / (folder or self.folder)).glob(self.pattern))
+
+    @abstractmethod
+    def book_name(self, file: Path) -> str:
+        """
+        Get the name of the book of a file.
+        """
+
+    @abstractmethod
+    def iter_words(self, file: Path) -> Iterator[Tuple[str, str, str]]:
+        """
+        Iterate over the words of a file, as tuples of (chapter, verse, word).
+        """
+
+    def iter_analyzed_words(self, file: Path) -> Iterator[Tuple[str, str, str, str, str]]:
+        """
+        Iterate over the words of a file along with their morphology, as
+        tuples of (chapter, verse, word, part of speech, parsing code), the
+        morphology being empty if the format has none.
+        """
+        for chapter, verse, word in self.iter_words(file):
+            yield chapter, verse, word, "", ""
+
+    def load_book(self, file: Path) -> BookRecords:
+        """
+        Parse a file into the texts of its book, chapters and verses, in a
+        single pass over its words.
+        """
+        book_words: List[str] = []
+        chapter_words: Dict[str, List[str]] = {}
+        verse_words: Dict[str, Dict[str, List[str]]] = {}
+        for chapter, verse, word in self.iter_words(file):
+            book_words.append(word)
+            chapter_words.setdefault(chapter, []).append(word)
+            verse_words.setdefault(chapter, {}).setdefault(verse, []).append(word)
+        return BookRecords(
+            self.book_name(file),
+            join_words(book_words),
+            {chapter: join_words(words) for chapter, words in chapter_words.items()},
+            {chapter: {verse: join_words(words) for verse, words in verses.items()}
+             for chapter, verses in verse_words.items()})
+
+
+class SBLGNTFormat(SourceFormat):
+    """
+    Format of the MorphGNT files of the SBLGNT, one word per line starting
+    with its reference (book, chapter and verse on two digits each), its
+    part of speech and its parsing code, and ending with its lemma.
+    """
+
+    folder = "../data/sblgnt/"
+    pattern = "*.txt"
+
+    def book_name(self, file: Path) -> str:
+        return file.name.split("-")[1]
+
+    def iter_words(self, file: Path) -> Iterator[Tuple[str, str, str]]:
+        for chapter, verse, word, _, _ in self.iter_analyzed_words(file):
+            yield chapter, verse, word
+
+    def iter_analyzed_words(self, file: Path) -> Iterator[Tuple[str, str, str, str, str]]:
+        for line in file.read_text(encoding="utf8").split("\n"):
+            parsed_line = line.split(" ")
+            if parsed_line[0]:
+                yield (str(int(parsed_line[0][2:4])), str(int(parsed_line[0][4:6])), parsed_line[-1],
+                       parsed_line[1], parsed_line[2])
+
+
+class LXXFormat(SourceFormat):
+    """
+    Format of the JSON files of the LXX, mapping the reference of each verse
+    (book.chapter.verse) to its words, each of them with its lemma.
+    """
+
+    folder = "../data/lxx/"
+    pattern = "*.js"
+
+    def book_name(self, file: Path) -> str:
+        return file.name.split(".")[0]
+
+    def iter_words(self, file: Path) -> Iterator[Tuple[str, str, str]]:
+        for reference, words in json.loads(file.read_text("utf-8")).items():
+            _, chapter, verse = reference.split(".")[:3]
+            for word in words:
+                yield chapter, verse, word["lemma"]
+
+
+# Formats of the source files of the corpora, by name of corpus
+SOURCE_FORMATS: Dict[str, SourceFormat] = {"sblgnt": SBLGNTFormat(), "lxx": LXXFormat()}
+
+
+def register_source_format(name: str, source_format: SourceFormat) -> None:
+    """
+    Add the format of the files of a new corpus.
+    """
+    SOURCE_FORMATS[name] = source_format
@@ -0,0 +1,459 @@
+# Python module to get the data from an embedded SQLite database, for the
+# deployments without a mongo DB server
+import asyncio
+import json
+import sqlite3
+import threading
+from array import array
+from itertools import groupby
+from pathlib import Path
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+from loguru import logger
+from gnt_core.storage import VERSE_FIELDS, StorageBackend
+
+# Tables of the database, the rows of a table being in the order of the
+# documents of the corresponding mongo collection
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS book_lists (books TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS book_classes (
+    testament TEXT NOT NULL, position INTEGER NOT NULL, group_name TEXT NOT NULL, books TEXT NOT NULL,
+    PRIMARY KEY (testament, position));
+CREATE TABLE IF NOT EXISTS texts (position INTEGER PRIMARY KEY, book TEXT NOT NULL, text TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS texts_book ON texts (book);
+CREATE TABLE IF NOT EXISTS chapters (
+    position INTEGER PRIMARY KEY, book TEXT NOT NULL, chapter TEXT NOT NULL, text TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS chapters_book ON chapters (book, position);
+CREATE TABLE IF NOT EXISTS verses (
+    position INTEGER PRIMARY KEY, book TEXT NOT NULL, chapter TEXT NOT NULL, verse TEXT NOT NULL, text TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS verses_book ON verses (book, position);
+CREATE TABLE IF NOT EXISTS verse_documents (
+    ordinal INTEGER PRIMARY KEY, book TEXT NOT NULL, chapter INTEGER NOT NULL, verse INTEGER NOT NULL,
+    name TEXT NOT NULL, text TEXT NOT NULL, token_ids BLOB NOT NULL);
+CREATE INDEX IF NOT EXISTS verse_documents_range ON verse_documents (book, chapter, verse, ordinal);
+CREATE TABLE IF NOT EXISTS vocabulary (token_id INTEGER PRIMARY KEY, lemma TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS fill_generation (generation TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS manifest (books TEXT NOT NULL);
+"""
+
+
+class SQLiteConnector(StorageBackend):
+    """
+    Python class to:
+        - Get the data from an SQLite database
+        - Send the data to an SQLite database
+
+    The queries are run one at a time in the default executor, so that they
+    do not block the event loop. Each write replaces the content of its
+    tables within a transaction, the readers of other processes seeing the
+    previous content until it is committed (the database is in WAL mode).
+    """
+
+    def __init__(self, sqlite_path: str = "gnt.sqlite") -> None:
+        """
+        Initializes an object of class SQLiteConnector.
+
+        Args:
+            sqlite_path (str): Path of the database file, created if missing.
+        """
+        self.sqlite_path = sqlite_path
+        self.connection: Optional[sqlite3.Connection] = None
+        self.lock = threading.Lock()
+
+    async def connect(self) -> "SQLiteConnector":
+        """
+        Open the database, creating its tables if they do not exist.
+        """
+        logger.info(f"Opening SQLite database {self.sqlite_path}")
+        Path(self.sqlite_path).resolve().parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(self.sqlite_path, check_same_thread=False, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.executescript(SCHEMA)
+        return self
+
+    async def close(self) -> None:
+        """
+        Close the database.
+        """
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+        logger.info("Closed SQLite database.")
+
+    def locked(self, function: Callable, *args) -> Any:
+        """
+        Run a function of the connection, one at a time.
+        """
+        with self.lock:
+            return function(self.connection, *args)
+
+    async def run(self, function: Callable, *args) -> Any:
+        """
+        Run a function of the connection in the default executor.
+        """
+        return await asyncio.get_event_loop().run_in_executor(None, self.locked, function, *args)
+
+    async def fetch(self, query: str, parameters: Sequence = ()) -> List[Tuple]:
+        """
+        Get all of the rows of a query.
+        """
+        return await self.run(lambda connection: connection.execute(query, parameters).fetchall())
+
+    @ staticmethod
+    def book_filter(text_list: Optional[List[str]]) -> Tuple[str, List[str]]:
+        """
+        Build the WHERE clause of the rows of the books of text_list, empty
+        if it is not set.
+        """
+        if not text_list:
+            return "", []
+        return f" WHERE book IN ({', '.join('?' * len(text_list))})", list(text_list)
+
+    async def get_book_lists(self) -> List[Dict[str, List[str]]]:
+        """
+        Get all of the books stored into the table book_lists.
+        """
+        return [{"books": json.loads(books)} for books, in await self.fetch("SELECT books FROM book_lists")]
+
+    async def get_book_classes_testament(self, testament: str) -> List[Dict]:
+        """
+        Get the classes of the books of a testament.
+        """
+        rows = await self.fetch("SELECT group_name, books FROM book_classes WHERE testament = ? ORDER BY position",
+                                (testament,))
+        return [{"group": group, "books": json.loads(books)} for group, books in rows]
+
+    async def get_book_classes_nt(self) -> List[Dict]:
+        """
+        Get the classes of the books of the NT.
+        """
+        return await self.get_book_classes_testament("nt")
+
+    async def get_book_classes_ot(self) -> List[Dict]:
+        """
+        Get the classes of the books of the OT.
+        """
+        return await self.get_book_classes_testament("ot")
+
+    async def get_texts(self, text_list: Optional[List[str]] = None) -> List[Dict[str, str]]:
+        """
+        Get the texts specified in text_list. If the argument text_list
+        is not set, return all the texts in the database.
+        """
+        where, parameters = self.book_filter(text_list)
+        rows = await self.fetch(f"SELECT book, text FROM texts{where} ORDER BY position", parameters)
+        return [{"book": book, "text": text} for book, text in rows]
+
+    async def get_chapters(self, text_list: Optional[List[str]] = None) -> List[Dict]:
+        """
+        Get the chapters of the books specified in text_list. If the argument
+        text_list is not set, return the chapters of all the books.
+        """
+        where, parameters = self.book_filter(text_list)
+        rows = await self.fetch(f"SELECT book, chapter, text FROM chapters{where} ORDER BY position", parameters)
+        return [{"book": book, "chapters": {chapter: text for _, chapter, text in book_rows}}
+                for book, book_rows in groupby(rows, key=lambda row: row[0])]
+
+    @ staticmethod
+    def verse_document(book: str, book_rows: Iterable[Tuple[str, str, str, str]]) -> Dict:
+        """
+        Build the document of the verses of a book out of its rows.
+        """
+        verses: Dict[str, Dict[str, str]] = {}
+        for _, chapter, verse, text in book_rows:
+            verses.setdefault(chapter, {})[verse] = text
+        return {"book": book, "verses": verses}
+
+    async def get_verses(self, text_list: Optional[List[str]] = None) -> List[Dict]:
+        """
+        Get the verses of the books specified in text_list. If the argument
+        text_list is not set, return the verses of all the books.
+        """
+        where, parameters = self.book_filter(text_list)
+        rows = await self.fetch(f"SELECT book, chapter, verse, text FROM verses{where} ORDER BY position", parameters)
+        return [self.verse_document(book, book_rows) for book, book_rows in groupby(rows, key=lambda row: row[0])]
+
+    async def iter_verses(self, text_list: Optional[List[str]] = None, batch_size: int = 1) -> AsyncIterator[Dict]:
+        """
+        Iterate over the verses of the texts specified in text_list, one book
+        at a time, instead of fetching all of them at once. If the argument
+        text_list is not set, iterate over all the texts in the database.
+        """
+        where, parameters = self.book_filter(text_list)
+        books = await self.fetch(f"SELECT book FROM verses{where} GROUP BY book ORDER BY MIN(position)", parameters)
+        for start in range(0, len(books), max(batch_size, 1)):
+            batch = [book for book, in books[start:start + max(batch_size, 1)]]
+            rows = await self.fetch(
+                f"SELECT book, chapter, verse, text FROM verses WHERE book IN ({', '.join('?' * len(batch))}) "
+                "ORDER BY position", batch)
+            for book, book_rows in groupby(rows, key=lambda row: row[0]):
+                yield self.verse_document(book, book_rows)
+
+    @ staticmethod
+    def verse_range_clause(book: str, chapter_start: Optional[int] = None, chapter_end: Optional[int] = None,
+                           verse_start: Optional[int] = None, verse_end: Optional[int] = None) -> Tuple[str, List]:
+        """
+        Build the WHERE clause of the verses of a book from verse_start of
+        chapter_start to verse_end of chapter_end, the bounds being included
+        and a missing bound leaving the range open.
+
+        Raises:
+            ValueError: If a verse bound is given without its chapter.
+        """
+        StorageBackend.check_verse_range(chapter_start, chapter_end, verse_start, verse_end)
+        conditions, parameters = ["book = ?"], [book]
+        if chapter_start is not None and chapter_start == chapter_end:
+            conditions.append("chapter = ?")
+            parameters.append(chapter_start)
+            for verse, operator in ((verse_start, ">="), (verse_end, "<=")):
+                if verse is not None:
+                    conditions.append(f"verse {operator} ?")
+                    parameters.append(verse)
+        else:
+            for chapter, verse, operator in ((chapter_start, verse_start, ">"), (chapter_end, verse_end, "<")):
+                if chapter is None:
+                    continue
+                if verse is None:
+                    conditions.append(f"chapter {operator}= ?")
+                    parameters.append(chapter)
+                else:
+                    conditions.append(f"(chapter {operator} ? OR (chapter = ? AND verse {operator}= ?))")
+                    parameters.extend((chapter, chapter, verse))
+        return " AND ".join(conditions), parameters
+
+    async def iter_verse_range(self, book: str, chapter_start: Optional[int] = None, chapter_end: Optional[int] = None,
+                               verse_start: Optional[int] = None, verse_end: Optional[int] = None,
+                               fields: Optional[Iterable[str]] = None, batch_size: int = 500) -> AsyncIterator[Dict]:
+        """
+        Iterate over the verses of a book from verse_start of chapter_start to
+        verse_end of chapter_end, in the order of their chapter and verse
+        numbers, fetching batch_size verses at a time.
+
+        Args:
+            book (str): The book of the verses.
+            chapter_start (int): The first chapter of the range, if any.
+            chapter_end (int): The last chapter of the range, if any.
+            verse_start (int): The first verse of chapter_start, if any.
+            verse_end (int): The last verse of chapter_end, if any.
+            fields (list): The fields of the verses to fetch, all of
+                VERSE_FIELDS if not set.
+            batch_size (int): The number of verses fetched at once.
+
+        Yields:
+            dict: A dictionnary containing the fields of a verse.
+        """
+        batch_size = max(batch_size, 1)
+        columns = [field for field in VERSE_FIELDS if field in set(fields or VERSE_FIELDS)]
+        where, parameters = self.verse_range_clause(book, chapter_start, chapter_end, verse_start, verse_end)
+        query = (f"SELECT {', '.join(columns)} FROM verse_documents WHERE {where} "
+                 "ORDER BY chapter, verse, ordinal LIMIT ? OFFSET ?")
+        offset = 0
+        while True:
+            rows = await self.fetch(query, parameters + [batch_size, offset])
+            for row in rows:
+                verse = dict(zip(columns, row))
+                if "token_ids" in verse:
+                    verse["token_ids"] = array("i", verse["token_ids"]).tolist()
+                yield verse
+            if len(rows) < batch_size:
+                return
+            offset += batch_size
+
+    async def get_vocabulary(self) -> List[str]:
+        """
+        Get the lemma associated with each token id of the table verse_documents.
+        """
+        return [lemma for lemma, in await self.fetch("SELECT lemma FROM vocabulary ORDER BY token_id")]
+
+    async def get_fill_generation(self) -> Optional[str]:
+        """
+        Get the id of the last fill of the database, None if it was never filled.
+        """
+        rows = await self.fetch("SELECT generation FROM fill_generation")
+        return rows[0][0] if rows else None
+
+    async def get_manifest(self) -> List[Dict]:
+        """
+        Get the manifest of the last fill of the database, empty if it was
+        filled without one.
+        """
+        rows = await self.fetch("SELECT books FROM manifest")
+        return json.loads(rows[0][0]) if rows else []
+
+    async def transaction(self, function: Callable[[sqlite3.Connection], None]) -> None:
+        """
+        Run a function of the connection within a single transaction, rolled
+        back if it raises.
+        """
+        def run_transaction(connection: sqlite3.Connection) -> None:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                function(connection)
+                connection.execute("COMMIT")
+            except Exception:
+                connection.execute("ROLLBACK")
+                raise
+        await self.run(run_transaction)
+
+    async def replace_tables(self, tables: Dict[str, Tuple[Sequence[str], List[Tuple]]]) -> None:
+        """
+        Replace the content of tables within a single transaction, checking
+        that all of the rows were written before committing it.
+
+        Args:
+            tables (dict): The columns and the new rows of each table.
+
+        Raises:
+            RuntimeError: If a table does not hold all of its rows, the
+                tables being left untouched.
+        """
+        def replace(connection: sqlite3.Connection) -> None:
+            for table, (columns, rows) in tables.items():
+                connection.execute(f"DELETE FROM {table}")
+                connection.executemany(
+                    f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})", rows)
+                count, = connection.execute(f"SELECT COUNT(*) FROM {table}").fetchone()
+                if count != len(rows):
+                    raise RuntimeError(f"Wrote {count} rows out of {len(rows)} in table {table}")
+        await self.transaction(replace)
+        for table, (_, rows) in tables.items():
+            logger.info(f"Replaced table {table} with {len(rows)} rows")
+
+    @ staticmethod
+    def replace_book_rows(connection: sqlite3.Connection, table: str, columns: Sequence[str], book: str, rows: List[Tuple]) -> None:
+        """
+        Replace the rows of a book in a table ordered by position, the new
+        rows taking the place of the previous ones among the rows of the
+        other books, after all of them if the book is new.
+        """
+        first, last = connection.execute(
+            f"SELECT MIN(position), MAX(position) FROM {table} WHERE book = ?", (book,)).fetchone()
+        connection.execute(f"DELETE FROM {table} WHERE book = ?", (book,))
+        if first is None:
+            first, = connection.execute(f"SELECT COALESCE(MAX(position), 0) + 1 FROM {table}").fetchone()
+        elif len(rows) != last - first + 1:
+            # Shift the rows of the following books through negative
+            # positions, as the positions must stay unique at each step
+            connection.execute(f"UPDATE {table} SET position = -(position + ?) WHERE position > ?",
+                               (len(rows) - (last - first + 1), last))
+            connection.execute(f"UPDATE {table} SET position = -position WHERE position < 0")
+        connection.executemany(
+            f"INSERT INTO {table} (position, {', '.join(columns)}) VALUES (?, {', '.join('?' * len(columns))})",
+            [(first + offset, *row) for offset, row in enumerate(rows)])
+
+    @ staticmethod
+    def chapter_rows(data: Dict) -> List[Tuple[str, str, str]]:
+        """
+        Build the rows of the table chapters of a book.
+        """
+        return [(data["book"], chapter, text) for chapter, text in data["chapters"].items()]
+
+    @ staticmethod
+    def verse_rows(data: Dict) -> List[Tuple[str, str, str, str]]:
+        """
+        Build the rows of the table verses of a book.
+        """
+        return [(data["book"], chapter, verse, text)
+                for chapter, verses in data["verses"].items() for verse, text in verses.items()]
+
+    @ staticmethod
+    def verse_document_row(document: Dict) -> Tuple:
+        """
+        Build the row of the table verse_documents of a verse, the token ids
+        being stored as an array of int32.
+        """
+        return tuple(array("i", document[field]).tobytes() if field == "token_ids" else document[field]
+                     for field in VERSE_FIELDS)
+
+    async def write_book_lists(self, book_names: List[str], **kwargs) -> None:
+        """
+        Overwrite the table book_lists to write down the list of the books.
+        """
+        await self.replace_tables({"book_lists": (("books",), [(json.dumps(book_names),)])})
+
+    async def write_text(self, book_data: List[Dict], **kwargs) -> None:
+        """
+        Overwrite the table texts to write down the text of each book.
+        """
+        await self.replace_tables({"texts": (("book", "text"), [(data["book"], data["text"]) for data in book_data])})
+
+    async def write_chapters(self, book_data: List[Dict], **kwargs) -> None:
+        """
+        Overwrite the table chapters to write down the chapters of each book.
+        """
+        await self.replace_tables({"chapters": (("book", "chapter", "text"), [
+            row for data in book_data for row in self.chapter_rows(data)])})
+
+    async def write_verses(self, book_data: List[Dict], **kwargs) -> None:
+        """
+        Overwrite the table verses to write down the verses of each book.
+        """
+        await self.replace_tables({"verses": (("book", "chapter", "verse", "text"), [
+            row for data in book_data for row in self.verse_rows(data)])})
+
+    async def write_book_classes(self, book_classes_nt: List[Dict], book_classes_ot: List[Dict], **kwargs) -> None:
+        """
+        Overwrite the table book_classes to write down the classes of the books.
+        """
+        await self.replace_tables({"book_classes": (("testament", "position", "group_name", "books"), [
+            (testament, position, book_class["group"], json.dumps(book_class["books"]))
+            for testament, book_classes in (("nt", book_classes_nt), ("ot", book_classes_ot))
+            for position, book_class in enumerate(book_classes)])})
+
+    async def write_verse_documents(self, verse_documents: List[Dict], vocabulary: List[str], **kwargs) -> None:
+        """
+        Overwrite the tables verse_documents and vocabulary to write down one
+        row per verse, the token ids being stored as an array of int32.
+        """
+        await self.replace_tables({
+            "verse_documents": (VERSE_FIELDS, [self.verse_document_row(document) for document in verse_documents]),
+            "vocabulary": (("token_id", "lemma"), list(enumerate(vocabulary)))})
+
+    async def write_books(self, texts: List[Dict], chapters: List[Dict], verses: List[Dict], removed_books: Iterable[str] = (), **kwargs) -> None:
+        """
+        Overwrite the rows of some books in the tables texts, chapters and
+        verses within a single transaction, keeping the order of the books,
+        and remove the books of removed_books.
+        """
+        removed_books = list(removed_books)
+
+        def update(connection: sqlite3.Connection) -> None:
+            for table, columns, book_rows in (
+                    ("texts", ("book", "text"), [(data["book"], [(data["book"], data["text"])]) for data in texts]),
+                    ("chapters", ("book", "chapter", "text"), [(data["book"], self.chapter_rows(data)) for data in chapters]),
+                    ("verses", ("book", "chapter", "verse", "text"), [(data["book"], self.verse_rows(data)) for data in verses])):
+                for book, rows in book_rows:
+                    self.replace_book_rows(connection, table, columns, book, rows)
+                if removed_books:
+                    connection.execute(f"DELETE FROM {table} WHERE book IN ({', '.join('?' * len(removed_books))})",
+                                       removed_books)
+        await self.transaction(update)
+        logger.info(f"Updated {len(texts)} books and removed {len(removed_books)} books")
+
+    async def write_book_verse_documents(self, verse_documents: List[Dict], books: Iterable[str], **kwargs) -> None:
+        """
+        Overwrite the rows of some books in the table verse_documents within a
+        single transaction, the rows of the other books being left untouched.
+        """
+        books = list(books)
+
+        def update(connection: sqlite3.Connection) -> None:
+            connection.execute(f"DELETE FROM verse_documents WHERE book IN ({', '.join('?' * len(books))})", books)
+            connection.executemany(
+                f"INSERT INTO verse_documents ({', '.join(VERSE_FIELDS)}) VALUES ({', '.join('?' * len(VERSE_FIELDS))})",
+                [self.verse_document_row(document) for document in verse_documents])
+        await self.transaction(update)
+        logger.info(f"Updated {len(verse_documents)} rows of table verse_documents")
+
+    async def write_manifest(self, manifest: List[Dict], **kwargs) -> None:
+        """
+        Overwrite the table manifest to write down the manifest of the fill of
+        the database.
+        """
+        await self.replace_tables({"manifest": (("books",), [(json.dumps(manifest),)])})
+
+    async def write_fill_generation(self, generation: str) -> None:
+        """
+        Overwrite the table fill_generation to write down the id of the fill
+        of the database, once all of its tables are written.
+        """
+        await self.replace_tables({"fill_generation": (("generation",), [(generation,)])})
@@ -0,0 +1,236 @@
+# Python module defining the interface of the storages of the corpus
+import re
+from abc import ABC, abstractmethod
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Set
+from gnt_core.book_groups import BookGroupIndex
+
+# Fields of the documents of one verse, see StorageBackend.iter_verse_range
+VERSE_FIELDS = ("ordinal", "book", "chapter", "verse", "name", "text", "token_ids")
+
+
+def passage_number(label: str) -> int:
+    """
+    Get the number of a chapter or of a verse from its label, ignoring its
+    suffix ("42a" is verse 42) and labels without numbers being numbered 0
+    (the "Prolog" of Sirach precedes its first chapter).
+    """
+    match = re.match(r"\d+", label)
+    return int(match.group()) if match else 0
+
+
+def changed_books(previous_manifest: List[Dict], manifest: List[Dict]) -> Optional[Set[str]]:
+    """
+    Get the books whose source file or documents version differ between two
+    manifests (see StorageBackend.get_manifest), including the books of only
+    one of them, None if a manifest is empty as the changes are then unknown.
+    """
+    if not previous_manifest or not manifest:
+        return None
+    previous_versions = {entry["book"]: (entry["hash"], entry["version"]) for entry in previous_manifest}
+    versions = {entry["book"]: (entry["hash"], entry["version"]) for entry in manifest}
+    return {book for book in previous_versions.keys() | versions.keys()
+            if previous_versions.get(book) != versions.get(book)}
+
+
+def create_storage_backend(storage_backend: str = "mongodb", sqlite_path: str = "gnt.sqlite", **mongo_options) -> "StorageBackend":
+    """
+    Create the storage of the corpus, only importing the modules it needs.
+
+    Args:
+        storage_backend (str): The kind of storage ("mongodb" or "sqlite").
+        sqlite_path (str): Path of the SQLite database file.
+        mongo_options (dict): The arguments of MongoConnector.
+
+    Raises:
+        ValueError: If the kind of storage is unknown.
+    """
+    if storage_backend == "sqlite":
+        from gnt_core.sqlite_database import SQLiteConnector
+        return SQLiteConnector(sqlite_path)
+    if storage_backend == "mongodb":
+        from gnt_core.database import MongoConnector
+        return MongoConnector(**mongo_options)
+    raise ValueError(f"Unknown storage backend {storage_backend}")
+
+
+class StorageBackend(ABC):
+    """
+    Python class defining the methods of the storages of the corpus, so that
+    the API and the filler work the same whatever the storage:
+        - Get the data from the storage
+        - Send the data to the storage, each write replacing the previous
+          content at once
+    """
+
+    @abstractmethod
+    async def connect(self) -> "StorageBackend":
+        """
+        Connect to the storage.
+        """
+
+    @abstractmethod
+    async def close(self) -> None:
+        """
+        Close the connection to the storage.
+        """
+
+    @abstractmethod
+    async def get_book_lists(self) -> List[Dict[str, List[str]]]:
+        """
+        Get the list of the books.
+        """
+
+    @abstractmethod
+    async def get_book_classes_nt(self) -> List[Dict]:
+        """
+        Get the classes of the books of the NT.
+        """
+
+    @abstractmethod
+    async def get_book_classes_ot(self) -> List[Dict]:
+        """
+        Get the classes of the books of the OT.
+        """
+
+    async def get_book_classes(self) -> List[Dict]:
+        """
+        Get the classes of the books of the OT and of the NT.
+        """
+        return await self.get_book_classes_ot() + await self.get_book_classes_nt()
+
+    async def get_book_class(self, book_list: List[str]) -> List[str]:
+        """
+        For a given list of books, get their corresponding class, UNGROUPED
+        for the books without class.
+        """
+        return BookGroupIndex(await self.get_book_classes()).groups(book_list)
+
+    @abstractmethod
+    async def get_texts(self, text_list: Optional[List[str]] = None) -> List[Dict[str, str]]:
+        """
+        Get the text of the books of text_list, of all the books if it is not set.
+        """
+
+    @abstractmethod
+    async def get_chapters(self, text_list: Optional[List[str]] = None) -> List[Dict]:
+        """
+        Get the chapters of the books of text_list, of all the books if it is not set.
+        """
+
+    @abstractmethod
+    async def get_verses(self, text_list: Optional[List[str]] = None) -> List[Dict]:
+        """
+        Get the verses of the books of text_list, of all the books if it is not set.
+        """
+
+    @abstractmethod
+    def iter_verses(self, text_list: Optional[List[str]] = None, batch_size: int = 1) -> AsyncIterator[Dict]:
+        """
+        Iterate over the verses of the books of text_list, one book at a time.
+        """
+
+    @ staticmethod
+    def check_verse_range(chapter_start: Optional[int] = None, chapter_end: Optional[int] = None,
+                          verse_start: Optional[int] = None, verse_end: Optional[int] = None) -> None:
+        """
+        Check that the bounds of a range of verses are consistent.
+
+        Raises:
+            ValueError: If a verse bound is given without its chapter.
+        """
+        if (verse_start is not None and chapter_start is None) or (verse_end is not None and chapter_end is None):
+            raise ValueError("A verse bound requires the chapter it belongs to")
+
+    @abstractmethod
+    def iter_verse_range(self, book: str, chapter_start: Optional[int] = None, chapter_end: Optional[int] = None,
+                         verse_start: Optional[int] = None, verse_end: Optional[int] = None,
+                         fields: Optional[Iterable[str]] = None, batch_size: int = 500) -> AsyncIterator[Dict]:
+        """
+        Iterate over the verses of a book from verse_start of chapter_start to
+        verse_end of chapter_end, in the order of their chapter and verse
+        numbers, with the fields of VERSE_FIELDS asked for only.
+        """
+
+    @abstractmethod
+    async def get_vocabulary(self) -> List[str]:
+        """
+        Get the lemma associated with each token id of the verses.
+        """
+
+    @abstractmethod
+    async def get_fill_generation(self) -> Optional[str]:
+        """
+        Get the id of the last fill of the storage.
+        """
+
+    @abstractmethod
+    async def get_manifest(self) -> List[Dict]:
+        """
+        Get the manifest of the last fill of the storage: for each book, in
+        the order of the books, the hash of its source file, the version of
+        the documents built out of it and the range of its verse documents
+        (ordinal of its first verse and number of verses).
+        """
+
+    @abstractmethod
+    async def write_book_lists(self, book_names: List[str], **kwargs) -> None:
+        """
+        Overwrite the list of the books.
+        """
+
+    @abstractmethod
+    async def write_text(self, book_data: List[Dict], **kwargs) -> None:
+        """
+        Overwrite the text of each book.
+        """
+
+    @abstractmethod
+    async def write_chapters(self, book_data: List[Dict], **kwargs) -> None:
+        """
+        Overwrite the chapters of each book.
+        """
+
+    @abstractmethod
+    async def write_verses(self, book_data: List[Dict], **kwargs) -> None:
+        """
+        Overwrite the verses of each book.
+        """
+
+    @abstractmethod
+    async def write_book_classes(self, book_classes_nt: List[Dict], book_classes_ot: List[Dict], **kwargs) -> None:
+        """
+        Overwrite the classes of the books.
+        """
+
+    @abstractmethod
+    async def write_verse_documents(self, verse_documents: List[Dict], vocabulary: List[str], **kwargs) -> None:
+        """
+        Overwrite the documents of one verse and their vocabulary.
+        """
+
+    @abstractmethod
+    async def write_books(self, texts: List[Dict], chapters: List[Dict], verses: List[Dict], removed_books: Iterable[str] = (), **kwargs) -> None:
+        """
+        Overwrite the text, the chapters and the verses of some books in place,
+        the new books being added after the others, and remove the books of
+        removed_books, leaving the other books untouched.
+        """
+
+    @abstractmethod
+    async def write_book_verse_documents(self, verse_documents: List[Dict], books: Iterable[str], **kwargs) -> None:
+        """
+        Overwrite the documents of one verse of books by verse_documents,
+        leaving the documents of the other books and the vocabulary untouched.
+        """
+
+    @abstractmethod
+    async def write_manifest(self, manifest: List[Dict], **kwargs) -> None:
+        """
+        Overwrite the manifest of the fill of the storage.
+        """
+
+    @abstractmethod
+    async def write_fill_generation(self, generation: str) -> None:
+        """
+        Overwrite the id of the fill of the storage, once all of it is written.
+        """
@@ -0,0 +1,273 @@
+"""
+Unit tests of the gnt_core package, which do not need a database server.
+"""
+import asyncio
+import tempfile
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from gnt_core.artifact import CorpusArtifact, compile_corpus
+from gnt_core.book_groups import UNGROUPED, BookGroupIndex
+from gnt_core.database import MongoConnector
+from gnt_core.database_filler import DataBaseFiller, build_verse_documents
+from gnt_core.sources import LXXFormat, SBLGNTFormat
+from gnt_core.sqlite_database import SQLiteConnector
+from gnt_core.storage import changed_books, passage_number
+
+
+class TestVerseDocuments(unittest.TestCase):
+    """
+    Test the documents of the collection VerseDocuments and the filters of
+    the ranges of verses.
+    """
+
+    def test_build_verse_documents(self):
+        """
+        Test that there is one document per verse, numbered in order, whose
+        token ids refer to the sorted vocabulary.
+        """
+        filler = DataBaseFiller()
+        filler.texts_verses = [{"book": "Sir", "verses": {"Prolog": {"1": "λόγος καί "}, "1": {"1": "καί θεός ", "1a": "ὁ λόγος "}}}]
+        verse_documents, vocabulary = filler.build_verse_documents()
+        self.assertEqual(vocabulary, sorted(["θεός", "καί", "λόγος"]))
+        self.assertEqual([document["ordinal"] for document in verse_documents], [0, 1, 2])
+        self.assertEqual([(document["chapter"], document["verse"]) for document in verse_documents],
+                         [(0, 1), (1, 1), (1, 1)])
+        self.assertEqual(verse_documents[2]["name"], "Sir1,1a")
+        # The one letter lemma is not a token, as in sklearn vectorizers
+        self.assertEqual([vocabulary[token_id] for token_id in verse_documents[2]["token_ids"]], ["λόγος"])
+        self.assertEqual(passage_number("42a"), 42)
+
+    def test_verse_range_filter(self):
+        """
+        Test the filters of the ranges of verses within a chapter and across chapters.
+        """
+        self.assertEqual(MongoConnector.verse_range_filter("Mt", 5, 5, 3, 12),
+                         {"book": "Mt", "chapter": 5, "verse": {"$gte": 3, "$lte": 12}})
+        self.assertEqual(MongoConnector.verse_range_filter("Mt", 5, 7, verse_end=29),
+                         {"book": "Mt", "$and": [
+                             {"chapter": {"$gte": 5}},
+                             {"$or": [{"chapter": {"$lt": 7}}, {"chapter": 7, "verse": {"$lte": 29}}]}]})
+        self.assertEqual(MongoConnector.verse_range_filter("Mt"), {"book": "Mt"})
+        with self.assertRaises(ValueError):
+            MongoConnector.verse_range_filter("Mt", verse_start=3)
+
+
+class Collection:
+    """
+    In-memory collection with the methods used by MongoConnector.replace_collection.
+    """
+
+    def __init__(self, database: "Database", name: str) -> None:
+        self.database, self.name = database, name
+
+    async def drop(self):
+        self.database.collections.pop(self.name, None)
+
+    async def insert_many(self, documents, ordered=True):
+        self.database.collections[self.name].extend(documents[:self.database.capacity])
+
+    async def count_documents(self, query):
+        return len(self.database.collections[self.name])
+
+    async def create_indexes(self, indexes):
+        pass
+
+    async def rename(self, name, dropTarget=False):
+        self.database.collections[name] = self.database.collections.pop(self.name)
+
+
+class Database:
+    """
+    In-memory database, inserting at most capacity documents per batch.
+    """
+
+    def __init__(self, capacity: int) -> None:
+        self.capacity = capacity
+        self.collections = {"GNTText": [{"book": "Mt"}]}
+
+    def __getitem__(self, name: str) -> Collection:
+        return Collection(self, name)
+
+    async def create_collection(self, name):
+        self.collections[name] = []
+
+
+class TestReplaceCollection(unittest.TestCase):
+    """
+    Test the replacement of the collections through staging collections.
+    """
+
+    def test_replace_collection(self):
+        """
+        Test that the documents are swapped in once all of them are written,
+        and that the collection is left untouched otherwise.
+        """
+        connector = MongoConnector()
+        documents = [{"book": book} for book in ("Mt", "Mk", "Lk", "Jn", "Ac")]
+        connector.async_db = Database(capacity=1)
+        with self.assertRaises(RuntimeError):
+            asyncio.run(connector.replace_collection(connector.async_db["GNTText"], documents, batch_size=2))
+        self.assertEqual(connector.async_db.collections, {"GNTText": [{"book": "Mt"}]})
+        connector.async_db = Database(capacity=2)
+        asyncio.run(connector.replace_collection(connector.async_db["GNTText"], documents, batch_size=2, concurrency=2))
+        self.assertEqual(connector.async_db.collections, {"GNTText": documents})
+
+
+class TestSQLiteConnector(unittest.TestCase):
+    """
+    Test the SQLite storage of the corpus.
+    """
+
+    def test_round_trip(self):
+        """
+        Test that the content read from the database is the one written down,
+        as it would be read from mongo.
+        """
+        filler = DataBaseFiller()
+        filler.texts_verses = [{"book": "Mt", "verses": {"5": {"3": "μακάριος ὁ πτωχός ", "4": "μακάριος ὁ πενθέω "},
+                                                         "6": {"1": "προσέχω δέ "}}},
+                               {"book": "Mk", "verses": {"1": {"1": "ἀρχή ὁ εὐαγγέλιον "}}}]
+
+        async def round_trip(path: str):
+            storage = await SQLiteConnector(path).connect()
+            await storage.write_verses(filler.texts_verses)
+            await storage.write_verse_documents(*filler.build_verse_documents())
+            await storage.write_book_classes([{"group": "Gospels", "books": ["Mt"]}], [])
+            verses = await storage.get_verses(["Mt", "Mk"])
+            passage = [verse async for verse in storage.iter_verse_range("Mt", 5, 6, 4, 1, fields=["name", "token_ids"], batch_size=1)]
+            groups = await storage.get_book_class(["Mk", "Mt"])
+            await storage.close()
+            return verses, passage, groups
+
+        with tempfile.TemporaryDirectory() as folder:
+            verses, passage, groups = asyncio.run(round_trip(str(Path(folder) / "gnt.sqlite")))
+        self.assertEqual(verses, filler.texts_verses)
+        self.assertEqual([verse["name"] for verse in passage], ["Mt5,4", "Mt6,1"])
+        self.assertEqual(len(passage[0]["token_ids"]), 2)
+        self.assertEqual(groups, [UNGROUPED, "Gospels"])
+
+    def test_write_books(self):
+        """
+        Test that the books written down again keep their place among the
+        other books, whatever their new number of verses.
+        """
+        texts_verses = [{"book": "Mt", "verses": {"1": {"1": "βίβλος ", "2": "Ἀβραάμ "}}},
+                        {"book": "Mk", "verses": {"1": {"1": "ἀρχή "}}},
+                        {"book": "Lk", "verses": {"1": {"1": "ἐπειδήπερ "}}}]
+        updated_verses = [{"book": "Mt", "verses": {"1": {"1": "βίβλος ", "2": "Ἀβραάμ ", "3": "Ἰούδας "}}},
+                          {"book": "Jn", "verses": {"1": {"1": "ἀρχή "}}}]
+
+        async def update(path: str):
+            storage = await SQLiteConnector(path).connect()
+            await storage.write_verses(texts_verses)
+            await storage.write_books([], [], updated_verses, removed_books=["Mk"])
+            verses = await storage.get_verses()
+            await storage.close()
+            return verses
+
+        with tempfile.TemporaryDirectory() as folder:
+            verses = asyncio.run(update(str(Path(folder) / "gnt.sqlite")))
+        self.assertEqual(verses, [updated_verses[0], texts_verses[2], updated_verses[1]])
+        self.assertEqual(changed_books([{"book": "Mt", "hash": "a", "version": "1.1"}, {"book": "Mk", "hash": "b", "version": "1.1"}],
+                                       [{"book": "Mt", "hash": "a", "version": "1.1"}, {"book": "Mk", "hash": "c", "version": "1.1"},
+                                        {"book": "Lk", "hash": "d", "version": "1.1"}]),
+                         {"Mk", "Lk"})
+        self.assertIsNone(changed_books([], [{"book": "Mt", "hash": "a", "version": "1.1"}]))
+
+
+class TestSourceFormats(unittest.TestCase):
+    """
+    Test the parsing of the source files into books, chapters and verses.
+    """
+
+    def test_load_book(self):
+        """
+        Test that the texts of a book, of its chapters and of its verses are
+        built out of a single file, whatever its format.
+        """
+        with tempfile.TemporaryDirectory() as folder:
+            sblgnt_file = Path(folder) / "61-Mt-morphgnt.txt"
+            sblgnt_file.write_text("010101 N- ----NSF- Βίβλος βίβλος βίβλος\n"
+                                   "010101 N- ----GSF- γενέσεως γενέσεως γένεσις\n"
+                                   "010102 N- ----NSM- Ἀβραὰμ Ἀβραάμ Ἀβραάμ\n"
+                                   "010201 C- -------- δὲ δέ δέ\n", encoding="utf8")
+            lxx_file = Path(folder) / "Sir.js"
+            lxx_file.write_text('{"Sir.Prolog.1": [{"lemma": "πολύς"}], "Sir.1.1": [{"lemma": "πᾶς"}, {"lemma": "σοφία"}]}',
+                                encoding="utf-8")
+            sblgnt_book = SBLGNTFormat().load_book(sblgnt_file)
+            lxx_book = LXXFormat().load_book(lxx_file)
+        self.assertEqual(sblgnt_book.book, "Mt")
+        self.assertEqual(sblgnt_book.text, "βίβλος γένεσις Ἀβραάμ δέ ")
+        self.assertEqual(sblgnt_book.chapters, {"1": "βίβλος γένεσις Ἀβραάμ ", "2": "δέ "})
+        self.assertEqual(sblgnt_book.verses, {"1": {"1": "βίβλος γένεσις ", "2": "Ἀβραάμ "}, "2": {"1": "δέ "}})
+        self.assertEqual(lxx_book.book, "Sir")
+        self.assertEqual(lxx_book.chapters, {"Prolog": "πολύς ", "1": "πᾶς σοφία "})
+        self.assertEqual(lxx_book.verses, {"Prolog": {"1": "πολύς "}, "1": {"1": "πᾶς σοφία "}})
+
+    def test_load_sources(self):
+        """
+        Test that the books parsed by a pool of workers are the ones loaded
+        in the current process, in the same order.
+        """
+        filler, parallel_filler = DataBaseFiller(), DataBaseFiller()
+        filler.load_json(["sblgnt"])
+
+        async def load():
+            with ProcessPoolExecutor(2) as executor:
+                await parallel_filler.load_sources(executor, ["sblgnt"])
+
+        asyncio.run(load())
+        self.assertEqual([text["book"] for text in filler.texts][:3], ["Mt", "Mk", "Lk"])
+        self.assertEqual(parallel_filler.texts, filler.texts)
+        self.assertEqual(parallel_filler.texts_verses, filler.texts_verses)
+
+
+class TestCorpusArtifact(unittest.TestCase):
+    """
+    Test the corpus compiled into a memory-mapped file.
+    """
+
+    def test_compile_corpus(self):
+        """
+        Test that the books read from the compiled corpus are the ones parsed
+        from the source files, Proverbs' chapters not being in order, and
+        that the verse documents are the ones built from their verses.
+        """
+        files = [(source, file) for source, file in DataBaseFiller.source_files(["sblgnt", "lxx"])
+                 if file.name.startswith(("78-Phm", "Prov", "Ruth"))]
+        manifest = [DataBaseFiller.manifest_entry(source, file) for source, file in files]
+        with tempfile.TemporaryDirectory() as folder:
+            path = Path(folder) / "corpus.bin"
+            compile_corpus(path, [(SBLGNTFormat() if source == "sblgnt" else LXXFormat(), file) for source, file in files], manifest)
+            with CorpusArtifact(path) as artifact:
+                self.assertTrue(artifact.matches(manifest))
+                self.assertFalse(artifact.matches(manifest[1:]))
+                self.assertEqual(artifact.books, ["Phm", "Prov", "Ruth"])
+                books = [artifact.book_records(book) for book in artifact.books]
+                for book_records, (source, file) in zip(books, files):
+                    self.assertEqual(book_records, (SBLGNTFormat() if source == "sblgnt" else LXXFormat()).load_book(file))
+                self.assertEqual(artifact.verse_documents(), build_verse_documents(
+                    [{"book": book_records.book, "verses": book_records.verses} for book_records in books]))
+                self.assertEqual(artifact.parts_of_speech[artifact.section("word_parts_of_speech")[0]], "N-")
+
+
+class TestBookGroupIndex(unittest.TestCase):
+    """
+    Test the index of the groups of the books.
+    """
+
+    def test_groups(self):
+        """
+        Test that each book gets exactly one group, the books without group
+        being ungrouped, and that groups are expanded into their books.
+        """
+        index = BookGroupIndex([{"group": "Gospels", "books": ["Mt", "Mk"]},
+                                {"group": "Law", "books": ["Gen", "Mk"]}],
+                               books=["Gen", "Mt", "Mk", "Ro"])
+        self.assertEqual(index.groups(["Ro", "Mk", "Gen"]), [UNGROUPED, "Gospels", "Law"])
+        self.assertEqual(index.books(["Law", UNGROUPED]), ["Gen", "Ro"])
+        self.assertTrue(index.contains("Gospels", "Mt"))
+        self.assertEqual(index.unknown_groups(["Law", "Pauline"]), ["Pauline"])
+        with self.assertRaises(KeyError):
+            index.books(["Pauline"])
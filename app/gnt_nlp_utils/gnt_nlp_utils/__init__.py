@@ -1,7 +1,24 @@
-from urllib import request
+from functools import lru_cache
+from pathlib import Path
+from typing import FrozenSet
 
-STOP_WORDS = request.urlopen(
-    "https://raw.githubusercontent.com/stopwords-iso/stopwords-el/master/raw/stop-words-greek.txt").read().decode("utf8").split("\r")
-STOP_WORDS = [stop_word.strip()
-              for stop_word in STOP_WORDS if len(stop_word.strip()) > 0]
-STOP_WORDS.append('αὐτός')
+# Greek stop words of the stopwords-iso project, shipped along with the package
+STOP_WORDS_PATH = Path(__file__).parent / "data" / "stop-words-greek.txt"
+
+
+@lru_cache(maxsize=None)
+def get_stop_words() -> FrozenSet[str]:
+    """
+    Load the stop words on first use, normalized once and for all.
+    """
+    stop_words = STOP_WORDS_PATH.read_text(encoding="utf8").splitlines()
+    stop_words.append('αὐτός')
+    return frozenset(stop_word.strip().lower()
+                     for stop_word in stop_words if len(stop_word.strip()) > 0)
+
+
+def __getattr__(name: str):
+    # Keep STOP_WORDS available as a module attribute, without loading it at import time
+    if name == "STOP_WORDS":
+        return get_stop_words()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,11 +1,17 @@
-from typing import Dict, List
-import pandas as pd
-from scipy.sparse import data
-from sklearn.decomposition import PCA
-from sklearn.cluster import KMeans
-from sklearn.feature_extraction.text import TfidfVectorizer
+from __future__ import annotations
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, List, Tuple, Union
+import numpy as np
 
-from gnt_nlp_utils import STOP_WORDS
+from gnt_nlp_utils import get_stop_words
+from gnt_nlp_utils.timing import StageTimer
+
+# pandas, scipy and sklearn take most of the import time of the API, so that
+# they are only imported by the methods using them, on the first clustering
+if TYPE_CHECKING:
+    import pandas as pd
+    from scipy.sparse import spmatrix
+    from sklearn.cluster import MiniBatchKMeans
+    from sklearn.decomposition import IncrementalPCA
 
 
 class GNTClusterer:
@@ -17,45 +23,154 @@ class GNTClusterer:
     - Perform PCA on transformed data
     - Run clustering algorithm on the reduced data
     - Perform 3D projection of results using PCA
+
+    In sparse mode, the tf-idf matrix is kept as a float32 CSR matrix and
+    the PCA is computed on it without ever densifying it, so that the
+    memory used only grows with the number of non-zero values.
     """
 
+    def __init__(self, random_state: int = 0, max_clusters: int = 20, metric: str = "silhouette", n_jobs: int = -1, patience: int = 3, timer: StageTimer = None) -> None:
+        """
+        Initializes an object of class GNTClusterer.
+
+        Args:
+            random_state (int): Seed of the KMeans initialization, so that
+                two runs on the same data give the same clusters.
+            max_clusters (int): Largest number of clusters tried when it
+                is selected automatically.
+            metric (str): Score of the candidate numbers of clusters,
+                silhouette or calinski_harabasz.
+            n_jobs (int): Number of candidate numbers of clusters evaluated
+                in parallel, all of the cores if -1.
+            patience (int): Number of candidates without improvement of
+                the score after which the selection stops.
+            timer (StageTimer): Timer of the stages of the pipelines, disabled if not set.
+        """
+        self.random_state = random_state
+        self.max_clusters = max_clusters
+        self.metric = metric
+        self.n_jobs = n_jobs
+        self.patience = patience
+        self.timer = timer or StageTimer()
+
     @ staticmethod
     def clean(text_corpus: List[str], stop_words: List[str]) -> List[str]:
         """
         Given a list of strings, remove the words located in stop_words.
         """
-        clean_corpus = []
-        for text in text_corpus:
-            clean_text = ""
-            for word in text.split(" "):
-                if word not in stop_words:
-                    clean_text += " " + word
-            clean_corpus.append(clean_text.strip())
-        return clean_corpus
+        stop_words = frozenset(stop_words)
+        return [" ".join(word for word in text.split(" ")
+                         if word not in stop_words).strip()
+                for text in text_corpus]
 
     @ staticmethod
-    def tf_idf_vectorizer(text_corpus: List[str]) -> pd.DataFrame:
+    def tf_idf_vectorizer(text_corpus: List[str], sparse: bool = False) -> Union[pd.DataFrame, spmatrix]:
         """
         Compute the vectorization of the text.
 
         Args:
             text_corpus (list of strings): texts to perform the clustering on.
+            sparse (bool): If set to True, return the float32 CSR matrix
+                computed by sklearn instead of a dense dataframe.
 
         Returns:
-            A pandas dataframe containing the projected data.
+            A pandas dataframe (or a sparse matrix) containing the projected data.
         """
+        import pandas as pd
+        from sklearn.feature_extraction.text import TfidfVectorizer
+        if sparse:
+            tf_idf_vectorizer = TfidfVectorizer(
+                norm="l2", use_idf=True, dtype=np.float32)
+            return tf_idf_vectorizer.fit_transform(text_corpus).tocsr()
         tf_idf_vectorizer = TfidfVectorizer(norm="l2", use_idf=True)
         X = tf_idf_vectorizer.fit(text_corpus)
         return pd.DataFrame(X.transform(text_corpus).todense())
 
     @ staticmethod
-    def reduce(dataframe: pd.DataFrame, dimension: int = 3) -> pd.DataFrame:
+    def tf_idf_transformer(count_matrix: spmatrix, sparse: bool = True) -> Union[pd.DataFrame, spmatrix]:
+        """
+        Compute the tf-idf weighting of an already computed count matrix,
+        the idf being computed over the rows of the matrix only.
+        The lemmas not found within these rows are dropped, so that the
+        result is the same as the one of tf_idf_vectorizer on the
+        corresponding texts.
+
+        Args:
+            count_matrix (spmatrix): count of each lemma (columns)
+                in each text (rows).
+            sparse (bool): If set to True, return a float32 CSR matrix
+                instead of a dense dataframe.
+
+        Returns:
+            A pandas dataframe (or a sparse matrix) containing the projected data.
+        """
+        import pandas as pd
+        from sklearn.feature_extraction.text import TfidfTransformer
+        count_matrix = count_matrix.tocsc()
+        used_columns = np.flatnonzero(np.diff(count_matrix.indptr))
+        count_matrix = count_matrix[:, used_columns].tocsr()
+        tf_idf_transformer = TfidfTransformer(norm="l2", use_idf=True)
+        if sparse:
+            return tf_idf_transformer.fit_transform(
+                count_matrix.astype(np.float32)).tocsr()
+        return pd.DataFrame(
+            tf_idf_transformer.fit_transform(count_matrix).todense())
+
+    @ staticmethod
+    def sparse_pca(matrix: spmatrix, dimension: int = 3, return_basis: bool = False) -> Union[np.ndarray, Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        """
+        Perform a PCA on a sparse matrix, without densifying it.
+        The centering of the data is performed implicitly within the
+        matrix products of the truncated SVD.
+
+        Args:
+            matrix (spmatrix): sparse matrix to perform the reducing on.
+            dimension (int): dimensions to perform the reduce on.
+            return_basis (bool): Whether to also return the mean and the
+                components of the PCA, to project other rows later on.
+
+        Returns:
+            A float32 array projected in a reduced dimension, along with the
+            mean and the components if return_basis is set.
+        """
+        from scipy.sparse.linalg import LinearOperator, svds
+        from sklearn.utils.extmath import svd_flip
+        # The truncated SVD can only compute strictly less components than
+        # the smallest dimension of the matrix
+        dimension = min(dimension, min(matrix.shape) - 1)
+        # The decomposition itself is performed in double precision, as
+        # single precision ARPACK results vary slightly from one run to another
+        matrix = matrix.astype(np.float64)
+        mean = np.asarray(matrix.mean(axis=0)).ravel()
+
+        def matvec(vector):
+            vector = np.ravel(vector)
+            return matrix @ vector - mean @ vector
+
+        def rmatvec(vector):
+            vector = np.ravel(vector)
+            return matrix.T @ vector - mean * vector.sum()
+
+        centered_matrix = LinearOperator(
+            matrix.shape, matvec=matvec, rmatvec=rmatvec, dtype=np.float64)
+        # Use a fixed starting vector so that the decomposition is reproducible
+        v0 = np.random.RandomState(0).uniform(-1, 1, min(matrix.shape))
+        u, s, vt = svds(centered_matrix, k=dimension, v0=v0)
+        # Sort components by decreasing singular values, as done by sklearn
+        order = np.argsort(s)[::-1]
+        u, vt = svd_flip(u[:, order], vt[order])
+        if return_basis:
+            return (u * s[order]).astype(np.float32), mean, vt
+        return (u * s[order]).astype(np.float32)
+
+    @ staticmethod
+    def reduce(dataframe: Union[pd.DataFrame, spmatrix], dimension: int = 3) -> np.ndarray:
         """
-        Reduce a pandas data frame using PCA transformation
-        within dimension 'dimensions'.
+        Reduce a pandas data frame (or a sparse matrix) using PCA
+        transformation within dimension 'dimensions'.
 
         Args:
-            dataframe (pd.DataFrame): dataframe to perform the
+            dataframe (pd.DataFrame or spmatrix): dataframe to perform the
                 reducing on.
             dimension (int): dimensions to perform the reduce
                 on.
@@ -63,17 +178,21 @@ class GNTClusterer:
         Returns:
             A dataframe projected in a reduced dimension.
         """
-        dimension = min(dimension, dataframe.shape[0])
+        from scipy.sparse import issparse
+        from sklearn.decomposition import PCA
+        if issparse(dataframe):
+            return GNTClusterer.sparse_pca(dataframe, dimension=dimension)
+        dimension = min(dimension, *dataframe.shape)
         pca = PCA(n_components=dimension)
         return pca.fit_transform(dataframe)
 
-    def clusterize(self, dataframe: pd.DataFrame, name: List[str], n_cluster: int = 10, ground_truth: List[str] = None, text_corpus: List[str] = None) -> pd.DataFrame:
+    def clusterize(self, dataframe: Union[pd.DataFrame, np.ndarray, spmatrix], name: List[str], n_cluster: int = 10, ground_truth: List[str] = None, text_corpus: List[str] = None) -> pd.DataFrame:
         """
         Perform clustering on an input dataframe using kmeans.
 
         Args:
-            dataframe (pd.DataFrame): dataframe to perform the
-                reducing on.
+            dataframe (pd.DataFrame, array or spmatrix): dataframe to perform
+                the clustering on.
             name (Iterable): List of the values to use in final dataframe.
             n_cluster (int): Number of clusters to compute.
 
@@ -81,8 +200,11 @@ class GNTClusterer:
             A dataframe with the column labels and the corresponding index
             of labels.
         """
+        import pandas as pd
+        from sklearn.cluster import KMeans
         n_cluster = min(n_cluster, dataframe.shape[0])
-        kmeans = KMeans(n_clusters=n_cluster)
+        kmeans = KMeans(n_clusters=n_cluster, n_init=10,
+                        random_state=self.random_state)
         kmeans.fit(dataframe)
         if not ground_truth:
             return pd.DataFrame(
@@ -94,51 +216,772 @@ class GNTClusterer:
                  "ground_truth": ground_truth,
                  "text_corpus": text_corpus})
 
-    def pipeline(self, text_corpus: List[str], n_clusters: int = 10, names: List[str] = [], ground_truth: List[str] = None):
+    def score_n_clusters(self, reduced_matrix: np.ndarray, n_clusters: int) -> float:
+        """
+        Score the KMeans clustering of the reduced matrix in n_clusters clusters,
+        the higher the better.
+        """
+        from sklearn.cluster import KMeans
+        from sklearn.metrics import calinski_harabasz_score, silhouette_score
+        labels = KMeans(n_clusters=n_clusters, n_init=3,
+                        random_state=self.random_state).fit_predict(reduced_matrix)
+        if np.unique(labels).shape[0] < 2:
+            return -np.inf
+        if self.metric == "calinski_harabasz":
+            return float(calinski_harabasz_score(reduced_matrix, labels))
+        # The silhouette is quadratic in the number of rows, so that it is
+        # computed on a sample of them
+        return float(silhouette_score(reduced_matrix, labels,
+                                      sample_size=min(reduced_matrix.shape[0], 2000),
+                                      random_state=self.random_state))
+
+    def select_n_clusters(self, reduced_matrix: np.ndarray) -> Tuple[int, Dict[int, float]]:
+        """
+        Select the number of clusters of the reduced matrix, sweeping it from
+        2 to max_clusters. The candidates are evaluated n_jobs at a time in
+        parallel threads, and the sweep stops once the best score was not
+        improved by patience candidates.
+
+        Returns:
+            The number of clusters with the best score, and the score of each
+            evaluated number of clusters.
+        """
+        from joblib import Parallel, delayed, effective_n_jobs
+        from threadpoolctl import threadpool_limits
+        candidates = list(range(2, min(self.max_clusters, reduced_matrix.shape[0] - 1) + 1))
+        if not candidates:
+            return min(2, reduced_matrix.shape[0]), {}
+        n_jobs = effective_n_jobs(self.n_jobs)
+        scores: Dict[int, float] = {}
+        best_n_clusters, best_score, without_improvement = candidates[0], -np.inf, 0
+        # Each candidate runs on a single core, the parallelism being the one
+        # of the candidates
+        with threadpool_limits(limits=1), Parallel(n_jobs=n_jobs, prefer="threads") as parallel:
+            for start in range(0, len(candidates), n_jobs):
+                batch = candidates[start:start + n_jobs]
+                batch_scores = parallel(delayed(self.score_n_clusters)(reduced_matrix, n_clusters)
+                                        for n_clusters in batch)
+                for n_clusters, score in zip(batch, batch_scores):
+                    scores[n_clusters] = score
+                    if score > best_score:
+                        best_n_clusters, best_score, without_improvement = n_clusters, score, 0
+                    else:
+                        without_improvement += 1
+                if without_improvement >= self.patience:
+                    break
+        return best_n_clusters, scores
+
+    def pipeline(self, text_corpus: List[str], n_clusters: int = 10, names: List[str] = [], ground_truth: List[str] = None, sparse: bool = False, compact: bool = False):
         """
-        Perform all the required transformation on the pipeline.
+        Perform all the required transformation on the pipeline. Less than
+        three texts are not clustered, and give no results.
 
         Args:
             text_corpus (dict): Dictionary containing the books and
                 their labels.
-            n_clusters (int): Number of clusters to use.
+            n_clusters (int): Number of clusters to use, selected with
+                select_n_clusters if None.
+            sparse (bool): Whether to run the pipeline on the sparse tf-idf
+                matrix rather than on its dense version.
+            compact (bool): Whether to send the results back in the format
+                of format_compact_results.
         """
         if len(text_corpus) < 3:
-            return {"projection":
-                    {'x': [],
-                     'y': [],
-                     "z": []},
-                    "clusters": [],
-                    "labels": []}
+            return self.empty_compact_results() if compact else []
         # Clean up corpus
-        cleaned_corpus = self.clean(
-            text_corpus, stop_words=STOP_WORDS)
+        with self.timer.stage("clean"):
+            cleaned_corpus = self.clean(
+                text_corpus, stop_words=get_stop_words())
         # Vectorized data
-        vectorized_matrix = self.tf_idf_vectorizer(cleaned_corpus)
+        with self.timer.stage("tf_idf"):
+            vectorized_matrix = self.tf_idf_vectorizer(
+                cleaned_corpus, sparse=sparse)
+        return self.vectorized_pipeline(
+            vectorized_matrix, n_clusters=n_clusters, names=names,
+            ground_truth=ground_truth, text_corpus=text_corpus, compact=compact)
+
+    def pipeline_from_counts(self, count_matrix: spmatrix, n_clusters: int = 10, names: List[str] = [], ground_truth: List[str] = None, text_corpus: List[str] = None, sparse: bool = True, compact: bool = False):
+        """
+        Perform the pipeline on an already computed count matrix, typically
+        the rows of a precomputed CorpusMatrix: only the idf weighting is
+        computed again on the selected rows. Less than three rows are not
+        clustered, and give no results.
+
+        Args:
+            count_matrix (spmatrix): count of each lemma (columns)
+                in each text (rows).
+            n_clusters (int): Number of clusters to use, selected with
+                select_n_clusters if None.
+            text_corpus (list of strings): The texts associated with the rows,
+                sent back along with the results.
+            sparse (bool): Whether to run the pipeline on the sparse tf-idf
+                matrix rather than on its dense version.
+            compact (bool): Whether to send the results back in the format
+                of format_compact_results.
+        """
+        if count_matrix.shape[0] < 3:
+            return self.empty_compact_results() if compact else []
+        with self.timer.stage("tf_idf"):
+            vectorized_matrix = self.tf_idf_transformer(
+                count_matrix, sparse=sparse)
+        return self.vectorized_pipeline(
+            vectorized_matrix, n_clusters=n_clusters, names=names,
+            ground_truth=ground_truth, text_corpus=text_corpus, compact=compact)
+
+    def vectorized_pipeline(self, vectorized_matrix: Union[pd.DataFrame, spmatrix], n_clusters: int = 10, names: List[str] = [], ground_truth: List[str] = None, text_corpus: List[str] = None, compact: bool = False):
+        """
+        Perform the reduction, the clustering and the 3D projection of a
+        tf-idf matrix.
+
+        Args:
+            vectorized_matrix (pd.DataFrame or spmatrix): tf-idf matrix of the texts.
+            n_clusters (int): Number of clusters to use, selected with
+                select_n_clusters if None.
+            text_corpus (list of strings): The texts associated with the rows,
+                sent back along with the results.
+            compact (bool): Whether to send the results back in the format
+                of format_compact_results.
+        """
+        import pandas as pd
+        self.timer.record_matrix(vectorized_matrix)
         # Reduce data before clustering
-        reduced_vectorized_matrix = self.reduce(
-            vectorized_matrix, dimension=15)
+        with self.timer.stage("reduce"):
+            reduced_vectorized_matrix = self.reduce(
+                vectorized_matrix, dimension=15)
+        scores = None
+        if n_clusters is None:
+            with self.timer.stage("select_n_clusters"):
+                n_clusters, scores = self.select_n_clusters(reduced_vectorized_matrix)
+        n_clusters = min(n_clusters, reduced_vectorized_matrix.shape[0])
         # Cluster data
-        clustered_data = self.clusterize(
-            reduced_vectorized_matrix, name=names, n_cluster=n_clusters, ground_truth=ground_truth)
+        with self.timer.stage("clusterize"):
+            clustered_data = self.clusterize(
+                reduced_vectorized_matrix, name=names, n_cluster=n_clusters, ground_truth=ground_truth)
         # Perform final transformation
-        data_3D = pd.DataFrame(self.reduce(
-            reduced_vectorized_matrix, dimension=3))
-        data_3D.columns = ["x", "y", "z"]
-        # Send data back as a list of dictionary (per cluster)
+        with self.timer.stage("projection"):
+            projection = self.reduce(reduced_vectorized_matrix, dimension=3)
+            # Corpora of less than 4 texts have less than 3 components
+            data_3D = pd.DataFrame(np.pad(projection, ((0, 0), (0, 3 - projection.shape[1]))))
+            data_3D.columns = ["x", "y", "z"]
+        with self.timer.stage("format_results"):
+            if compact:
+                return self.format_compact_results(clustered_data, data_3D, text_corpus, n_clusters, scores)
+            return self.format_results(clustered_data, data_3D, text_corpus, n_clusters, scores)
+
+    def incremental_pipeline(self, count_matrix: spmatrix, rows: np.ndarray, state: ClusteringState = None, min_overlap: float = 0.8, n_clusters: int = 10, names: List[str] = [], ground_truth: List[str] = None, text_corpus: List[str] = None, compact: bool = False) -> Tuple[Union[List[Dict], Dict], ClusteringState]:
+        """
+        Perform the pipeline on some rows of a corpus matrix, warm-starting it
+        from the state of a previous run if its rows overlap enough with them:
+        the lemmas, idf and reduction of the previous run are kept, so that
+        only the rows which were not clustered yet have to be projected, and
+        the KMeans is initialized with the previous centroids.
+        A full run is performed otherwise.
+
+        Args:
+            count_matrix (spmatrix): count of each lemma (columns) in each
+                text (rows) of the whole corpus.
+            rows (np.ndarray): sorted index of the rows to cluster.
+            state (ClusteringState): state of the previous run, if any.
+            min_overlap (float): minimum Jaccard index of the rows of the
+                previous run and of the rows to cluster to warm-start the run.
+            n_clusters (int): Number of clusters to use, the one of the
+                previous run or selected with select_n_clusters if None.
+            text_corpus (list of strings): The texts associated with the rows,
+                sent back along with the results.
+            compact (bool): Whether to send the results back in the format
+                of format_compact_results.
+
+        Returns:
+            The results of the run and its state.
+        """
+        import pandas as pd
+        from sklearn.cluster import KMeans
+        from sklearn.decomposition import PCA
+        rows = np.asarray(rows)
+        if rows.shape[0] < 3:
+            results = self.empty_compact_results() if compact else []
+            return results, None
+        scores = None
+        if (state is not None and state.overlap(rows) >= min_overlap
+                and (n_clusters is None or state.centroids.shape[0] == min(n_clusters, rows.shape[0]))):
+            # Reuse the reduced coordinates of the rows already clustered,
+            # and only project the new ones
+            positions = np.searchsorted(state.rows, rows).clip(max=state.rows.shape[0] - 1)
+            known = state.rows[positions] == rows
+            reduced = np.empty((rows.shape[0], state.reduced.shape[1]), dtype=np.float32)
+            reduced[known] = state.reduced[positions[known]]
+            with self.timer.stage("reduce"):
+                if not known.all():
+                    reduced[~known] = state.reduce(count_matrix[rows[~known]])
+            with self.timer.stage("clusterize"):
+                kmeans = KMeans(n_clusters=state.centroids.shape[0], init=state.centroids,
+                                n_init=1).fit(reduced)
+            state = ClusteringState(rows, state.columns, state.idf, state.mean, state.components,
+                                    reduced, kmeans.cluster_centers_, state.mean_3D, state.components_3D)
+            state.warm_started = True
+        else:
+            with self.timer.stage("tf_idf"):
+                selected_counts = count_matrix[rows].tocsc()
+                columns = np.flatnonzero(np.diff(selected_counts.indptr))
+                idf = (np.log((1 + rows.shape[0]) / (1 + np.diff(selected_counts.indptr)[columns])) + 1)
+                state = ClusteringState(rows, columns, idf, None, None, None, None, None, None)
+                vectorized_matrix = state.tf_idf(selected_counts)
+            self.timer.record_matrix(vectorized_matrix)
+            with self.timer.stage("reduce"):
+                reduced, state.mean, state.components = self.sparse_pca(
+                    vectorized_matrix, dimension=15, return_basis=True)
+            if n_clusters is None:
+                with self.timer.stage("select_n_clusters"):
+                    n_clusters, scores = self.select_n_clusters(reduced)
+            with self.timer.stage("clusterize"):
+                kmeans = KMeans(n_clusters=min(n_clusters, rows.shape[0]), n_init=10,
+                                random_state=self.random_state).fit(reduced)
+            state.reduced = reduced
+            state.centroids = kmeans.cluster_centers_
+            with self.timer.stage("projection"):
+                pca = PCA(n_components=min(3, *reduced.shape)).fit(reduced)
+                state.mean_3D, state.components_3D = pca.mean_, pca.components_
+        clustered_data = pd.DataFrame(
+            {"label": names, "cluster": kmeans.labels_, "ground_truth": ground_truth})
+        data_3D = pd.DataFrame(state.project_3D(reduced), columns=["x", "y", "z"])
+        n_clusters = state.centroids.shape[0]
+        with self.timer.stage("format_results"):
+            if compact:
+                return self.format_compact_results(clustered_data, data_3D, text_corpus, n_clusters, scores), state
+            return self.format_results(clustered_data, data_3D, text_corpus, n_clusters, scores), state
+
+    def linkage_tree(self, reduced_matrix: np.ndarray, max_leaves: int = None) -> ClusteringTree:
+        """
+        Compute the Ward linkage tree of the rows of a reduced matrix. If there
+        are more than max_leaves rows, the leaves of the tree are the centroids
+        of max_leaves KMeans micro-clusters of the rows, so that the quadratic
+        distance matrix of the linkage is computed on max_leaves points only.
+
+        Args:
+            reduced_matrix (np.ndarray): reduced tf-idf matrix of the texts.
+            max_leaves (int): Maximum number of leaves of the tree, no limit if None.
+        """
+        from scipy.cluster.hierarchy import linkage
+        from sklearn.cluster import MiniBatchKMeans
+        from sklearn.decomposition import PCA
+        n_rows = reduced_matrix.shape[0]
+        if max_leaves is not None and n_rows > max_leaves:
+            # The k-means++ initialization is performed on a sample of
+            # 3 * max_leaves rows rather than of 3 batches
+            kmeans = MiniBatchKMeans(n_clusters=max_leaves, n_init=1, batch_size=4096,
+                                     init_size=min(n_rows, 3 * max_leaves),
+                                     random_state=self.random_state).fit(reduced_matrix)
+            # Empty micro-clusters are dropped from the leaves
+            used, leaves = np.unique(kmeans.labels_, return_inverse=True)
+            points = kmeans.cluster_centers_[used]
+        else:
+            leaves, points = np.arange(n_rows), reduced_matrix
+        tree = linkage(points.astype(np.float64), method="ward")
+        projection = PCA(n_components=min(3, *reduced_matrix.shape)).fit_transform(reduced_matrix)
+        return ClusteringTree(tree, leaves.astype(np.int32),
+                              np.pad(projection, ((0, 0), (0, 3 - projection.shape[1]))).astype(np.float32),
+                              micro_clusters=points is not reduced_matrix)
+
+    def hierarchical_pipeline(self, count_matrix: spmatrix, n_clusters: int = None, distance: float = None, names: List[str] = [], ground_truth: List[str] = None, text_corpus: List[str] = None, compact: bool = False, tree: ClusteringTree = None, max_leaves: int = None) -> Tuple[Union[List[Dict], Dict], ClusteringTree]:
+        """
+        Perform the agglomerative clustering of a count matrix, cutting its
+        linkage tree into n_clusters clusters or at a distance. The tree of a
+        previous run on the same rows can be given, so that only its cut is
+        computed.
+
+        Args:
+            count_matrix (spmatrix): count of each lemma (columns) in each text (rows).
+            n_clusters (int): Number of clusters to cut the tree into, selected
+                with ClusteringTree.select_n_clusters if neither it nor the
+                distance is set.
+            distance (float): Distance to cut the tree at.
+            text_corpus (list of strings): The texts associated with the rows,
+                sent back along with the results.
+            compact (bool): Whether to send the results back in the format
+                of format_compact_results.
+            tree (ClusteringTree): linkage tree of the rows, if already computed.
+            max_leaves (int): Maximum number of leaves of the tree, see linkage_tree.
+
+        Returns:
+            The results of the run and the linkage tree.
+        """
+        import pandas as pd
+        if count_matrix.shape[0] < 3:
+            results = self.empty_compact_results() if compact else []
+            return results, None
+        if tree is None:
+            with self.timer.stage("tf_idf"):
+                vectorized_matrix = self.tf_idf_transformer(count_matrix, sparse=True)
+            self.timer.record_matrix(vectorized_matrix)
+            with self.timer.stage("reduce"):
+                reduced_vectorized_matrix = self.reduce(vectorized_matrix, dimension=15)
+            with self.timer.stage("linkage"):
+                tree = self.linkage_tree(reduced_vectorized_matrix, max_leaves=max_leaves)
+        scores = None
+        with self.timer.stage("cut"):
+            if n_clusters is None and distance is None:
+                n_clusters, scores = tree.select_n_clusters(self.max_clusters)
+            clusters = tree.cut(n_clusters=n_clusters, distance=distance)
+        clustered_data = pd.DataFrame(
+            {"label": names, "cluster": clusters, "ground_truth": ground_truth})
+        data_3D = pd.DataFrame(tree.projection, columns=["x", "y", "z"])
+        n_clusters = int(clusters.max()) + 1
+        with self.timer.stage("format_results"):
+            if compact:
+                return self.format_compact_results(clustered_data, data_3D, text_corpus, n_clusters, scores), tree
+            return self.format_results(clustered_data, data_3D, text_corpus, n_clusters, scores), tree
+
+    @ staticmethod
+    def format_results(clustered_data: pd.DataFrame, data_3D: pd.DataFrame, text_corpus: List[str] = None, n_clusters: int = None, scores: Dict[int, float] = None) -> List[Dict]:
+        """
+        Send the clustering results back as a list of dictionary (one per
+        ground truth group).
+
+        Args:
+            clustered_data (pd.DataFrame): dataframe with the columns label,
+                cluster and ground_truth.
+            data_3D (pd.DataFrame): dataframe with the columns x, y and z.
+            text_corpus (list of strings): The texts associated with the rows.
+            n_clusters (int): The number of clusters used.
+            scores (dict): The score of each number of clusters tried, if
+                it was selected automatically.
+        """
+        coordinates = data_3D[["x", "y", "z"]].to_numpy()
+        clusters = clustered_data.cluster.to_numpy()
+        labels = clustered_data.label.to_numpy()
         projections = []
-        for cluster in pd.unique(clustered_data.ground_truth):
-            sub_clustered_data = clustered_data[clustered_data.ground_truth == cluster]
-            sub_3d_data = data_3D[clustered_data.ground_truth == cluster]
+        for group, rows in GNTClusterer.group_rows(clustered_data.ground_truth).items():
             projections.append(
                 {"projection":
-                 {'x': sub_3d_data.x.values.tolist(),
-                  'y': sub_3d_data.y.values.tolist(),
-                  "z": sub_3d_data.z.values.tolist()},
-                 "clusters": sub_clustered_data.cluster.values.tolist(),
-                 "labels": sub_clustered_data.label.values.tolist(),
-                 "ground_truth": sub_clustered_data.ground_truth.values.tolist(),
+                 {'x': coordinates[rows, 0].tolist(),
+                  'y': coordinates[rows, 1].tolist(),
+                  "z": coordinates[rows, 2].tolist()},
+                 "clusters": clusters[rows].tolist(),
+                 "labels": labels[rows].tolist(),
+                 "ground_truth": [group] * len(rows),
                  "fullText": text_corpus,
-                 "markers": {"color": "blue"}}
+                 "markers": {"color": "blue"},
+                 "n_clusters": n_clusters,
+                 "scores": scores}
             )
         return projections
+
+    @ staticmethod
+    def format_compact_results(clustered_data: pd.DataFrame, data_3D: pd.DataFrame, text_corpus: List[str] = None, n_clusters: int = None, scores: Dict[int, float] = None) -> Dict:
+        """
+        Send the clustering results back as a single dictionary, each text
+        being sent once, and each ground truth group being given by the
+        index of its texts:
+            - projection: float32 array of shape (number of texts, 3)
+            - labels: name of each text
+            - clusters: int32 array of the cluster of each text
+            - groups: list of dictionaries with the ground_truth of the group
+              and the int32 array of the index of its points
+            - fullText: the texts, only sent if text_corpus is given
+            - n_clusters: the number of clusters used
+            - scores: the score of each number of clusters tried, if it was
+              selected automatically
+
+        Args:
+            clustered_data (pd.DataFrame): dataframe with the columns label,
+                cluster and ground_truth.
+            data_3D (pd.DataFrame): dataframe with the columns x, y and z.
+            text_corpus (list of strings): The texts associated with the rows.
+            n_clusters (int): The number of clusters used.
+            scores (dict): The score of each number of clusters tried.
+        """
+        return {"projection": data_3D[["x", "y", "z"]].to_numpy(dtype=np.float32),
+                "labels": clustered_data.label.tolist(),
+                "clusters": clustered_data.cluster.to_numpy(dtype=np.int32),
+                "groups": [{"ground_truth": group, "points": rows.astype(np.int32)}
+                           for group, rows in GNTClusterer.group_rows(clustered_data.ground_truth).items()],
+                "fullText": list(text_corpus) if text_corpus is not None else None,
+                "n_clusters": n_clusters,
+                "scores": scores}
+
+    @ staticmethod
+    def empty_compact_results() -> Dict:
+        """
+        Compact results of a corpus too small to be clustered.
+        """
+        return {"projection": np.empty((0, 3), dtype=np.float32),
+                "labels": [],
+                "clusters": np.empty(0, dtype=np.int32),
+                "groups": [],
+                "fullText": None,
+                "n_clusters": 0,
+                "scores": None}
+
+    @ staticmethod
+    def group_rows(ground_truth: Iterable[str]) -> Dict[str, np.ndarray]:
+        """
+        Get the index of the rows of each ground truth group, in a single
+        grouped pass, the groups being in order of first appearance.
+        """
+        import pandas as pd
+        return pd.DataFrame({"ground_truth": ground_truth}).groupby(
+            "ground_truth", sort=False, dropna=False).indices
+
+
+class ClusteringState:
+    """
+    State of a clustering run, from which a run on an overlapping selection
+    of rows can be warm-started:
+        - The rows of the corpus matrix which were clustered, sorted
+        - The columns (lemmas) of the corpus matrix which were used, and their idf
+        - The mean and the components of the reduction of the tf-idf matrix
+        - The reduced coordinates of each row
+        - The KMeans centroids
+        - The mean and the components of the 3D projection of the reduced rows
+
+    Only numpy arrays are held, so that the state can be sent back to the API
+    without it importing sklearn.
+    """
+
+    def __init__(self, rows: np.ndarray, columns: np.ndarray, idf: np.ndarray, mean: np.ndarray, components: np.ndarray, reduced: np.ndarray, centroids: np.ndarray, mean_3D: np.ndarray, components_3D: np.ndarray) -> None:
+        self.rows = rows
+        self.columns = columns
+        self.idf = idf
+        self.mean = mean
+        self.components = components
+        self.reduced = reduced
+        self.centroids = centroids
+        self.mean_3D = mean_3D
+        self.components_3D = components_3D
+        self.warm_started = False
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Number of bytes taken up by the arrays of the state.
+        """
+        return sum(array.nbytes for array in (self.rows, self.columns, self.idf, self.mean, self.components,
+                                               self.reduced, self.centroids, self.mean_3D, self.components_3D))
+
+    def overlap(self, rows: np.ndarray) -> float:
+        """
+        Get the Jaccard index of the rows of the state and of other rows.
+        """
+        intersection = np.intersect1d(self.rows, rows, assume_unique=True).shape[0]
+        union = self.rows.shape[0] + rows.shape[0] - intersection
+        return intersection / union if union else 0.
+
+    def tf_idf(self, count_matrix: spmatrix) -> spmatrix:
+        """
+        Compute the tf-idf matrix of rows of the corpus matrix, using the
+        columns and the idf of the state.
+        """
+        from sklearn.preprocessing import normalize
+        tf_idf_matrix = count_matrix[:, self.columns].astype(np.float64).tocsr()
+        tf_idf_matrix.data *= self.idf[tf_idf_matrix.indices]
+        return normalize(tf_idf_matrix)
+
+    def reduce(self, count_matrix: spmatrix) -> np.ndarray:
+        """
+        Project rows of the corpus matrix on the components of the state.
+        """
+        return ((self.tf_idf(count_matrix) @ self.components.T)
+                - self.mean @ self.components.T).astype(np.float32)
+
+    def project_3D(self, reduced: np.ndarray) -> np.ndarray:
+        """
+        Perform the 3D projection of reduced rows.
+        """
+        projection = (reduced - self.mean_3D) @ self.components_3D.T
+        # Corpora of less than 4 texts have less than 3 components
+        return np.pad(projection, ((0, 0), (0, 3 - projection.shape[1])))
+
+
+class ClusteringTree:
+    """
+    Ward linkage tree of the rows of a clustering, along with their 3D
+    projection, from which any number of clusters can be cut:
+        - linkage: linkage matrix of scipy, whose merges are sorted by
+          increasing distance
+        - leaves: the leaf of each row, the row itself unless the leaves
+          are micro-clusters of the rows
+        - projection: float32 3D projection of the rows
+
+    It only holds numpy arrays, so that it can be cached and sent to the
+    worker processes cheaply.
+    """
+
+    def __init__(self, linkage: np.ndarray, leaves: np.ndarray, projection: np.ndarray, micro_clusters: bool = False) -> None:
+        self.linkage = linkage
+        self.leaves = leaves
+        self.projection = projection
+        self.micro_clusters = micro_clusters
+
+    @property
+    def n_leaves(self) -> int:
+        return self.linkage.shape[0] + 1
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Number of bytes taken up by the arrays of the tree.
+        """
+        return self.linkage.nbytes + self.leaves.nbytes + self.projection.nbytes
+
+    def cut(self, n_clusters: int = None, distance: float = None) -> np.ndarray:
+        """
+        Cut the tree into n_clusters clusters, or at a distance, in a single
+        pass over its merges.
+
+        Returns:
+            The cluster of each row, numbered in order of first appearance.
+        """
+        n_leaves = self.n_leaves
+        if distance is not None:
+            n_merges = int(np.searchsorted(self.linkage[:, 2], distance, side="right"))
+        else:
+            n_merges = n_leaves - min(max(n_clusters, 1), n_leaves)
+        # Each node is merged into a node of higher index, so that resolving
+        # the nodes by decreasing index gives the root of each of them
+        parents = np.arange(2 * n_leaves - 1)
+        merged = self.linkage[:n_merges, :2].astype(np.int64)
+        parents[merged[:, 0]] = parents[merged[:, 1]] = n_leaves + np.arange(n_merges)
+        roots = parents.copy()
+        for node in range(n_leaves + n_merges - 1, -1, -1):
+            roots[node] = roots[parents[node]]
+        _, first_rows, clusters = np.unique(roots[:n_leaves][self.leaves],
+                                            return_index=True, return_inverse=True)
+        # Number the clusters in order of first appearance
+        order = np.argsort(np.argsort(first_rows))
+        return order[clusters.ravel()].astype(np.int32)
+
+    def select_n_clusters(self, max_clusters: int = 20) -> Tuple[int, Dict[int, float]]:
+        """
+        Select the number of clusters preceding the largest gap between the
+        distances of two successive merges, among 2 to max_clusters clusters.
+
+        Returns:
+            The number of clusters selected, and the gap of each number of clusters.
+        """
+        distances = self.linkage[:, 2]
+        scores = {n_clusters: float(distances[-n_clusters + 1] - distances[-n_clusters])
+                  for n_clusters in range(2, min(max_clusters, self.n_leaves - 1) + 1)}
+        if not scores:
+            return min(2, self.n_leaves), scores
+        return max(scores, key=scores.get), scores
+
+    def dendrogram(self, labels: List[str]) -> Dict:
+        """
+        Get a compact description of the tree, whose leaves are the rows:
+            - labels: name of each leaf
+            - children: the two nodes merged by each merge, the leaves being
+              numbered from 0 and the merge i being the node number of leaves + i
+            - distances: distance of each merge
+            - sizes: number of leaves below each merge
+        """
+        return {"labels": list(labels),
+                "children": self.linkage[:, :2].astype(np.int64).tolist(),
+                "distances": self.linkage[:, 2].tolist(),
+                "sizes": self.linkage[:, 3].astype(np.int64).tolist()}
+
+
+class StreamingGNTClusterer:
+    """
+    Class to perform the clustering of a corpus too large to be held in memory
+    as a single matrix, reading it chunk by chunk over several passes:
+
+    - Remove stop words and hash the words of the texts into a fixed
+      number of features, computing the document frequency of each feature
+    - Fit an incremental PCA on a random projection of the tf-idf of the
+      hashed features
+    - Fit a mini-batch KMeans on the reduced data
+    - Assign the clusters and perform the 3D projection of each text
+
+    The 3D projection is given by the first three components of the
+    incremental PCA, which is what a PCA of the reduced data gives.
+    Only batch_size texts are vectorized at once, so that the memory used
+    does not depend on the size of the corpus.
+    """
+
+    n_passes = 4
+    # Name of the stage of each pass, for the timer
+    pass_names = ("document_frequency", "fit_reduce", "fit_clusterize", "assign")
+
+    def __init__(self, n_clusters: int = 10, batch_size: int = 1000, n_features: int = 2 ** 16, projection_dimension: int = 256, dimension: int = 15, random_state: int = 0, selector: GNTClusterer = None) -> None:
+        """
+        Initializes an object of class StreamingGNTClusterer.
+
+        Args:
+            n_clusters (int): Number of clusters to compute, selected on the
+                first batch of reduced texts if None.
+            batch_size (int): Number of texts to process at once.
+            n_features (int): Number of features to hash the words into.
+            projection_dimension (int): Dimension of the random projection of
+                the hashed features, on which the incremental PCA is fitted.
+            dimension (int): Dimension of the data to perform the clustering on.
+            random_state (int): Seed of the KMeans initialization.
+            selector (GNTClusterer): Clusterer whose select_n_clusters is
+                used to select the number of clusters, and whose timer
+                records the passes of the pipeline.
+        """
+        from scipy.sparse import csr_matrix
+        from sklearn.feature_extraction.text import HashingVectorizer
+        from sklearn.random_projection import SparseRandomProjection
+        self.n_clusters = n_clusters
+        self.batch_size = batch_size
+        self.dimension = dimension
+        self.random_state = random_state
+        self.selector = selector or GNTClusterer(random_state=random_state)
+        self.timer = self.selector.timer
+        self.scores: Dict[int, float] = None
+        self.hashing_vectorizer = HashingVectorizer(
+            n_features=n_features, alternate_sign=False, norm=None, dtype=np.float32)
+        # The projection only depends on the number of features, so that
+        # it is fitted on an empty matrix. Its density is set so that each
+        # feature is projected on several components, texts being very sparse.
+        self.projection = SparseRandomProjection(
+            n_components=projection_dimension, density=1 / np.sqrt(projection_dimension),
+            dense_output=True, random_state=random_state).fit(csr_matrix((1, n_features), dtype=np.float32))
+        self.document_frequency = np.zeros(n_features, dtype=np.int64)
+        self.n_documents = 0
+        self.n_nonzeros = 0
+        self.idf: np.ndarray = None
+        self.reducer: IncrementalPCA = None
+        self.kmeans: MiniBatchKMeans = None
+        self.current_pass = 0
+        self.buffer: List[Tuple[str, str, str]] = []
+        self.results: Dict[str, List] = {
+            "label": [], "cluster": [], "ground_truth": [], "text_corpus": [], "projection": []}
+
+    def vectorize(self, text_corpus: List[str]) -> spmatrix:
+        """
+        Hash the words of the texts, once their stop words are removed.
+        """
+        return self.hashing_vectorizer.transform(
+            GNTClusterer.clean(text_corpus, stop_words=get_stop_words()))
+
+    def tf_idf(self, text_corpus: List[str]) -> np.ndarray:
+        """
+        Compute the random projection of the tf-idf matrix of a batch of texts,
+        using the document frequencies computed during the first pass.
+        """
+        from sklearn.preprocessing import normalize
+        vectorized_matrix = self.vectorize(text_corpus).tocsr()
+        vectorized_matrix.data *= self.idf[vectorized_matrix.indices]
+        return self.projection.transform(normalize(vectorized_matrix)).astype(np.float32)
+
+    def partial_fit(self, text_corpus: List[str], names: List[str], ground_truth: List[str]) -> None:
+        """
+        Feed a chunk of texts to the current pass, processing them
+        batch_size texts at a time.
+
+        Args:
+            text_corpus (list of strings): texts of the chunk.
+            names (list of strings): name of each text.
+            ground_truth (list of strings): ground truth group of each text.
+        """
+        self.buffer.extend(zip(text_corpus, names, ground_truth))
+        while len(self.buffer) >= self.batch_size:
+            self.process_batch(self.buffer[:self.batch_size])
+            self.buffer = self.buffer[self.batch_size:]
+
+    def end_pass(self) -> None:
+        """
+        Process the remaining texts of the current pass, and get ready for
+        the next one.
+        """
+        if self.buffer:
+            self.process_batch(self.buffer)
+            self.buffer = []
+        if self.current_pass == 0:
+            self.idf = (np.log((1 + self.n_documents) / (1 + self.document_frequency)) + 1).astype(np.float32)
+        self.current_pass += 1
+
+    def process_batch(self, batch: List[Tuple[str, str, str]]) -> None:
+        """
+        Process a batch of (text, name, ground truth) according to the current pass.
+        """
+        from sklearn.cluster import MiniBatchKMeans
+        from sklearn.decomposition import IncrementalPCA
+        text_corpus = [text for text, _, _ in batch]
+        if self.current_pass == 0:
+            vectorized_matrix = self.vectorize(text_corpus)
+            vectorized_matrix.sum_duplicates()
+            self.document_frequency += np.bincount(
+                vectorized_matrix.indices, minlength=self.document_frequency.shape[0])
+            self.n_documents += len(text_corpus)
+            self.n_nonzeros += vectorized_matrix.nnz
+        elif self.current_pass == 1:
+            if self.reducer is None:
+                self.reducer = IncrementalPCA(
+                    n_components=min(self.dimension, len(text_corpus)))
+            self.reducer.partial_fit(self.tf_idf(text_corpus))
+        elif self.current_pass == 2:
+            reduced_matrix = self.reducer.transform(self.tf_idf(text_corpus))
+            if self.kmeans is None:
+                n_clusters = self.n_clusters
+                if n_clusters is None:
+                    n_clusters, self.scores = self.selector.select_n_clusters(reduced_matrix)
+                self.kmeans = MiniBatchKMeans(
+                    n_clusters=min(n_clusters, len(text_corpus)),
+                    random_state=self.random_state, n_init=3)
+            self.kmeans.partial_fit(reduced_matrix)
+        else:
+            reduced_matrix = self.reducer.transform(self.tf_idf(text_corpus))
+            self.results["cluster"].append(self.kmeans.predict(reduced_matrix))
+            self.results["projection"].append(
+                reduced_matrix[:, :3].astype(np.float32))
+            self.results["label"].extend(name for _, name, _ in batch)
+            self.results["ground_truth"].extend(group for _, _, group in batch)
+            self.results["text_corpus"].extend(text_corpus)
+
+    def format_results(self, compact: bool = False, full_text: bool = True) -> Union[List[Dict], Dict]:
+        """
+        Send the results of the last pass back, in the same format as
+        the one of GNTClusterer.pipeline.
+
+        Args:
+            compact (bool): Whether to use the format of
+                GNTClusterer.format_compact_results.
+            full_text (bool): Whether to send the texts back in the compact format.
+        """
+        import pandas as pd
+        clustered_data = pd.DataFrame(
+            {"label": self.results["label"],
+             "cluster": np.concatenate(self.results["cluster"]),
+             "ground_truth": self.results["ground_truth"]})
+        data_3D = pd.DataFrame(np.concatenate(self.results["projection"]),
+                               columns=["x", "y", "z"])
+        if compact:
+            return GNTClusterer.format_compact_results(
+                clustered_data, data_3D, self.results["text_corpus"] if full_text else None,
+                self.kmeans.n_clusters, self.scores)
+        return GNTClusterer.format_results(
+            clustered_data, data_3D, self.results["text_corpus"], self.kmeans.n_clusters, self.scores)
+
+    def pipeline(self, chunks: Callable[[], Iterable[Tuple[List[str], List[str], List[str]]]], compact: bool = False, full_text: bool = True) -> Union[List[Dict], Dict]:
+        """
+        Perform all the passes of the pipeline.
+
+        Args:
+            chunks (callable): function returning a new iterator over the chunks
+                of the corpus, as tuples of (texts, names, ground truth).
+            compact (bool): Whether to send the results back in the compact format.
+            full_text (bool): Whether to send the texts back in the compact format.
+        """
+        for pass_name in self.pass_names[:self.n_passes]:
+            with self.timer.stage(pass_name):
+                for text_corpus, names, ground_truth in chunks():
+                    self.partial_fit(text_corpus, names, ground_truth)
+                self.end_pass()
+        if self.timer.enabled:
+            self.timer.sizes.update(documents=self.n_documents,
+                                    vocabulary=int(np.count_nonzero(self.document_frequency)),
+                                    nonzeros=self.n_nonzeros)
+        with self.timer.stage("format_results"):
+            return self.format_results(compact=compact, full_text=full_text)
+
+
+def iter_chunks(text_corpus: List[str], names: List[str], ground_truth: List[str], chunk_size: int = 1000) -> Iterable[Tuple[List[str], List[str], List[str]]]:
+    """
+    Iterate over a corpus held in memory chunk by chunk.
+    """
+    for start in range(0, len(text_corpus), chunk_size):
+        yield (text_corpus[start:start + chunk_size],
+               names[start:start + chunk_size],
+               ground_truth[start:start + chunk_size])
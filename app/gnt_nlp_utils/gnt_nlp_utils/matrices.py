@@ -0,0 +1,131 @@
+"""
+Python module to precompute the count matrices of the whole corpus, once per
+deployment, so that the clustering requests only have to select some of their rows.
+"""
+from __future__ import annotations
+from typing import TYPE_CHECKING, Dict, Iterable, List
+import numpy as np
+
+from gnt_nlp_utils import get_stop_words
+from gnt_nlp_utils.clusterer import GNTClusterer
+from gnt_nlp_utils.tokens import GRANULARITIES, TokenizedCorpus
+
+if TYPE_CHECKING:
+    from scipy.sparse import spmatrix
+
+
+class CorpusMatrix:
+    """
+    Sparse count matrix of the lemmas of a corpus (one row per text and one
+    column per lemma), along with the index of its rows:
+        - The name of each row (book, chapter or verse reference)
+        - The book each row belongs to
+        - The raw text of each row
+    """
+
+    def __init__(self, counts: spmatrix, vocabulary: List[str], names: List[str], books: List[str], texts: List[str]) -> None:
+        """
+        Initializes an object of class CorpusMatrix.
+
+        Args:
+            counts (spmatrix): Count of each lemma (columns) in each text (rows).
+            vocabulary (list): The lemma associated with each column.
+            names (list): The name associated with each row.
+            books (list): The book associated with each row.
+            texts (list): The text associated with each row.
+        """
+        self.counts = counts.tocsr()
+        self.vocabulary = vocabulary
+        self.names = names
+        self.books = books
+        self.texts = texts
+        book_rows: Dict[str, List[int]] = {}
+        for row, book in enumerate(books):
+            book_rows.setdefault(book, []).append(row)
+        self.book_rows = {book: np.array(rows, dtype=np.int64)
+                          for book, rows in book_rows.items()}
+
+    @classmethod
+    def from_corpus(cls, text_corpus: List[str], names: List[str], books: List[str], stop_words: Iterable[str] = None) -> "CorpusMatrix":
+        """
+        Clean up and count the lemmas of a corpus.
+
+        Args:
+            text_corpus (list): The texts to count the lemmas of.
+            names (list): The name associated with each text.
+            books (list): The book associated with each text.
+            stop_words (iterable): The words to remove from the texts,
+                the packaged stop words if None.
+        """
+        from sklearn.feature_extraction.text import CountVectorizer
+        if stop_words is None:
+            stop_words = get_stop_words()
+        cleaned_corpus = GNTClusterer.clean(text_corpus, stop_words)
+        count_vectorizer = CountVectorizer(dtype=np.int32)
+        counts = count_vectorizer.fit_transform(cleaned_corpus)
+        return cls(counts, count_vectorizer.get_feature_names_out().tolist(),
+                   names, books, text_corpus)
+
+    def rows(self, books: List[str]) -> np.ndarray:
+        """
+        Get the index of the rows associated with the books, in the order of
+        the corpus. If no book is given, return all of the rows.
+        """
+        if not books:
+            return np.arange(self.counts.shape[0])
+        books = set(books)
+        selected_rows = [rows for book, rows in self.book_rows.items()
+                         if book in books]
+        if not selected_rows:
+            return np.array([], dtype=np.int64)
+        return np.concatenate(selected_rows)
+
+    def select(self, books: List[str]) -> "CorpusMatrix":
+        """
+        Get the sub matrix containing the rows associated with the books.
+        The vocabulary is kept as is.
+        """
+        rows = self.rows(books)
+        return CorpusMatrix(self.counts[rows],
+                            self.vocabulary,
+                            [self.names[row] for row in rows],
+                            [self.books[row] for row in rows],
+                            [self.texts[row] for row in rows])
+
+
+class CorpusMatrices:
+    """
+    Holder of the CorpusMatrix of each granularity (books, chapters
+    and verses).
+    """
+
+    def __init__(self) -> None:
+        self.matrices: Dict[str, CorpusMatrix] = {}
+
+    def __getitem__(self, granularity: str) -> CorpusMatrix:
+        return self.matrices[granularity]
+
+    def __setitem__(self, granularity: str, matrix: CorpusMatrix) -> None:
+        self.matrices[granularity] = matrix
+
+    @classmethod
+    def from_tokenized_corpus(cls, corpus: TokenizedCorpus, stop_words: Iterable[str] = None) -> "CorpusMatrices":
+        """
+        Build the count matrices of the books, chapters and verses of a
+        tokenized corpus, once its stop words are removed.
+        """
+        if stop_words is None:
+            stop_words = get_stop_words()
+        corpus = corpus.remove_stop_words(stop_words)
+        matrices = cls()
+        for granularity in GRANULARITIES:
+            matrices[granularity] = CorpusMatrix(
+                corpus.count_matrix(granularity), corpus.vocabulary,
+                *corpus.index(granularity))
+        return matrices
+
+    def update(self, matrices: "CorpusMatrices") -> None:
+        """
+        Replace the matrices by the ones of another object.
+        """
+        self.matrices.update(matrices.matrices)
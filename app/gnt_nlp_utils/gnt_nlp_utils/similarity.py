@@ -0,0 +1,312 @@
+"""
+Python module to search the books, chapters or verses lexically closest to a
+passage, without running a clustering: the tf-idf matrix of each granularity
+is L2-normalized once, so that the cosine similarity of a passage with all
+of the rows is a single sparse matrix product.
+
+The cosine similarity of every pair of books and of chapters is also
+precomputed, and memory-mapped from the disk to be sliced on request.
+"""
+from __future__ import annotations
+import json
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+import numpy as np
+
+from gnt_nlp_utils.matrices import CorpusMatrices, CorpusMatrix
+from gnt_nlp_utils.tokens import GRANULARITIES
+
+if TYPE_CHECKING:
+    from scipy.sparse import csr_matrix, spmatrix
+
+
+def normalize_rows(matrix: csr_matrix) -> csr_matrix:
+    """
+    L2-normalize the rows of a CSR matrix in place, the empty rows being left as is.
+    """
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1), dtype=np.float32).ravel())
+    norms[norms == 0] = 1
+    matrix.data /= np.repeat(norms, np.diff(matrix.indptr))
+    return matrix
+
+
+class SimilarityIndex:
+    """
+    Class holding the L2-normalized tf-idf matrix (float32 CSR) of the rows of
+    a CorpusMatrix, the idf being computed over all of its rows. The matrix is
+    split in blocks of rows, so that the scores of a search are computed and
+    reduced to their top k block by block, whatever the number of rows.
+    """
+
+    def __init__(self, matrix: CorpusMatrix, chapters: List[Optional[str]], block_size: int = 8192) -> None:
+        """
+        Initializes an object of class SimilarityIndex.
+
+        Args:
+            matrix (CorpusMatrix): The count matrix to index.
+            chapters (list): The chapter of each row, None for books.
+            block_size (int): Number of rows scored at once.
+        """
+        self.matrix = matrix
+        self.chapters = np.array(chapters, dtype=object)
+        self.block_size = block_size
+        counts = matrix.counts.tocsc()
+        document_frequency = np.diff(counts.indptr)
+        self.idf = (np.log((1 + counts.shape[0]) / (1 + document_frequency)) + 1).astype(np.float32)
+        tf_idf = matrix.counts.astype(np.float32).tocsr()
+        tf_idf.data *= self.idf[tf_idf.indices]
+        self.tf_idf = normalize_rows(tf_idf)
+        self.blocks = [self.tf_idf[start:start + block_size]
+                       for start in range(0, self.tf_idf.shape[0], block_size)]
+
+    def __len__(self) -> int:
+        return self.tf_idf.shape[0]
+
+    def passage_rows(self, book: str, chapter: str = None, verse: str = None) -> np.ndarray:
+        """
+        Get the index of the rows within a book, a chapter of a book or a verse.
+        """
+        rows = self.matrix.book_rows.get(book, np.array([], dtype=np.int64))
+        if chapter is not None:
+            rows = rows[self.chapters[rows] == chapter]
+        if verse is not None:
+            rows = rows[[self.matrix.names[row] == f"{book}{chapter},{verse}" for row in rows]]
+        return rows
+
+    def queries(self, counts: spmatrix) -> spmatrix:
+        """
+        Compute the L2-normalized tf-idf of count vectors, with the idf of the index.
+        """
+        tf_idf = counts.astype(np.float32).tocsr()
+        tf_idf.data *= self.idf[tf_idf.indices]
+        return normalize_rows(tf_idf)
+
+    def search(self, queries: spmatrix, k: int = 10, rows: np.ndarray = None, exclude: np.ndarray = None) -> Tuple[List[np.ndarray], List[np.ndarray]]:
+        """
+        Search the k rows with the highest cosine similarity with each query.
+
+        Args:
+            queries (spmatrix): L2-normalized tf-idf of the queries (see
+                queries), one per row.
+            k (int): Number of rows to find for each query.
+            rows (np.ndarray): The rows to search among, all of them if None.
+            exclude (np.ndarray): Rows not to send back.
+
+        Returns:
+            The rows found for each query, and their scores, sorted by
+            decreasing score. Rows sharing no lemma with a query are left out.
+        """
+        dense_queries = np.ascontiguousarray(queries.T.toarray(), dtype=np.float32)
+        n_queries = dense_queries.shape[1]
+        excluded = None
+        if exclude is not None and len(exclude):
+            excluded = np.zeros(len(self), dtype=bool)
+            excluded[exclude] = True
+        if rows is None:
+            blocks = ((np.arange(start, start + block.shape[0]), block) for start, block in
+                      zip(range(0, len(self), self.block_size), self.blocks))
+        else:
+            rows = np.asarray(rows, dtype=np.int64)
+            blocks = ((rows[start:start + self.block_size], self.tf_idf[rows[start:start + self.block_size]])
+                      for start in range(0, len(rows), self.block_size))
+        best_rows = np.empty((n_queries, 0), dtype=np.int64)
+        best_scores = np.empty((n_queries, 0), dtype=np.float32)
+        for block_rows, block in blocks:
+            scores = np.asarray(block @ dense_queries).T
+            if excluded is not None:
+                scores[:, excluded[block_rows]] = -np.inf
+            best_rows = np.hstack((best_rows, np.broadcast_to(block_rows, scores.shape)))
+            best_scores = np.hstack((best_scores, scores))
+            if best_scores.shape[1] > k:
+                top = np.argpartition(-best_scores, k - 1, axis=1)[:, :k]
+                best_rows = np.take_along_axis(best_rows, top, axis=1)
+                best_scores = np.take_along_axis(best_scores, top, axis=1)
+        order = np.argsort(-best_scores, axis=1, kind="stable")
+        best_rows = np.take_along_axis(best_rows, order, axis=1)
+        best_scores = np.take_along_axis(best_scores, order, axis=1)
+        found = best_scores > 0
+        return ([best_rows[query][found[query]] for query in range(n_queries)],
+                [best_scores[query][found[query]] for query in range(n_queries)])
+
+
+class SimilarityIndexes:
+    """
+    Holder of the SimilarityIndex of each granularity (books, chapters
+    and verses), the passages searched for being made of verses.
+    """
+
+    def __init__(self) -> None:
+        self.indexes: Dict[str, SimilarityIndex] = {}
+
+    def __getitem__(self, granularity: str) -> SimilarityIndex:
+        return self.indexes[granularity]
+
+    def __contains__(self, granularity: str) -> bool:
+        return granularity in self.indexes
+
+    @staticmethod
+    def row_chapters(granularity: str, matrix: CorpusMatrix) -> List[Optional[str]]:
+        """
+        Get the chapter of each row from its name, see TokenizedCorpus.index.
+        """
+        if granularity == "chapters":
+            return [name[:-len(book)] for name, book in zip(matrix.names, matrix.books)]
+        if granularity == "verses":
+            return [name[len(book):].split(",")[0] for name, book in zip(matrix.names, matrix.books)]
+        return [None] * len(matrix.names)
+
+    @classmethod
+    def from_corpus_matrices(cls, matrices: CorpusMatrices, block_size: int = 8192) -> "SimilarityIndexes":
+        """
+        Build the index of each granularity of the corpus matrices.
+        """
+        indexes = cls()
+        for granularity in GRANULARITIES:
+            indexes.indexes[granularity] = SimilarityIndex(
+                matrices[granularity], cls.row_chapters(granularity, matrices[granularity]),
+                block_size=block_size)
+        return indexes
+
+    def update(self, indexes: "SimilarityIndexes") -> None:
+        """
+        Replace the indexes by the ones of another object.
+        """
+        self.indexes.update(indexes.indexes)
+
+    def search(self, granularity: str, book: str, chapter: str = None, verse: str = None, k: int = 10, books: List[str] = None, exclude_passage: bool = True) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Search the k books, chapters or verses closest to a passage.
+
+        Args:
+            granularity (str): books, chapters or verses, the rows to search.
+            book (str): Book of the passage.
+            chapter (str): Chapter of the passage, the whole book if None.
+            verse (str): Verse of the passage, the whole chapter if None.
+            k (int): Number of rows to find.
+            books (list): Books to search in, all of them if empty.
+            exclude_passage (bool): Whether to leave out the rows within
+                the passage (or containing it).
+
+        Returns:
+            The rows found and their scores, sorted by decreasing score.
+
+        Raises:
+            KeyError: if the passage is not in the corpus.
+        """
+        verses = self.indexes["verses"]
+        passage = verses.passage_rows(book, chapter, verse)
+        if not len(passage):
+            raise KeyError(f"Unknown passage {book} {chapter or ''} {verse or ''}".strip())
+        from scipy.sparse import csr_matrix
+        index = self.indexes[granularity]
+        query = index.queries(csr_matrix(verses.matrix.counts[passage].sum(axis=0)))
+        exclude = None
+        if exclude_passage:
+            exclude = index.passage_rows(book, chapter if granularity != "books" else None,
+                                         verse if granularity == "verses" else None)
+        rows = index.matrix.rows(books) if books else None
+        found_rows, scores = index.search(query, k=k, rows=rows, exclude=exclude)
+        return found_rows[0], scores[0]
+
+
+class PairwiseSimilarity:
+    """
+    Class holding the cosine similarity of every pair of rows of a
+    SimilarityIndex, as a float32 matrix memory-mapped from a .npy file,
+    along with the name and book of its rows.
+    """
+
+    def __init__(self, similarity: np.ndarray, names: List[str], books: List[str]) -> None:
+        """
+        Initializes an object of class PairwiseSimilarity.
+
+        Args:
+            similarity (np.ndarray): Square similarity matrix of the rows.
+            names (list): The name associated with each row.
+            books (list): The book associated with each row.
+        """
+        self.similarity = similarity
+        self.names = names
+        self.books = books
+        book_rows: Dict[str, List[int]] = {}
+        for row, book in enumerate(books):
+            book_rows.setdefault(book, []).append(row)
+        self.book_rows = {book: np.array(rows, dtype=np.int64)
+                          for book, rows in book_rows.items()}
+
+    @staticmethod
+    def paths(folder: Path, granularity: str) -> Tuple[Path, Path]:
+        """
+        Get the paths of the matrix and of the index of its rows.
+        """
+        return Path(folder) / f"{granularity}.npy", Path(folder) / f"{granularity}.json"
+
+    @classmethod
+    def compute(cls, index: SimilarityIndex, folder: Path, granularity: str, block_size: int = 1024) -> "PairwiseSimilarity":
+        """
+        Compute the similarity of the rows of an index into a .npy file of the
+        folder, block of rows by block of rows, so that neither the tf-idf
+        matrix nor the similarity matrix are ever held in memory densely.
+
+        Args:
+            index (SimilarityIndex): The index to compute the similarity of.
+            folder (Path): The folder to write down the matrix in.
+            granularity (str): The granularity of the index, naming the files.
+            block_size (int): Number of rows computed at once.
+        """
+        folder = Path(folder)
+        folder.mkdir(parents=True, exist_ok=True)
+        matrix_path, index_path = cls.paths(folder, granularity)
+        # Written down under a temporary name, so that an interrupted run
+        # does not leave a partial matrix behind
+        partial_path = matrix_path.with_suffix(".partial.npy")
+        similarity = np.lib.format.open_memmap(
+            partial_path, mode="w+", dtype=np.float32, shape=(len(index), len(index)))
+        transposed = index.tf_idf.T.tocsr()
+        for start in range(0, len(index), block_size):
+            # Rounding errors can make the similarity of a row with itself exceed 1
+            similarity[start:start + block_size] = np.minimum(
+                (index.tf_idf[start:start + block_size] @ transposed).toarray(), 1)
+        similarity.flush()
+        del similarity
+        partial_path.replace(matrix_path)
+        index_path.write_text(json.dumps({"names": index.matrix.names, "books": index.matrix.books}),
+                              encoding="utf8")
+        return cls.load(folder, granularity)
+
+    @classmethod
+    def load(cls, folder: Path, granularity: str) -> Optional["PairwiseSimilarity"]:
+        """
+        Memory-map a matrix previously computed into the folder, None if there is none.
+        """
+        matrix_path, index_path = cls.paths(folder, granularity)
+        if not matrix_path.exists() or not index_path.exists():
+            return None
+        index = json.loads(index_path.read_text(encoding="utf8"))
+        return cls(np.load(matrix_path, mmap_mode="r"), index["names"], index["books"])
+
+    def matches(self, index: SimilarityIndex) -> bool:
+        """
+        Check that the rows of the matrix are the ones of an index.
+        """
+        return self.names == index.matrix.names and self.books == index.matrix.books
+
+    def rows(self, books: List[str]) -> np.ndarray:
+        """
+        Get the index of the rows of the books, in the order of the corpus,
+        all of them if no book is given.
+        """
+        if not books:
+            return np.arange(len(self.names))
+        books = set(books)
+        return np.array(sorted(row for book, rows in self.book_rows.items()
+                               if book in books for row in rows), dtype=np.int64)
+
+    def select(self, books: List[str]) -> Tuple[np.ndarray, List[str], List[str]]:
+        """
+        Slice the similarity of the rows of the books, with their names and books.
+        """
+        rows = self.rows(books)
+        return (np.asarray(self.similarity[np.ix_(rows, rows)]),
+                [self.names[row] for row in rows],
+                [self.books[row] for row in rows])
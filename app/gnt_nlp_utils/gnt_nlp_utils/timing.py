@@ -0,0 +1,71 @@
+"""
+Python module to measure the duration of the stages of the clustering
+pipelines, and the size of the matrices they process.
+"""
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Tuple
+import numpy as np
+
+
+class StageTimer:
+    """
+    Class collecting the duration of each stage of a pipeline run, along with
+    the size of its input:
+        - documents: number of rows of the tf-idf matrix
+        - vocabulary: number of columns of the tf-idf matrix
+        - nonzeros: number of non-zero values of the tf-idf matrix
+
+    A disabled timer records nothing, so that timing the stages only costs
+    a function call when the instrumentation is off.
+    """
+
+    def __init__(self, enabled: bool = False) -> None:
+        """
+        Initializes an object of class StageTimer.
+
+        Args:
+            enabled (bool): Whether to record the stages.
+        """
+        self.enabled = enabled
+        self.stages: List[Tuple[str, float]] = []
+        self.sizes: Dict[str, int] = {}
+
+    def reset(self, enabled: bool = None) -> None:
+        """
+        Forget the measures of the previous run, enabling or disabling the timer.
+        """
+        if enabled is not None:
+            self.enabled = enabled
+        self.stages = []
+        self.sizes = {}
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """
+        Context manager recording the duration of the stage it wraps.
+        """
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages.append((name, time.perf_counter() - start))
+
+    def record_matrix(self, matrix) -> None:
+        """
+        Record the size of the tf-idf matrix of the run.
+        """
+        if self.enabled:
+            self.sizes["documents"], self.sizes["vocabulary"] = matrix.shape
+            self.sizes["nonzeros"] = int(matrix.nnz if hasattr(matrix, "nnz")
+                                         else np.count_nonzero(np.asarray(matrix)))
+
+    def measures(self) -> Dict:
+        """
+        Get the measures of the run, as a dictionary of stages (list of
+        (name, seconds)) and sizes.
+        """
+        return {"stages": list(self.stages), "sizes": dict(self.sizes)}
@@ -0,0 +1,188 @@
+"""
+Python module to store the corpus as arrays of token ids rather than as strings,
+so that it is only tokenized once.
+"""
+from __future__ import annotations
+import json
+from array import array
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, Iterable, List, Tuple
+import numpy as np
+
+if TYPE_CHECKING:
+    from scipy.sparse import csr_matrix
+
+GRANULARITIES = ("books", "chapters", "verses")
+
+
+class TokenizedCorpus:
+    """
+    Corpus of verses stored as:
+        - A vocabulary of lemmas, sorted alphabetically
+        - A contiguous array of the token ids of all the verses
+        - The offsets of each verse within the array of token ids
+        - The book, chapter and verse number of each verse
+
+    The chapters and books are made of contiguous verses, so that their
+    offsets are a subset of the offsets of the verses.
+    """
+
+    def __init__(self, vocabulary: List[str], token_ids: np.ndarray, offsets: np.ndarray, books: List[str], chapters: List[str], verses: List[str], texts: List[str]) -> None:
+        """
+        Initializes an object of class TokenizedCorpus.
+
+        Args:
+            vocabulary (list): The lemma associated with each token id.
+            token_ids (np.ndarray): The token ids of all the verses.
+            offsets (np.ndarray): The start of each verse within token_ids,
+                followed by the total number of tokens.
+            books (list): The book of each verse.
+            chapters (list): The chapter number of each verse.
+            verses (list): The verse number of each verse.
+            texts (list): The raw text of each verse.
+        """
+        self.vocabulary = vocabulary
+        self.token_ids = token_ids
+        self.offsets = offsets
+        self.books = books
+        self.chapters = chapters
+        self.verses = verses
+        self.texts = texts
+
+    @classmethod
+    def from_verses(cls, verse_records: Iterable[Tuple[str, str, str, str]]) -> "TokenizedCorpus":
+        """
+        Tokenize verses, using the same tokenization as the one of sklearn
+        vectorizers.
+
+        Args:
+            verse_records (iterable): tuples of (book, chapter, verse, text),
+                the verses of a same chapter and of a same book being contiguous.
+        """
+        from sklearn.feature_extraction.text import CountVectorizer
+        analyzer = CountVectorizer().build_analyzer()
+        vocabulary_index: Dict[str, int] = {}
+        token_ids = array("i")
+        offsets = array("q", [0])
+        books, chapters, verses, texts = [], [], [], []
+        for book, chapter, verse, text in verse_records:
+            token_ids.extend(vocabulary_index.setdefault(token, len(vocabulary_index))
+                             for token in analyzer(text))
+            offsets.append(len(token_ids))
+            books.append(book)
+            chapters.append(chapter)
+            verses.append(verse)
+            texts.append(text)
+        # Sort the vocabulary, so that the columns are in the same order
+        # as the ones of sklearn vectorizers
+        vocabulary = sorted(vocabulary_index)
+        new_ids = np.empty(len(vocabulary), dtype=np.int32)
+        new_ids[[vocabulary_index[lemma] for lemma in vocabulary]] = np.arange(
+            len(vocabulary), dtype=np.int32)
+        return cls(vocabulary,
+                   new_ids[np.frombuffer(token_ids, dtype=np.int32)],
+                   np.frombuffer(offsets, dtype=np.int64),
+                   books, chapters, verses, texts)
+
+    def stop_word_mask(self, stop_words: Iterable[str]) -> np.ndarray:
+        """
+        Get the boolean mask of the lemmas of the vocabulary which are stop words.
+        """
+        stop_words = {stop_word.lower() for stop_word in stop_words}
+        return np.fromiter((lemma in stop_words for lemma in self.vocabulary),
+                           dtype=bool, count=len(self.vocabulary))
+
+    def remove_stop_words(self, stop_words: Iterable[str]) -> "TokenizedCorpus":
+        """
+        Get the corpus without the tokens which are stop words. The
+        vocabulary is kept as is.
+        """
+        kept_tokens = ~self.stop_word_mask(stop_words)[self.token_ids]
+        kept_offsets = np.concatenate(
+            ([0], np.cumsum(kept_tokens, dtype=np.int64)))[self.offsets]
+        return TokenizedCorpus(self.vocabulary, self.token_ids[kept_tokens], kept_offsets,
+                               self.books, self.chapters, self.verses, self.texts)
+
+    def segments(self, granularity: str) -> np.ndarray:
+        """
+        Get the index of the first verse of each book, chapter or verse,
+        followed by the number of verses.
+        """
+        if granularity == "verses":
+            keys = list(range(len(self.books)))
+        elif granularity == "chapters":
+            keys = list(zip(self.books, self.chapters))
+        elif granularity == "books":
+            keys = self.books
+        else:
+            raise ValueError(f"Unknown granularity {granularity}")
+        starts = [index for index, key in enumerate(keys)
+                  if index == 0 or key != keys[index - 1]]
+        return np.array(starts + [len(keys)], dtype=np.int64)
+
+    def count_matrix(self, granularity: str = "verses") -> csr_matrix:
+        """
+        Count the tokens of each book, chapter or verse directly from the
+        token ids.
+        """
+        from scipy.sparse import csr_matrix
+        token_offsets = self.offsets[self.segments(granularity)]
+        rows = np.repeat(np.arange(len(token_offsets) - 1), np.diff(token_offsets))
+        # Duplicated (row, token) pairs are summed up by the conversion to CSR
+        return csr_matrix((np.ones(len(self.token_ids), dtype=np.int32),
+                           (rows, self.token_ids)),
+                          shape=(len(token_offsets) - 1, len(self.vocabulary)))
+
+    def index(self, granularity: str = "verses") -> Tuple[List[str], List[str], List[str]]:
+        """
+        Get the name, book and text of each book, chapter or verse.
+        """
+        segments = self.segments(granularity)
+        names, books, texts = [], [], []
+        for start, end in zip(segments[:-1], segments[1:]):
+            book, chapter, verse = self.books[start], self.chapters[start], self.verses[start]
+            if granularity == "verses":
+                names.append(f"{book}{chapter},{verse}")
+                texts.append(self.texts[start])
+            else:
+                names.append(book if granularity == "books" else f"{chapter}{book}")
+                texts.append(" ".join(self.texts[start:end]))
+            books.append(book)
+        return names, books, texts
+
+    @staticmethod
+    def exists(folder: Path) -> bool:
+        """
+        Check if a corpus was written down in the folder.
+        """
+        return (Path(folder) / "corpus.json").exists()
+
+    def save(self, folder: Path) -> None:
+        """
+        Write down the corpus into the folder.
+        """
+        folder = Path(folder)
+        folder.mkdir(parents=True, exist_ok=True)
+        np.save(folder / "token_ids.npy", self.token_ids)
+        np.save(folder / "offsets.npy", self.offsets)
+        (folder / "corpus.json").write_text(
+            json.dumps({"vocabulary": self.vocabulary,
+                        "books": self.books,
+                        "chapters": self.chapters,
+                        "verses": self.verses,
+                        "texts": self.texts}), encoding="utf8")
+
+    @classmethod
+    def load(cls, folder: Path) -> "TokenizedCorpus":
+        """
+        Load a corpus previously written down with save.
+        """
+        folder = Path(folder)
+        index = json.loads((folder / "corpus.json").read_text(encoding="utf8"))
+        return cls(index["vocabulary"],
+                   np.load(folder / "token_ids.npy"),
+                   np.load(folder / "offsets.npy"),
+                   index["books"],
+                   index["chapters"],
+                   index["verses"],
+                   index["texts"])
@@ -4,5 +4,6 @@ setup(name='gnt-nlp-utils',
       version='1.0',
       description='NLP utils for SBLGNT clusterer application',
       author='Sophie Robert',
-      find_packages=find_packages()
+      packages=find_packages(),
+      package_data={'gnt_nlp_utils': ['data/*.txt']}
       )
@@ -1,11 +1,17 @@
 """
 Tests the LXXClusterer class.
 """
+import tempfile
 import unittest
-from lxx_nlp_utils import clusterer
+from gnt_nlp_utils import clusterer
 import numpy as np
 import pandas as pd
-from lxx_nlp_utils.clusterer import LXXClusterer
+from scipy.sparse import issparse
+from sklearn.metrics import adjusted_rand_score
+from gnt_nlp_utils.clusterer import GNTClusterer, StreamingGNTClusterer, iter_chunks
+from gnt_nlp_utils.matrices import CorpusMatrices, CorpusMatrix
+from gnt_nlp_utils.similarity import PairwiseSimilarity, SimilarityIndexes
+from gnt_nlp_utils.tokens import TokenizedCorpus
 
 
 class TextLXXClusterer(unittest.TestCase):
@@ -14,7 +20,7 @@ class TextLXXClusterer(unittest.TestCase):
     """
 
     def setUp(self):
-        self.lxx_clusterer = LXXClusterer()
+        self.lxx_clusterer = GNTClusterer()
 
     def test_clean(self):
         """
@@ -37,7 +43,8 @@ class TextLXXClusterer(unittest.TestCase):
 
     def test_reduce(self):
         """
-        Test that the PCA reducing works as expected.
+        Test that the PCA reducing works as expected, up to the sign of each
+        component.
         """
         test_corpus = ["titi tall", "toto tall", "tall"]
         tf_idf_vectorized = self.lxx_clusterer.tf_idf_vectorizer(test_corpus)
@@ -47,7 +54,36 @@ class TextLXXClusterer(unittest.TestCase):
                                               [-6.08845099e-01, -2.60815602e-01],
                                               [4.77971549e-17, 5.21631204e-01]])
         np.testing.assert_almost_equal(
-            test_dataframe, expected_reduced_dataframe)
+            np.abs(test_dataframe), np.abs(expected_reduced_dataframe))
+
+    def test_sparse_tf_idf_vectorizer(self):
+        """
+        Check that the sparse tf idf vectorizer matches the dense one.
+        """
+        test_corpus = ["titi tall", "toto tall", "tall"]
+        sparse_vectorized = self.lxx_clusterer.tf_idf_vectorizer(
+            test_corpus, sparse=True)
+        dense_vectorized = self.lxx_clusterer.tf_idf_vectorizer(test_corpus)
+        self.assertTrue(issparse(sparse_vectorized))
+        self.assertEqual(sparse_vectorized.dtype, np.float32)
+        np.testing.assert_almost_equal(
+            sparse_vectorized.toarray(), dense_vectorized.values, decimal=6)
+
+    def test_sparse_reduce(self):
+        """
+        Test that the sparse PCA gives the same projection as the dense one,
+        up to the sign of each component.
+        """
+        test_corpus = ["titi tall small", "toto tall", "tall big",
+                       "titi big", "toto small"]
+        sparse_reduced = self.lxx_clusterer.reduce(
+            self.lxx_clusterer.tf_idf_vectorizer(test_corpus, sparse=True),
+            dimension=2)
+        dense_reduced = self.lxx_clusterer.reduce(
+            self.lxx_clusterer.tf_idf_vectorizer(test_corpus),
+            dimension=2)
+        np.testing.assert_almost_equal(
+            np.abs(sparse_reduced), np.abs(dense_reduced), decimal=5)
 
     def test_clusterize(self):
         """
@@ -63,11 +99,299 @@ class TextLXXClusterer(unittest.TestCase):
 
     def test_pipeline(self):
         """
-        Test the whole clustering pipeline.
+        Test the whole clustering pipeline, less than three texts giving no
+        results.
         """
         result = self.lxx_clusterer.pipeline(
-            {"Mt": "titi is small", "Lk": "titi is big"}, n_clusters=2)
-        self.assertEqual(result["labels"], ["Mt", "Lk"])
+            ["titi is small", "titi is big"], n_clusters=2, names=["Mt", "Lk"])
+        self.assertEqual(result, [])
+        result = self.lxx_clusterer.pipeline(
+            ["titi is small", "titi is big", "toto is big"], n_clusters=2,
+            names=["Mt", "Lk", "Jn"], ground_truth=["Mt", "Lk", "Jn"])
+        self.assertEqual(
+            sorted(sum([group["labels"] for group in result], [])), ["Jn", "Lk", "Mt"])
+
+    def test_sparse_pipeline(self):
+        """
+        Test that the sparse pipeline gives the same clusters as the dense one.
+        """
+        text_corpus = ["titi toto tata", "titi toto", "toto tata titi",
+                       "tutu tete", "tete tutu tyty", "tyty tutu",
+                       "lulu lala", "lala lolo lulu", "lolo lulu"]
+        names = [f"text{i}" for i in range(len(text_corpus))]
+        ground_truth = ["A"] * 3 + ["B"] * 3 + ["C"] * 3
+        dense_results = self.lxx_clusterer.pipeline(
+            text_corpus, n_clusters=3, names=names, ground_truth=ground_truth)
+        sparse_results = self.lxx_clusterer.pipeline(
+            text_corpus, n_clusters=3, names=names, ground_truth=ground_truth,
+            sparse=True)
+        self.assertEqual([result["labels"] for result in dense_results],
+                         [result["labels"] for result in sparse_results])
+        dense_clusters = sum(
+            [result["clusters"] for result in dense_results], [])
+        sparse_clusters = sum(
+            [result["clusters"] for result in sparse_results], [])
+        self.assertEqual(
+            adjusted_rand_score(dense_clusters, sparse_clusters), 1.0)
+
+    def test_compact_pipeline(self):
+        """
+        Test that the compact results hold the same points as the full ones,
+        each of them being sent once.
+        """
+        text_corpus = ["titi toto tata", "tutu tete", "titi toto",
+                       "tete tutu tyty", "toto tata titi", "tyty tutu"]
+        names = [f"text{i}" for i in range(len(text_corpus))]
+        ground_truth = ["A", "B"] * 3
+        full_results = self.lxx_clusterer.pipeline(
+            text_corpus, n_clusters=2, names=names, ground_truth=ground_truth,
+            sparse=True)
+        compact_results = self.lxx_clusterer.pipeline(
+            text_corpus, n_clusters=2, names=names, ground_truth=ground_truth,
+            sparse=True, compact=True)
+        self.assertEqual(compact_results["projection"].shape, (6, 3))
+        self.assertEqual(compact_results["labels"], names)
+        self.assertEqual(compact_results["fullText"], text_corpus)
+        for full_result, group in zip(full_results, compact_results["groups"]):
+            self.assertEqual(full_result["ground_truth"][0], group["ground_truth"])
+            self.assertEqual(full_result["labels"],
+                             [names[point] for point in group["points"]])
+            self.assertEqual(full_result["clusters"],
+                             compact_results["clusters"][group["points"]].tolist())
+            np.testing.assert_allclose(full_result["projection"]["x"],
+                                       compact_results["projection"][group["points"], 0])
+
+    def test_hierarchical_pipeline(self):
+        """
+        Test that the cuts of the linkage tree match the ones of scipy, and
+        that the verses can be clustered over micro-clusters.
+        """
+        from scipy.cluster.hierarchy import fcluster
+        text_corpus = ["titi toto tata", "titi toto", "toto tata titi",
+                       "tutu tete", "tete tutu tyty", "tyty tutu",
+                       "lulu lala", "lala lolo lulu", "lolo lulu",
+                       "titi tata", "tete tyty", "lala lulu"]
+        matrix = CorpusMatrix.from_corpus(
+            text_corpus, names=[f"text{i}" for i in range(12)],
+            books=["A"] * 6 + ["B"] * 6, stop_words=[])
+        results, tree = self.lxx_clusterer.hierarchical_pipeline(
+            matrix.counts, n_clusters=3, names=matrix.names,
+            ground_truth=matrix.books, compact=True)
+        self.assertEqual(adjusted_rand_score(results["clusters"],
+                                             [0, 0, 0, 1, 1, 1, 2, 2, 2, 0, 1, 2]), 1.0)
+        for n_clusters in range(1, 12):
+            self.assertEqual(adjusted_rand_score(
+                tree.cut(n_clusters=n_clusters),
+                fcluster(tree.linkage, n_clusters, criterion="maxclust")), 1.0)
+        distance = float(tree.linkage[5, 2])
+        self.assertEqual(adjusted_rand_score(
+            tree.cut(distance=distance),
+            fcluster(tree.linkage, distance, criterion="distance")), 1.0)
+        self.assertEqual(tree.select_n_clusters(max_clusters=5)[0], 3)
+        # The tree of a previous run is only cut again
+        results, same_tree = self.lxx_clusterer.hierarchical_pipeline(
+            matrix.counts, n_clusters=6, names=matrix.names,
+            ground_truth=matrix.books, compact=True, tree=tree)
+        self.assertIs(same_tree, tree)
+        self.assertEqual(results["n_clusters"], 6)
+        dendrogram = tree.dendrogram(matrix.names)
+        self.assertEqual(len(dendrogram["children"]), 11)
+        self.assertEqual(dendrogram["sizes"][-1], 12)
+        _, micro_tree = self.lxx_clusterer.hierarchical_pipeline(
+            matrix.counts, n_clusters=3, names=matrix.names,
+            ground_truth=matrix.books, max_leaves=6)
+        self.assertTrue(micro_tree.micro_clusters)
+        self.assertLessEqual(micro_tree.n_leaves, 6)
+        self.assertEqual(len(micro_tree.cut(n_clusters=3)), 12)
+
+    def test_select_n_clusters(self):
+        """
+        Test that the number of clusters of well separated blobs is selected,
+        the sweep stopping once the score does not improve anymore.
+        """
+        random_state = np.random.RandomState(0)
+        centers = np.eye(6)[:4] * 10
+        reduced_matrix = np.concatenate(
+            [center + random_state.normal(scale=0.1, size=(20, 6)) for center in centers])
+        for metric in ["silhouette", "calinski_harabasz"]:
+            clusterer = GNTClusterer(max_clusters=15, metric=metric, n_jobs=2, patience=2)
+            n_clusters, scores = clusterer.select_n_clusters(reduced_matrix)
+            self.assertEqual(n_clusters, 4)
+            self.assertEqual(max(scores, key=scores.get), 4)
+            self.assertLess(max(scores), 15)
+
+    def test_corpus_matrix(self):
+        """
+        Test that selecting the rows of a precomputed corpus matrix gives
+        the same tf-idf matrix as vectorizing the selected texts.
+        """
+        text_corpus = ["titi is tall", "toto is small",
+                       "tutu is big", "tata is tall"]
+        matrix = CorpusMatrix.from_corpus(
+            text_corpus, names=["Mt1", "Mt2", "Lk1", "Jn1"],
+            books=["Mt", "Mt", "Lk", "Jn"], stop_words=["is"])
+        sub_matrix = matrix.select(["Jn", "Mt"])
+        self.assertEqual(sub_matrix.names, ["Mt1", "Mt2", "Jn1"])
+        self.assertEqual(sub_matrix.books, ["Mt", "Mt", "Jn"])
+        np.testing.assert_almost_equal(
+            self.lxx_clusterer.tf_idf_transformer(
+                sub_matrix.counts, sparse=False).values,
+            self.lxx_clusterer.tf_idf_vectorizer(
+                ["titi tall", "toto small", "tata tall"]).values)
+        self.assertEqual(matrix.select([]).names, matrix.names)
+        self.assertEqual(matrix.select(["Ro"]).names, [])
+
+    def test_incremental_pipeline(self):
+        """
+        Test that a run overlapping enough with the previous one is
+        warm-started from it, and that a full run is performed otherwise.
+        """
+        text_corpus = ["titi toto tata", "titi toto", "toto tata titi",
+                       "tutu tete", "tete tutu tyty", "tyty tutu",
+                       "lulu lala", "lala lolo lulu", "lolo lulu",
+                       "titi tata", "tete tyty", "lala lulu"]
+        matrix = CorpusMatrix.from_corpus(
+            text_corpus, names=[f"text{i}" for i in range(12)],
+            books=["A"] * 9 + ["B"] * 3, stop_words=[])
+        rows = matrix.rows(["A"])
+        _, state = self.lxx_clusterer.incremental_pipeline(
+            matrix.counts, rows, n_clusters=3, names=rows.tolist(),
+            ground_truth=["A"] * len(rows))
+        self.assertFalse(state.warm_started)
+        rows = matrix.rows([])
+        results, warm_state = self.lxx_clusterer.incremental_pipeline(
+            matrix.counts, rows, state=state, min_overlap=0.7, n_clusters=3,
+            names=rows.tolist(), ground_truth=matrix.books, compact=True)
+        self.assertTrue(warm_state.warm_started)
+        # The rows already clustered are not projected again
+        np.testing.assert_array_equal(warm_state.reduced[:9], state.reduced)
+        self.assertEqual(adjusted_rand_score(results["clusters"],
+                                             [0, 0, 0, 1, 1, 1, 2, 2, 2, 0, 1, 2]), 1.0)
+        _, cold_state = self.lxx_clusterer.incremental_pipeline(
+            matrix.counts, rows, state=state, min_overlap=0.9, n_clusters=3,
+            names=rows.tolist(), ground_truth=matrix.books)
+        self.assertFalse(cold_state.warm_started)
+
+    def test_deterministic_pipeline(self):
+        """
+        Test that two runs of the pipeline give the same clusters.
+        """
+        text_corpus = ["titi toto tata", "titi toto", "toto tata titi",
+                       "tutu tete", "tete tutu tyty", "tyty tutu"]
+        ground_truth = ["A"] * 3 + ["B"] * 3
+        results = [GNTClusterer(random_state=3).pipeline(
+            text_corpus, n_clusters=4, names=text_corpus,
+            ground_truth=ground_truth, sparse=True) for _ in range(2)]
+        for first_result, second_result in zip(*results):
+            self.assertEqual(first_result["clusters"], second_result["clusters"])
+            self.assertEqual(first_result["labels"], second_result["labels"])
+            np.testing.assert_almost_equal(
+                first_result["projection"]["x"], second_result["projection"]["x"], decimal=5)
+
+    def test_streaming_pipeline(self):
+        """
+        Test that the chunk by chunk pipeline finds the same groups as the
+        in-memory one on well separated texts.
+        """
+        text_corpus = ["titi toto tata", "titi toto", "toto tata titi",
+                       "tutu tete", "tete tutu tyty", "tyty tutu",
+                       "lulu lala", "lala lolo lulu", "lolo lulu"] * 3
+        names = [f"text{i}" for i in range(len(text_corpus))]
+        ground_truth = ["A"] * 9 + ["B"] * 9 + ["C"] * 9
+        streaming_clusterer = StreamingGNTClusterer(
+            n_clusters=3, batch_size=5, dimension=3)
+        streaming_results = streaming_clusterer.pipeline(
+            lambda: iter_chunks(text_corpus, names, ground_truth, chunk_size=4))
+        results = self.lxx_clusterer.pipeline(
+            text_corpus, n_clusters=3, names=names, ground_truth=ground_truth)
+        self.assertEqual([result["labels"] for result in results],
+                         [result["labels"] for result in streaming_results])
+        self.assertEqual(
+            adjusted_rand_score(
+                sum([result["clusters"] for result in results], []),
+                sum([result["clusters"] for result in streaming_results], [])),
+            1.0)
+
+    def test_tokenized_corpus(self):
+        """
+        Test that the counts computed from the token ids match the ones
+        computed from the cleaned texts, for each granularity.
+        """
+        corpus = TokenizedCorpus.from_verses([
+            ("Mt", "1", "1", "titi is tall"),
+            ("Mt", "1", "2", "toto is small"),
+            ("Mt", "2", "1", "tutu is tall tall"),
+            ("Lk", "1", "1", "tata is big")])
+        self.assertEqual(corpus.vocabulary,
+                         ["big", "is", "small", "tall", "tata", "titi", "toto", "tutu"])
+        matrices = CorpusMatrices.from_tokenized_corpus(corpus, stop_words=["is"])
+        self.assertEqual(matrices["verses"].names, ["Mt1,1", "Mt1,2", "Mt2,1", "Lk1,1"])
+        self.assertEqual(matrices["chapters"].names, ["1Mt", "2Mt", "1Lk"])
+        self.assertEqual(matrices["books"].names, ["Mt", "Lk"])
+        self.assertEqual(matrices["books"].texts[0],
+                         "titi is tall toto is small tutu is tall tall")
+        np.testing.assert_equal(
+            matrices["chapters"].counts.toarray(),
+            [[0, 0, 1, 1, 0, 1, 1, 0],
+             [0, 0, 0, 2, 0, 0, 0, 1],
+             [1, 0, 0, 0, 1, 0, 0, 0]])
+        np.testing.assert_almost_equal(
+            self.lxx_clusterer.tf_idf_transformer(
+                matrices["verses"].counts, sparse=False).values,
+            self.lxx_clusterer.tf_idf_vectorizer(
+                ["titi tall", "toto small", "tutu tall tall", "tata big"]).values)
+
+    def test_similarity_search(self):
+        """
+        Test that the blocked search finds the rows with the highest cosine
+        similarity, leaving the passage searched for out.
+        """
+        corpus = TokenizedCorpus.from_verses([
+            ("Mt", "1", "1", "titi toto tata"),
+            ("Mt", "1", "2", "tutu tete"),
+            ("Mt", "2", "1", "titi toto"),
+            ("Mk", "1", "1", "toto tata titi tutu"),
+            ("Mk", "1", "2", "lulu lala"),
+            ("Lk", "1", "1", "tete tutu"),
+            ("Lk", "1", "2", "titi")])
+        indexes = SimilarityIndexes.from_corpus_matrices(
+            CorpusMatrices.from_tokenized_corpus(corpus, stop_words=[]), block_size=2)
+        rows, scores = indexes.search("verses", "Mt", "1", "1", k=3)
+        names = indexes["verses"].matrix.names
+        self.assertEqual([names[row] for row in rows], ["Mk1,1", "Mt2,1", "Lk1,2"])
+        index = indexes["verses"]
+        tf_idf = index.tf_idf.toarray()
+        np.testing.assert_almost_equal(scores, tf_idf[rows] @ tf_idf[0], decimal=5)
+        self.assertTrue(np.all(np.diff(scores) <= 0))
+        rows, _ = indexes.search("verses", "Mt", "1", "1", k=3, books=["Lk"])
+        self.assertEqual([names[row] for row in rows], ["Lk1,2"])
+        rows, _ = indexes.search("chapters", "Mt", "1", k=5)
+        self.assertEqual(sorted(indexes["chapters"].matrix.names[row] for row in rows),
+                         ["1Lk", "1Mk", "2Mt"])
+
+    def test_pairwise_similarity(self):
+        """
+        Test that the blocked pairwise similarity matches the dense one,
+        and that it is sliced by book.
+        """
+        corpus = TokenizedCorpus.from_verses([
+            ("Mt", "1", "1", "titi toto tata"),
+            ("Mt", "2", "1", "tutu tete"),
+            ("Mk", "1", "1", "toto tata titi tutu"),
+            ("Lk", "1", "1", "tete tutu"),
+            ("Lk", "2", "1", "titi")])
+        indexes = SimilarityIndexes.from_corpus_matrices(
+            CorpusMatrices.from_tokenized_corpus(corpus, stop_words=[]))
+        with tempfile.TemporaryDirectory() as folder:
+            similarity = PairwiseSimilarity.compute(indexes["chapters"], folder, "chapters", block_size=2)
+            tf_idf = indexes["chapters"].tf_idf.toarray()
+            np.testing.assert_almost_equal(similarity.similarity, tf_idf @ tf_idf.T, decimal=5)
+            self.assertTrue(PairwiseSimilarity.load(folder, "chapters").matches(indexes["chapters"]))
+            matrix, names, books = similarity.select(["Lk", "Mt"])
+            self.assertEqual(names, ["1Mt", "2Mt", "1Lk", "2Lk"])
+            self.assertEqual(matrix.shape, (4, 4))
+            np.testing.assert_almost_equal(matrix[1, 2], similarity.similarity[1, 3])
+            del similarity, matrix
 
 
 if __name__ == "__main__":